@@ -0,0 +1,136 @@
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import main  # noqa: E402
+from benchmarks.commands import load_data, use_data  # noqa: E402
+from utils.rate_limiter import SendLimiter  # noqa: E402
+from utils.send_queue import SendQueue  # noqa: E402
+from utils.subscriptions import SubscriptionStore  # noqa: E402
+
+# The daily closure alert fan-out in main.py against N subscribed chats, each subscribed to a few random hawker
+# centres. Yesterday's closures are made to cover every hawker centre, so that every chat gets an alert. Sends go
+# through the real SendQueue to a fake API with no rate limit, so this is the bot's own cost; Telegram itself lets a
+# bot send about 30 messages a second. Reports how long until every alert is sent and the peak memory, then checks
+# that a fan-out interrupted part way carries on where it stopped.
+SUBSCRIPTIONS_PER_CHAT = 3
+
+
+class Interrupted(Exception):
+    pass
+
+
+class FakeBot:
+    def __init__(self, workers, interrupt_after=None, count_only=False):
+        # Alerts sent per chat, or only in total so as not to add to the memory measured
+        self.sent = {}
+        self.total_sent = 0
+        self.count_only = count_only
+        self.queued = 0
+        self.interrupt_after = interrupt_after
+        self.send_queue = SendQueue(self.fake_send, SendLimiter(global_rate=1e9), workers)
+
+    def fake_send(self, endpoint, data, timeout, api_kwargs):
+        self.total_sent += 1
+        if not self.count_only:
+            self.sent[data['chat_id']] = self.sent.get(data['chat_id'], 0) + 1
+
+    def send_message(self, **data):
+        if self.queued == self.interrupt_after:
+            raise Interrupted()
+        self.queued += 1
+        self.send_queue.enqueue('sendMessage', data)
+
+
+def subscribe_chats(store, hawker_names, num_chats, rng):
+    with store.connection:
+        store.connection.executemany(
+            "INSERT OR IGNORE INTO subscriptions (hawker_name, chat_id) VALUES (?, ?)",
+            ((name, chat_id) for chat_id in range(1, num_chats + 1)
+             for name in rng.sample(hawker_names, SUBSCRIPTIONS_PER_CHAT))
+        )
+
+
+def reset_alert_state(store, hawker_names):
+    yesterday = (date.today() - timedelta(days=1)).isoformat()
+    store.save_alert_state(dict(date=yesterday, closures={name: 'closed' for name in hawker_names}, alerts={},
+                                after_chat_id=None, done=True))
+
+
+def run_fan_out(bot):
+    main.send_closure_alerts(SimpleNamespace(bot=bot))
+    bot.send_queue.join()
+
+
+def measure(store, hawker_names, num_chats, workers):
+    reset_alert_state(store, hawker_names)
+    bot = FakeBot(workers)
+    started = time.perf_counter()
+    run_fan_out(bot)
+    elapsed = time.perf_counter() - started
+    assert len(bot.sent) == num_chats and set(bot.sent.values()) == {1}, 'every chat gets exactly one alert'
+    bot.send_queue.close()
+
+    reset_alert_state(store, hawker_names)
+    bot = FakeBot(workers, count_only=True)
+    tracemalloc.start()
+    run_fan_out(bot)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert bot.total_sent == num_chats
+    bot.send_queue.close()
+    return elapsed, peak / 1e6
+
+
+def check_resume(store, hawker_names, num_chats, workers):
+    reset_alert_state(store, hawker_names)
+    bot = FakeBot(workers, interrupt_after=num_chats // 2)
+    try:
+        run_fan_out(bot)
+    except Interrupted:
+        pass
+    bot.send_queue.join()
+    first_run = dict(bot.sent)
+    bot.send_queue.close()
+
+    bot = FakeBot(workers)
+    run_fan_out(bot)
+    bot.send_queue.close()
+    repeated = set(first_run) & set(bot.sent)
+    assert set(first_run) | set(bot.sent) == set(range(1, num_chats + 1)), 'every chat gets an alert after a resume'
+    assert len(repeated) <= main.ALERT_CHECKPOINT_INTERVAL, 'only chats after the last checkpoint are sent to again'
+    print(f"  resume: {len(first_run)} chats before the interruption, {len(bot.sent)} after, "
+          f"{len(repeated)} sent twice")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chats', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--workers', type=int, default=main.SEND_WORKERS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    use_data(load_data(1))
+    hawker_names = list(main.closure_state.data.hawker_data_df.index)
+    rng = random.Random(0)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for num_chats in args.chats:
+            store = SubscriptionStore(os.path.join(tmp_dir, f"subscriptions_{num_chats}.sqlite3"))
+            main.subscription_store = store
+            subscribe_chats(store, hawker_names, num_chats, rng)
+            elapsed, peak_mb = measure(store, hawker_names, num_chats, args.workers)
+            print(f"{num_chats} chats ({len(store)} subscriptions): sent in {elapsed:.2f} s "
+                  f"({num_chats / elapsed:.0f} chats/s), peak {peak_mb:.1f} MB, "
+                  f"{num_chats / 30 / 60:.1f} min at Telegram's 30 messages/s")
+            check_resume(store, hawker_names, num_chats, args.workers)
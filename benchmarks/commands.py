@@ -0,0 +1,224 @@
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import date
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import main  # noqa: E402
+from utils.hawker_data import build_hawker_data, load_mrt_index, prepare_hawker_data_df  # noqa: E402
+
+# Latency and peak memory of every command, driven through the handlers in main.py with fake updates, against the
+# bundled data and copies of it scaled up N times. With --baseline, exits with status 1 when a command has become
+# slower or uses more memory than in the baseline by more than --tolerance.
+SEARCH_QUERIES = ['bedok', 'maxwell', 'tiong bahru', 'amoy', 'chinatown', 'old airport', 'tampines', 'yishun',
+                  'chicken rice', 'west coast drive', 'ang mo kio', 'geylang serai']
+# Copies of a hawker centre are moved by up to this many degrees, about 1 km, so that nearest searches see them
+SCALE_JITTER_DEGREES = 0.01
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = 0
+
+    def send_message(self, **kwargs):
+        self.sent += 1
+
+
+class FakeCallbackQuery:
+    def __init__(self, data, bot):
+        self.data = data
+        self.bot = bot
+
+    def answer(self, *args, **kwargs):
+        pass
+
+    def edit_message_text(self, **kwargs):
+        self.bot.sent += 1
+
+
+def make_update(bot, text=None, location=None, callback_data=None):
+    user = SimpleNamespace(id=1, username='benchmark', first_name='Benchmark')
+    chat = SimpleNamespace(id=1)
+    if callback_data is not None:
+        return SimpleNamespace(effective_user=user, effective_chat=chat, message=None,
+                               callback_query=FakeCallbackQuery(callback_data, bot))
+    message = SimpleNamespace(from_user=user, chat_id=chat.id, text=text, location=location,
+                              reply_text=lambda text, **kwargs: bot.send_message(text=text, **kwargs))
+    return SimpleNamespace(effective_user=user, effective_chat=chat, message=message, callback_query=None)
+
+
+def make_context(bot, args=()):
+    return SimpleNamespace(bot=bot, args=list(args), user_data={})
+
+
+def load_data(scale):
+    with open(os.path.join(REPO_DIR, 'data', 'hawker_data.json'), 'rb') as f:
+        hawker_data_df = prepare_hawker_data_df(json.loads(f.read()))
+    with open(os.path.join(REPO_DIR, 'data', 'mrt_hawker_topk.npz'), 'rb') as f:
+        mrt_index = load_mrt_index(f.read())
+    if scale > 1:
+        rng = np.random.default_rng(scale)
+        copies = []
+        for i in range(1, scale):
+            copy = hawker_data_df.rename(index=lambda n: f"{n} {i}")
+            copy["latitude"] = copy["latitude"] + rng.uniform(-SCALE_JITTER_DEGREES, SCALE_JITTER_DEGREES, len(copy))
+            copy["longitude"] = copy["longitude"] + rng.uniform(-SCALE_JITTER_DEGREES, SCALE_JITTER_DEGREES, len(copy))
+            copies.append(copy)
+        hawker_data_df = pd.concat([hawker_data_df] + copies)
+    return build_hawker_data(hawker_data_df, mrt_index, {'scale': str(scale)})
+
+
+def use_data(data):
+    # What main.py sets up when it is run, minus the bot
+    main.hawker_data = data
+    main.closure_state = main.compute_closure_state(data, date.today())
+    main.data_ready.set()
+
+
+def command_runners(data, bot, rng):
+    station_nums = list(data.mrt_station_positions)
+    letters = sorted(main.closure_state.mrt_render.station_keyboards)
+
+    def text_command(handler, text):
+        return lambda: handler(make_update(bot, text=text), make_context(bot, text.split()[1:]))
+
+    def search():
+        query = rng.choice(SEARCH_QUERIES)
+        main.search_hawker_by_name(make_update(bot, text=f"/search {query}"), make_context(bot, query.split()))
+
+    def mrt_letter():
+        main.selected_mrt_station_letter(make_update(bot, callback_data=rng.choice(letters)), make_context(bot))
+
+    def mrt_station():
+        main.selected_mrt_station(make_update(bot, callback_data=rng.choice(station_nums)), make_context(bot))
+
+    def nearby():
+        context = make_context(bot, rng.choice([['1'], ['2', 'open'], ['5', 'existing']]))
+        context.user_data['location'] = (rng.uniform(1.25, 1.45), rng.uniform(103.65, 103.98))
+        main.search_hawker_by_radius(make_update(bot, text='/nearby'), context)
+
+    def route():
+        start, end = rng.sample(data.station_graph.names, 2)
+        text = f"/route {start} to {end}"
+        main.search_hawker_by_route(make_update(bot, text=text), make_context(bot, text.split()[1:]))
+
+    def location():
+        position = SimpleNamespace(latitude=rng.uniform(1.25, 1.45), longitude=rng.uniform(103.65, 103.98))
+        main.search_hawker_by_location(make_update(bot, location=position), make_context(bot))
+
+    return {
+        'search': search,
+        'closed': text_command(main.list_hawker_cleaning, '/closed'),
+        'closed_this_week': text_command(main.list_hawker_cleaning_this_week, '/closed_this_week'),
+        'closed_next_week': text_command(main.list_hawker_cleaning_next_week, '/closed_next_week'),
+        'mrt': text_command(main.search_hawker_by_mrt, '/mrt'),
+        'mrt_letter': mrt_letter,
+        'mrt_station': mrt_station,
+        'location': location,
+        'nearby': nearby,
+        'route': route,
+    }
+
+
+def measure_latency(run, iterations):
+    latencies = np.empty(iterations)
+    for i in range(iterations):
+        started = time.perf_counter()
+        run()
+        latencies[i] = time.perf_counter() - started
+    return latencies * 1000
+
+
+def measure_peak_memory(run, iterations):
+    # Traced separately, as tracing slows everything down
+    tracemalloc.start()
+    for _ in range(iterations):
+        run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1e6
+
+
+def run_benchmarks(scales, commands, iterations):
+    results = {}
+    for scale in scales:
+        tracemalloc.start()
+        started = time.perf_counter()
+        data = load_data(scale)
+        use_data(data)
+        build_s = time.perf_counter() - started
+        _, build_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{scale}x data: {len(data.hawker_data_df)} hawkers, built in {build_s:.2f} s, "
+              f"peak {build_peak / 1e6:.1f} MB")
+
+        bot = FakeBot()
+        runners = command_runners(data, bot, random.Random(scale))
+        for name in commands:
+            run = runners[name]
+            for _ in range(min(iterations, 10)):
+                run()
+            latencies = measure_latency(run, iterations)
+            peak_mb = measure_peak_memory(run, min(iterations, 50))
+            result = {
+                'p50_ms': float(np.percentile(latencies, 50)),
+                'p90_ms': float(np.percentile(latencies, 90)),
+                'p99_ms': float(np.percentile(latencies, 99)),
+                'max_ms': float(latencies.max()),
+                'peak_mb': peak_mb,
+            }
+            results[f"{scale}x/{name}"] = result
+            print(f"  {name:18s} p50 {result['p50_ms']:8.3f} ms  p90 {result['p90_ms']:8.3f} ms  "
+                  f"p99 {result['p99_ms']:8.3f} ms  max {result['max_ms']:8.3f} ms  peak {peak_mb:7.2f} MB")
+    return results
+
+
+def find_regressions(results, baseline, tolerance):
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        for metric in ('p50_ms', 'p99_ms', 'peak_mb'):
+            limit = baseline[key][metric] * (1 + tolerance)
+            if result[metric] > limit:
+                regressions.append(f"{key} {metric}: {result[metric]:.3f} > {limit:.3f} "
+                                   f"(baseline {baseline[key][metric]:.3f})")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--commands', nargs='+', default=['search', 'closed', 'closed_this_week', 'closed_next_week',
+                                                          'mrt', 'mrt_letter', 'mrt_station', 'location', 'nearby',
+                                                          'route'])
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--save-baseline', help="write the results to this JSON file")
+    parser.add_argument('--baseline', help="JSON file written by --save-baseline to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed slowdown or growth, 0.25 is 25%%")
+    args = parser.parse_args()
+
+    # Handlers log every command and warn about slow searches
+    logging.basicConfig(level=logging.ERROR)
+    random.seed(0)
+    results = run_benchmarks(args.scale, args.commands, args.iterations)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
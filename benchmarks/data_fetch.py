@@ -0,0 +1,148 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from utils.data_utils import (HAWKER_RESOURCE_ID, RECORDS_PER_PAGE, fetch_records_to_file,  # noqa: E402
+                              get_relevant_fields_as_dict, make_session)
+
+# Fetches the hawker records from a local mock of the data.gov.sg datastore API, which answers each request after
+# --latency seconds, with one page at a time and with more pages concurrently. Then checks retrying requests that
+# fail with 503 and resuming from the checkpoint after the API goes down part way through.
+
+
+def make_record(i):
+    return {
+        '_id': i + 1, 'name': f"Hawker Centre {i}", 'address_myenv': f"{i} Test Street",
+        'description_myenv': "Test hawker centre", 'photourl': '', 'status': 'Existing',
+        'latitude_hc': str(1.3 + i / 1e6), 'longitude_hc': str(103.8 + i / 1e6),
+        'q1_cleaningstartdate': '1/1/2024', 'q1_cleaningenddate': '4/1/2024',
+        'q2_cleaningstartdate': '1/4/2024', 'q2_cleaningenddate': '4/4/2024',
+        'q3_cleaningstartdate': 'TBC', 'q3_cleaningenddate': 'TBC',
+        'q4_cleaningstartdate': '1/10/2024', 'q4_cleaningenddate': '4/10/2024',
+    }
+
+
+class MockDatastore:
+    def __init__(self, num_records, latency):
+        self.records = [make_record(i) for i in range(num_records)]
+        self.latency = latency
+        # Offsets to answer with 503 the given number of times, and offsets at and above which every request fails
+        self.failures = {}
+        self.down_from = None
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self.make_handler())
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/api/action/datastore_search"
+
+    def make_handler(self):
+        datastore = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # The headers and the body are written separately, which Nagle's algorithm would delay
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                params = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+                status, result = datastore.search(params)
+                content = json.dumps({'success': status == 200, 'result': result}).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def search(self, params):
+        time.sleep(self.latency)
+        offset, limit = int(params.get('offset', 0)), int(params.get('limit', 100))
+        with self.lock:
+            self.requests += 1
+            if self.down_from is not None and offset >= self.down_from:
+                return 503, None
+            if self.failures.get(offset):
+                self.failures[offset] -= 1
+                return 503, None
+        if params.get('resource_id') != HAWKER_RESOURCE_ID:
+            return 404, None
+        next_link = f"/api/action/datastore_search?resource_id={HAWKER_RESOURCE_ID}&offset={offset + limit}"
+        return 200, {'records': self.records[offset:offset + limit], 'total': len(self.records),
+                     '_links': {'start': '/api/action/datastore_search', 'next': next_link}}
+
+
+def expected_output(datastore):
+    return json.loads(json.dumps([get_relevant_fields_as_dict(r) for r in datastore.records]))
+
+
+def fetch(datastore, path, max_concurrent_pages, **session_options):
+    session = make_session(max_concurrent_pages, **session_options)
+    started = time.perf_counter()
+    count = fetch_records_to_file(path, get_relevant_fields_as_dict, datastore.url,
+                                  max_concurrent_pages=max_concurrent_pages, session=session)
+    return count, time.perf_counter() - started
+
+
+def check_output(datastore, path):
+    with open(path) as f:
+        if json.load(f) != expected_output(datastore):
+            raise AssertionError("Output does not match the records")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--records', type=int, default=2000)
+    parser.add_argument('--latency', type=float, default=0.05, help="seconds the API takes to answer a request")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    datastore = MockDatastore(args.records, args.latency)
+    pages = -(-args.records // RECORDS_PER_PAGE)
+    with tempfile.TemporaryDirectory() as work_dir:
+        path = os.path.join(work_dir, 'hawker_data.json')
+        print(f"{args.records} records in {pages} pages, {args.latency * 1000:.0f} ms per request")
+        for max_concurrent_pages in args.concurrency:
+            count, duration_s = fetch(datastore, path, max_concurrent_pages)
+            check_output(datastore, path)
+            print(f"  {max_concurrent_pages} concurrent pages: {count} records in {duration_s:.2f} s")
+
+        datastore.failures = {offset: 2 for offset in range(0, args.records, RECORDS_PER_PAGE * 3)}
+        datastore.requests = 0
+        count, duration_s = fetch(datastore, path, 4, backoff_factor=0.01)
+        check_output(datastore, path)
+        print(f"retries: {count} records in {duration_s:.2f} s with {datastore.requests} requests "
+              f"for {pages} pages")
+
+        datastore.down_from = (pages // 2) * RECORDS_PER_PAGE
+        try:
+            fetch(datastore, path, 4, retries=1, backoff_factor=0.01)
+            raise AssertionError("Fetching did not fail")
+        except OSError:
+            pass
+        with open(path + '.checkpoint') as f:
+            resume_offset = json.load(f)['offset']
+        datastore.down_from = None
+        datastore.requests = 0
+        count, duration_s = fetch(datastore, path, 4)
+        check_output(datastore, path)
+        print(f"resume: stopped after record {resume_offset}, then fetched the remaining {count - resume_offset} "
+              f"records with {datastore.requests} requests")
+        if os.path.exists(path + '.checkpoint') or os.path.exists(path + '.partial'):
+            raise AssertionError("Checkpoint left behind")
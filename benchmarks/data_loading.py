@@ -0,0 +1,53 @@
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from utils.hawker_data import build_hawker_data, load_mrt_index, prepare_hawker_data_df  # noqa: E402
+
+# Time and memory taken to turn the hawker records into the DataFrame and the HawkerData built from it, for the
+# bundled records and for copies of them scaled up N times
+
+
+def load_records(scale):
+    with open(os.path.join(REPO_DIR, 'data', 'hawker_data.json'), 'rb') as f:
+        records = json.loads(f.read())
+    return [dict(record, hawker_name=f"{record['hawker_name']} {i}" if i else record['hawker_name'])
+            for i in range(scale) for record in records]
+
+
+def measure(run, iterations):
+    timings = np.empty(iterations)
+    for i in range(iterations):
+        started = time.perf_counter()
+        result = run()
+        timings[i] = time.perf_counter() - started
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, timings * 1000, peak / 1e6
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--iterations', type=int, default=10)
+    args = parser.parse_args()
+
+    with open(os.path.join(REPO_DIR, 'data', 'mrt_hawker_topk.npz'), 'rb') as f:
+        mrt_index = load_mrt_index(f.read())
+
+    for scale in args.scale:
+        records = load_records(scale)
+        df, prepare_ms, prepare_peak = measure(lambda: prepare_hawker_data_df(records), args.iterations)
+        _, build_ms, build_peak = measure(lambda: build_hawker_data(df, mrt_index, {}), args.iterations)
+        print(f"{scale}x: {len(df)} hawkers, DataFrame {df.memory_usage(deep=True).sum() / 1e6:.2f} MB")
+        print(f"  prepare_hawker_data_df  median {np.median(prepare_ms):8.1f} ms  peak {prepare_peak:7.1f} MB")
+        print(f"  build_hawker_data       median {np.median(build_ms):8.1f} ms  peak {build_peak:7.1f} MB")
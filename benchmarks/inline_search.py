@@ -0,0 +1,130 @@
+import argparse
+import itertools
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+import numpy as np
+
+from commands import SEARCH_QUERIES, load_data, use_data
+import main
+from utils.lru_cache import LRUCache
+from utils.metrics import inline_queries_superseded, inline_query_seconds
+
+# Inline search as users type: first the cost of searching each keystroke from scratch and continuing from the
+# previous keystroke's search, then users typing queries concurrently through the inline handler, with and without
+# the result cache and debouncing. Latency is from the keystroke's update arriving to its answer being sent.
+
+
+class FakeInlineQuery:
+    def __init__(self, query_id, query, user, answered):
+        self.id = query_id
+        self.query = query
+        self.from_user = user
+        self.received = time.perf_counter()
+        self.answered = answered
+
+    def answer(self, results, **kwargs):
+        self.answered.append(time.perf_counter() - self.received)
+
+
+class FakeJobQueue:
+    def run_custom(self, callback, job_kwargs, context=None):
+        job_context = SimpleNamespace(job=SimpleNamespace(context=context))
+        when = (job_kwargs['trigger'].run_date - datetime.now(timezone.utc)).total_seconds()
+        threading.Timer(max(when, 0), callback, args=(job_context,)).start()
+
+
+def keystroke_costs(data, iterations):
+    engine = data.search_engine
+    full, incremental = [], []
+    for _ in range(iterations):
+        for query in SEARCH_QUERIES:
+            previous = None
+            for i in range(1, len(query) + 1):
+                started = time.perf_counter()
+                engine.search(query[:i])
+                full.append(time.perf_counter() - started)
+                started = time.perf_counter()
+                _, state = engine.search_incremental(query[:i], previous=previous)
+                incremental.append(time.perf_counter() - started)
+                previous = state or previous
+    return np.array(full) * 1000, np.array(incremental) * 1000
+
+
+def type_queries(user_id, queries, rng, query_ids, answered):
+    user = SimpleNamespace(id=user_id, username=f"user{user_id}", first_name="Test")
+    context = SimpleNamespace(bot=None, args=[], job_queue=FakeJobQueue())
+    for query in queries:
+        for i in range(1, len(query) + 1):
+            inline_query = FakeInlineQuery(str(next(query_ids)), query[:i], user, answered)
+            update = SimpleNamespace(effective_user=user, effective_chat=None, message=None, callback_query=None,
+                                     inline_query=inline_query)
+            main.inline_search(update, context)
+            time.sleep(rng.uniform(0.05, 0.25))
+        time.sleep(0.5)
+
+
+def simulate_typing(num_users, queries_per_user, seed):
+    searches = itertools.count()
+    search_hawkers_incremental = main.search_hawkers_incremental
+
+    def counted_search(*args):
+        next(searches)
+        return search_hawkers_incremental(*args)
+
+    main.search_hawkers_incremental = counted_search
+    rng = random.Random(seed)
+    query_ids = itertools.count()
+    answered = []
+    users = [threading.Thread(target=type_queries, args=(user_id, rng.sample(SEARCH_QUERIES, queries_per_user),
+                                                         random.Random(user_id), query_ids, answered))
+             for user_id in range(num_users)]
+    for user in users:
+        user.start()
+    for user in users:
+        user.join()
+    # The last debounced searches
+    time.sleep(main.INLINE_DEBOUNCE_SECONDS + 0.5)
+    main.search_hawkers_incremental = search_hawkers_incremental
+    return next(query_ids), next(searches), np.array(answered) * 1000
+
+
+def reset_inline_state(cache_size, debounce_seconds):
+    main.INLINE_DEBOUNCE_SECONDS = debounce_seconds
+    main.inline_results_cache = LRUCache(cache_size, main.INLINE_CACHE_TTL)
+    main.latest_inline_queries = LRUCache(main.INLINE_USERS)
+    main.inline_search_states = LRUCache(main.INLINE_SEARCH_STATES, main.INLINE_SEARCH_STATE_TTL)
+    inline_query_seconds.series.clear()
+    inline_queries_superseded.values.clear()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--iterations', type=int, default=5)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--queries-per-user', type=int, default=3)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    for scale in args.scale:
+        data = load_data(scale)
+        full, incremental = keystroke_costs(data, args.iterations)
+        print(f"{scale}x data, search per keystroke: from scratch p50 {np.percentile(full, 50):.3f} ms "
+              f"p99 {np.percentile(full, 99):.3f} ms, incremental p50 {np.percentile(incremental, 50):.3f} ms "
+              f"p99 {np.percentile(incremental, 99):.3f} ms")
+
+    use_data(load_data(1))
+    for label, cache_size, debounce_seconds in (('no cache or debouncing', 0, 0.0),
+                                                ('cache and debouncing', main.INLINE_CACHE_SIZE,
+                                                 main.INLINE_DEBOUNCE_SECONDS)):
+        reset_inline_state(cache_size, debounce_seconds)
+        keystrokes, searches, latencies = simulate_typing(args.users, args.queries_per_user, seed=0)
+        hits = (inline_query_seconds.snapshot('hit') or (None, 0, 0))[2]
+        print(f"{label}: {keystrokes} keystrokes, {searches} searches, {len(latencies)} answered "
+              f"({hits} from the cache), {int(inline_queries_superseded.value())} superseded")
+        print(f"  latency p50 {np.percentile(latencies, 50):.1f} ms  p99 {np.percentile(latencies, 99):.1f} ms  "
+              f"max {latencies.max():.1f} ms")
@@ -0,0 +1,229 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import itertools
+import json
+import os
+import queue
+import random
+import subprocess
+import sys
+import socket
+import tempfile
+import threading
+import time
+import numpy as np
+import requests
+
+# Runs main.py against a local fake Bot API server, with updates delivered by long polling or by webhook. Each simulated user sends a command, waits for the
+# reply, thinks for a while and sends the next one; latency is the time from the update being queued
+# for getUpdates to its reply arriving.
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOKEN = '123456:fake-token-for-load-testing'
+SECRET_TOKEN = 'load-test-secret'
+SEARCH_QUERIES = ['bedok', 'maxwell', 'tiong bahru', 'amoy', 'chinatown', 'old airport', 'tampines', 'yishun']
+LOCATIONS = [(1.3521, 103.8198), (1.2801, 103.8450), (1.3329, 103.7436), (1.3526, 103.9447)]
+
+
+class FakeBotApi:
+    def __init__(self, send_delay):
+        self.send_delay = send_delay
+        self.webhook_url = None
+        self.session = requests.Session()
+        self.session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=1000))
+        self.updates = queue.Queue()
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(1)
+        self.replies = {}
+        self.sent_at = []
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self.make_handler())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/bot"
+
+    def make_handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(length) if length else b''
+                data = json.loads(body) if body else {}
+                result = api.call(self.path.rsplit('/', 1)[-1], data)
+                content = json.dumps({'ok': True, 'result': result}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def call(self, method, data):
+        if method == 'getMe':
+            return {'id': 123456, 'is_bot': True, 'first_name': 'SG Hawker bot', 'username': 'sghawkerbot'}
+        if method == 'getUpdates':
+            self.ready.set()
+            return self.next_updates(float(data.get('timeout') or 0))
+        if method == 'setWebhook':
+            self.webhook_url = data['url']
+            self.ready.set()
+            return True
+        if method in ('deleteWebhook', 'answerCallbackQuery'):
+            return True
+
+        # sendMessage, editMessageText and friends
+        time.sleep(self.send_delay)
+        chat_id = int(data['chat_id'])
+        with self.lock:
+            self.sent_at.append(time.monotonic())
+            reply = self.replies.pop(chat_id, None)
+        if reply is not None:
+            reply.put(time.monotonic())
+        return {
+            'message_id': next(self.message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'text': data.get('text', ''),
+        }
+
+    def next_updates(self, timeout):
+        try:
+            updates = [self.updates.get(timeout=min(timeout, 1.0))]
+        except queue.Empty:
+            return []
+        while len(updates) < 100:
+            try:
+                updates.append(self.updates.get_nowait())
+            except queue.Empty:
+                break
+        return updates
+
+    def send_update(self, chat_id, message) -> queue.Queue:
+        reply = queue.Queue()
+        with self.lock:
+            self.replies[chat_id] = reply
+        update = {
+            'update_id': next(self.update_ids),
+            'message': {
+                'message_id': next(self.message_ids),
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'from': {'id': chat_id, 'is_bot': False, 'first_name': f'User{chat_id}'},
+                **message,
+            },
+        }
+
+        if self.webhook_url is None:
+            self.updates.put(update)
+            return reply
+
+        response = self.session.post(self.webhook_url, json=update, headers={
+            'X-Telegram-Bot-Api-Secret-Token': SECRET_TOKEN})
+        response.raise_for_status()
+        # The bot answered in the webhook response itself
+        if response.content and json.loads(response.content).get('method'):
+            with self.lock:
+                self.sent_at.append(time.monotonic())
+                self.replies.pop(chat_id, None)
+            reply.put(time.monotonic())
+        return reply
+
+
+def command(text):
+    name = text.split()[0]
+    return {'text': text, 'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(name)}]}
+
+
+def random_message(rng, commands):
+    kind = rng.choice(commands)
+    if kind == 'search':
+        return command(f"/search {rng.choice(SEARCH_QUERIES)}")
+    if kind == 'location':
+        lat, long = rng.choice(LOCATIONS)
+        return {'location': {'latitude': lat, 'longitude': long}}
+    return command(f"/{kind}")
+
+
+def simulate_user(api, chat_id, commands, requests_per_user, think_time, latencies, timeouts):
+    rng = random.Random(chat_id)
+    for i in range(requests_per_user):
+        if i > 0:
+            time.sleep(rng.uniform(0.5, 1.5) * think_time)
+        sent = time.monotonic()
+        reply = api.send_update(chat_id, random_message(rng, commands))
+        try:
+            latencies.append(reply.get(timeout=60) - sent)
+        except queue.Empty:
+            timeouts.append(chat_id)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def run(mode, commands, users, requests_per_user, think_time, send_delay, workers):
+    api = FakeBotApi(send_delay)
+    threading.Thread(target=api.server.serve_forever, daemon=True).start()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        # Logs, cache and persistence stay out of the repo
+        os.symlink(os.path.join(REPO_DIR, 'data'), os.path.join(work_dir, 'data'))
+        env = dict(os.environ, TELEGRAM_BOT_TOKEN=TOKEN, TELEGRAM_BOT_API_URL=api.url, UPDATE_WORKERS=str(workers))
+        if mode == 'webhook':
+            env.update(WEBHOOK_URL=f"http://127.0.0.1:{free_port()}/webhook", WEBHOOK_SECRET_TOKEN=SECRET_TOKEN)
+            env['WEBHOOK_PORT'] = env['WEBHOOK_URL'].split(':')[-1].split('/')[0]
+        bot = subprocess.Popen([sys.executable, os.path.join(REPO_DIR, 'main.py')], cwd=work_dir, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            if not api.ready.wait(timeout=60):
+                raise RuntimeError("Bot did not start")
+
+            latencies, timeouts = [], []
+            started = time.monotonic()
+            threads = [threading.Thread(target=simulate_user, args=(api, 1000 + u, commands, requests_per_user, think_time,
+                                                                   latencies, timeouts))
+                       for u in range(users)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            elapsed = time.monotonic() - started
+        finally:
+            bot.terminate()
+            bot.wait(timeout=30)
+            api.server.shutdown()
+
+    latencies = np.array(latencies) * 1000
+    sent_at = np.array(api.sent_at)
+    busiest_second = np.max(np.searchsorted(sent_at, sent_at + 1.0) - np.arange(len(sent_at))) if len(sent_at) else 0
+    print(f"{mode:8s} workers={workers:3d} users={users:4d} replies={len(latencies):5d} timeouts={len(timeouts):3d} "
+          f"p50={np.percentile(latencies, 50):8.1f} ms p99={np.percentile(latencies, 99):8.1f} ms "
+          f"throughput={len(latencies) / elapsed:6.1f}/s busiest second={busiest_second} sends")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--commands', nargs='+', choices=['search', 'closed', 'location', 'start', 'info'],
+                        default=['search', 'search', 'closed', 'location', 'start'], help="picked from at random")
+    parser.add_argument('--users', type=int, nargs='+', default=[1, 10, 50, 100])
+    parser.add_argument('--requests-per-user', type=int, default=5)
+    parser.add_argument('--think-time', type=float, default=1.0, help="mean pause between a user's requests, in seconds")
+    parser.add_argument('--send-delay', type=float, default=0.05, help="simulated Bot API round trip, in seconds")
+    parser.add_argument('--workers', type=int, nargs='+', default=[16])
+    parser.add_argument('--mode', nargs='+', choices=['polling', 'webhook'], default=['polling', 'webhook'])
+    args = parser.parse_args()
+
+    for mode in args.mode:
+        for workers in args.workers:
+            for users in args.users:
+                run(mode, args.commands, users, args.requests_per_user, args.think_time, args.send_delay, workers)
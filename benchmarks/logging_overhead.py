@@ -0,0 +1,113 @@
+import argparse
+import atexit
+import logging
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from utils.logging_utils import logged_command, record_result_count, set_sample_rate, setup_logging  # noqa: E402
+
+# Time spent on the handler thread to log one update, with the console going to /dev/null. CPU time is what the
+# handler thread itself spends; wall time also includes being preempted by the listener thread, which on a single
+# core runs in between.
+
+
+class SlowConsole:
+    # Stands in for a terminal that cannot keep up, such as a busy tmux pane
+    def __init__(self, stream, delay):
+        self.stream = stream
+        self.delay = delay
+
+    def write(self, text):
+        time.sleep(self.delay)
+        return self.stream.write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+
+def make_update(i):
+    user = SimpleNamespace(id=1000 + i % 500, username=f"user{i % 500}", first_name="Test")
+    message = SimpleNamespace(from_user=user, location=None, text=f"/search query {i % 50}")
+    return SimpleNamespace(effective_user=user, callback_query=None, message=message)
+
+
+def synchronous_log_command_pressed(update):
+    # How commands were logged before: straight to a file handler and a stdout handler, on the handler thread
+    user = update.message.from_user
+    command = update.message.text[:255]
+    logging.info(f"{user.username}/{user.first_name} ({user.id}) sent {command}.")
+
+
+def setup_synchronous_logging(log_file):
+    root_logger = logging.getLogger()
+    for handler in root_logger.handlers[:]:
+        root_logger.removeHandler(handler)
+    file_handler = logging.FileHandler(log_file, mode='a')
+    file_handler.setFormatter(logging.Formatter(fmt="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+                                                datefmt="%H:%M:%S"))
+    root_logger.addHandler(file_handler)
+    root_logger.addHandler(logging.StreamHandler(sys.stdout))
+    root_logger.setLevel(logging.INFO)
+
+
+def measure(log_one, updates, pause):
+    wall = np.empty(len(updates))
+    cpu = np.empty(len(updates))
+    for i, update in enumerate(updates):
+        if pause:
+            time.sleep(pause)
+        started, cpu_started = time.perf_counter(), time.thread_time()
+        log_one(update)
+        wall[i] = time.perf_counter() - started
+        cpu[i] = time.thread_time() - cpu_started
+    return wall * 1e6, cpu * 1e6
+
+
+def report(label, timings):
+    wall, cpu = timings
+    print(f"{label:28s} cpu mean {cpu.mean():6.2f} us | wall mean {wall.mean():6.2f} us  "
+          f"p50 {np.percentile(wall, 50):6.2f} us  p99 {np.percentile(wall, 99):7.2f} us")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--updates', type=int, default=20_000)
+    parser.add_argument('--console-delay', type=float, default=0.0, help="seconds each console write takes")
+    parser.add_argument('--pause', type=float, default=0.0, help="seconds between updates, 0 for a tight loop")
+    args = parser.parse_args()
+
+    updates = [make_update(i) for i in range(args.updates)]
+
+    @logged_command
+    def handle(update):
+        record_result_count(10)
+
+    real_stdout = sys.stdout
+    with tempfile.TemporaryDirectory() as log_dir, open(os.devnull, 'w') as devnull:
+        sys.stdout = SlowConsole(devnull, args.console_delay) if args.console_delay else devnull
+        try:
+            setup_synchronous_logging(os.path.join(log_dir, 'sync.log'))
+            synchronous = measure(synchronous_log_command_pressed, updates, args.pause)
+
+            listener = setup_logging(os.path.join(log_dir, 'bot.log'), 50 * 1024 * 1024, 5)
+            queued = measure(handle, updates, args.pause)
+            set_sample_rate('command', 0.1)
+            sampled = measure(handle, updates, args.pause)
+            drain_started = time.perf_counter()
+            listener.stop()
+            atexit.unregister(listener.stop)
+            drain_ms = (time.perf_counter() - drain_started) * 1000
+        finally:
+            sys.stdout = real_stdout
+
+    report("synchronous text (before)", synchronous)
+    report("queued JSON", queued)
+    report("queued JSON, 10% sampled", sampled)
+    print(f"listener drained the remaining records in {drain_ms:.0f} ms")
@@ -0,0 +1,79 @@
+import argparse
+import os
+import random
+import sys
+import time
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import main  # noqa: E402
+from benchmarks.commands import load_data  # noqa: E402
+from utils.geo_utils import ellipsoidal_distance_km  # noqa: E402
+from utils.hawker_data import hawkers_within  # noqa: E402
+
+# /nearby queries at random points over the island: the grid index with the closure state's filter masks against a
+# scan of every hawker centre's distance with the closures looked up per row, as append_closed_hawker_info does.
+# The closure state is for the day with the most cleanings, so that "open" leaves some out. Checks that both give
+# the same hawker centres in the same order.
+RADII_KM = [0.5, 1, 2, 5, 10]
+FILTERS = [None, 'open', 'existing']
+
+
+def scan(state, lat, long, radius_km, hawker_filter):
+    hawker_data_df = state.data.hawker_data_df
+    dists = ellipsoidal_distance_km(hawker_data_df['latitude'].to_numpy(), hawker_data_df['longitude'].to_numpy(),
+                                    lat, long)
+    within = np.flatnonzero(dists <= radius_km)
+    within = within[np.argsort(dists[within], kind='stable')]
+    if hawker_filter is not None:
+        keep = []
+        for hawker_idx in within:
+            hawker_name = hawker_data_df.index[hawker_idx]
+            if hawker_name in state.closed_hawkers:
+                continue
+            if hawker_filter == 'open' and hawker_name in state.washing_hawkers_df.index:
+                continue
+            keep.append(hawker_idx)
+        within = np.asarray(keep, dtype=int)
+    return within
+
+
+def busiest_cleaning_day(data):
+    days, counts = np.unique(data.cleaning_schedule.start_days, return_counts=True)
+    return days[np.argmax(counts)].astype('datetime64[D]').astype(object)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', type=int, nargs='+', default=[1, 100])
+    parser.add_argument('--queries', type=int, default=300)
+    args = parser.parse_args()
+
+    for scale in args.scale:
+        data = load_data(scale)
+        state = main.compute_closure_state(data, busiest_cleaning_day(data))
+        rng = random.Random(scale)
+        queries = [(rng.uniform(1.25, 1.45), rng.uniform(103.65, 103.98), rng.choice(RADII_KM), rng.choice(FILTERS))
+                   for _ in range(args.queries)]
+        print(f"{scale}x: {len(data.hawker_data_df)} hawkers in {data.grid_index.num_rows} x "
+              f"{data.grid_index.num_cols} cells, {len(state.washing_hawkers_df)} cleaning and "
+              f"{len(state.closed_hawkers)} closed on {state.date}")
+
+        for radius_km in RADII_KM:
+            grid_ms, scan_ms, found = [], [], []
+            for lat, long, _, hawker_filter in queries:
+                mask = state.filter_masks[hawker_filter] if hawker_filter is not None else None
+                started = time.perf_counter()
+                grid_idx, _ = hawkers_within(data, lat, long, radius_km, mask)
+                grid_ms.append(time.perf_counter() - started)
+                started = time.perf_counter()
+                scan_idx = scan(state, lat, long, radius_km, hawker_filter)
+                scan_ms.append(time.perf_counter() - started)
+                assert grid_idx.tolist() == scan_idx.tolist(), 'the grid finds the same hawker centres as the scan'
+                found.append(len(grid_idx))
+            grid_ms, scan_ms = np.array(grid_ms) * 1000, np.array(scan_ms) * 1000
+            print(f"  {radius_km:4g} km ({np.mean(found):7.1f} found)  grid p50 {np.percentile(grid_ms, 50):7.3f} ms  "
+                  f"p99 {np.percentile(grid_ms, 99):7.3f} ms  |  scan p50 {np.percentile(scan_ms, 50):8.3f} ms  "
+                  f"p99 {np.percentile(scan_ms, 99):8.3f} ms")
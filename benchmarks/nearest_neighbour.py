@@ -0,0 +1,98 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import numpy as np
+from geopy import distance
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from utils.geo_utils import GRID_MIN_POINTS, NearestNeighbourIndex  # noqa: E402
+
+# Per-query latency of /nearest's k nearest hawker centres: a geopy geodesic to every centre and a full sort, as
+# search_hawker_by_location did before, against NearestNeighbourIndex. Queries are random points over Singapore.
+# Exits with status 1 when the index's distances are further than TOLERANCE_KM from geopy's, or when it ranks two
+# centres differently whose geopy distances are further apart than that. With --crossover, times the index's scan
+# against its GridIndex search over growing sets of random points instead, which is where GRID_MIN_POINTS comes from.
+TOLERANCE_KM = 1e-5
+CROSSOVER_POINTS = [120, 1000, 3000, 5000, 10000, 30000, 100000]
+
+
+def geopy_nearest(coords, lat, long, k):
+    dists = np.array([distance.distance(coord, (lat, long)).km for coord in coords])
+    order = np.argsort(dists, kind='stable')[:k]
+    return order, dists[order]
+
+
+def median_us(index, queries, k):
+    timings = []
+    for lat, long in queries:
+        started = time.perf_counter()
+        index.nearest(lat, long, k)
+        timings.append(time.perf_counter() - started)
+    return np.median(timings) * 1e6
+
+
+def crossover(queries, k):
+    rng = np.random.default_rng(0)
+    print(f"top {k}, {len(queries)} queries, grid from {GRID_MIN_POINTS} points")
+    for n in CROSSOVER_POINTS:
+        lats, longs = rng.uniform(1.25, 1.45, n), rng.uniform(103.65, 103.98, n)
+        scan, grid = NearestNeighbourIndex(lats, longs, n + 1), NearestNeighbourIndex(lats, longs, 0)
+        for lat, long in queries[:20]:
+            assert np.allclose(scan.nearest(lat, long, k)[1], grid.nearest(lat, long, k)[1])
+        scan_us, grid_us = median_us(scan, queries, k), median_us(grid, queries, k)
+        print(f"  {n:7d} points  scan {scan_us:7.1f} us  grid {grid_us:7.1f} us")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--crossover', action='store_true')
+    args = parser.parse_args()
+
+    with open(os.path.join(REPO_DIR, 'data', 'hawker_data.json'), 'rb') as f:
+        records = json.loads(f.read())
+    lats = np.array([record['latitude'] for record in records], dtype=float)
+    longs = np.array([record['longitude'] for record in records], dtype=float)
+    coords = list(zip(lats, longs))
+    index = NearestNeighbourIndex(lats, longs)
+
+    rng = random.Random(0)
+    queries = [(rng.uniform(1.25, 1.45), rng.uniform(103.65, 103.98)) for _ in range(args.queries)]
+    if args.crossover:
+        crossover(queries, args.k)
+        sys.exit(0)
+    # Timed in separate passes, so that one does not evict the other's working set
+    geopy_s, index_s, expected, found = [], [], [], []
+    for lat, long in queries:
+        started = time.perf_counter()
+        expected.append(geopy_nearest(coords, lat, long, args.k))
+        geopy_s.append(time.perf_counter() - started)
+    for lat, long in queries:
+        started = time.perf_counter()
+        found.append(index.nearest(lat, long, args.k))
+        index_s.append(time.perf_counter() - started)
+
+    max_error, mismatches = 0.0, 0
+    for (lat, long), (expected_idx, expected_dists), (nearest_idx, nearest_dists) in zip(queries, expected, found):
+        max_error = max(max_error, float(np.abs(nearest_dists - expected_dists).max()))
+        for hawker_idx, expected_hawker_idx in zip(nearest_idx, expected_idx):
+            # A different centre in the same place only counts when the two are not tied within the tolerance
+            if hawker_idx != expected_hawker_idx and abs(
+                    distance.distance(coords[hawker_idx], (lat, long)).km
+                    - distance.distance(coords[expected_hawker_idx], (lat, long)).km) > TOLERANCE_KM:
+                mismatches += 1
+                break
+
+    print(f"{len(records)} hawker centres, {args.queries} queries, top {args.k}")
+    print(f"  geopy + sort  median {np.median(geopy_s) * 1000:8.3f} ms/query")
+    print(f"  index         median {np.median(index_s) * 1e6:8.1f} us/query")
+    print(f"  ranking mismatches {mismatches}/{args.queries}, max distance difference {max_error:.1e} km "
+          f"(tolerance {TOLERANCE_KM:g} km)")
+    if mismatches or max_error > TOLERANCE_KM:
+        sys.exit(1)
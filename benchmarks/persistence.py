@@ -0,0 +1,100 @@
+import argparse
+import os
+import pickle
+import random
+import sys
+import tempfile
+import time
+from telegram.ext import PicklePersistence
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from utils.sqlite_persistence import SQLitePersistence  # noqa: E402
+
+# Flush and start-up times of the pickle and SQLite persistence, with a store of N users of which a few change
+QUERIES = ['bedok', 'maxwell', 'tiong bahru', 'amoy', 'chinatown', 'old airport']
+
+
+def user_data(rng):
+    return {'searches': rng.randint(1, 50), 'last_query': rng.choice(QUERIES), 'subscriptions': rng.sample(QUERIES, 2)}
+
+
+def write_pickle_store(filename, users, rng):
+    data = {
+        'conversations': {'mrt': {(u, u): 0 for u in range(0, users, 100)}},
+        'user_data': {u: user_data(rng) for u in range(users)},
+        'chat_data': {u: {} for u in range(users)},
+        'bot_data': {},
+        'callback_data': None,
+    }
+    with open(filename, 'wb') as f:
+        pickle.dump(data, f)
+
+
+def timed(function):
+    started = time.perf_counter()
+    result = function()
+    return (time.perf_counter() - started) * 1000, result
+
+
+def start_pickle(filename):
+    persistence = PicklePersistence(filename)
+    user_data_store = persistence.get_user_data()
+    persistence.get_chat_data()
+    persistence.get_bot_data()
+    persistence.get_conversations('mrt')
+    return persistence, user_data_store
+
+
+def start_sqlite(filename):
+    persistence = SQLitePersistence(filename)
+    user_data_store = persistence.get_user_data()
+    persistence.get_chat_data()
+    persistence.get_bot_data()
+    persistence.get_conversations('mrt')
+    return persistence, user_data_store
+
+
+def change_users(persistence, user_data_store, active_users, rng):
+    for user_id in active_users:
+        data = user_data_store[user_id]
+        data['searches'] = data.get('searches', 0) + 1
+        persistence.update_user_data(user_id, data)
+    persistence.flush()
+
+
+def run(users, active, work_dir):
+    rng = random.Random(users)
+    pickle_file = os.path.join(work_dir, f'pickle-{users}')
+    sqlite_file = os.path.join(work_dir, f'sqlite-{users}.sqlite3')
+    write_pickle_store(pickle_file, users, rng)
+    active_users = rng.sample(range(users), active)
+
+    pickle_start_ms, (persistence, user_data_store) = timed(lambda: start_pickle(pickle_file))
+    # on_flush=False (the bot's setting) writes the whole file for every changed user; this is a single flush
+    persistence.on_flush = True
+    pickle_flush_ms, _ = timed(lambda: change_users(persistence, user_data_store, active_users, rng))
+    pickle_size = os.path.getsize(pickle_file)
+    del persistence, user_data_store
+
+    migrate_ms, _ = timed(lambda: SQLitePersistence(sqlite_file).migrate_from_pickle(pickle_file))
+    sqlite_start_ms, (persistence, user_data_store) = timed(lambda: start_sqlite(sqlite_file))
+    sqlite_flush_ms, _ = timed(lambda: change_users(persistence, user_data_store, active_users, rng))
+    idle_flush_ms, _ = timed(persistence.flush)
+    sqlite_size = sum(os.path.getsize(f) for f in (sqlite_file, sqlite_file + '-wal') if os.path.exists(f))
+
+    print(f"{users:8d} users, {active} changed | pickle: start {pickle_start_ms:8.1f} ms, flush {pickle_flush_ms:8.1f} ms, "
+          f"{pickle_size / 1e6:6.1f} MB | sqlite: migrate {migrate_ms:8.1f} ms, start {sqlite_start_ms:5.1f} ms, "
+          f"flush {sqlite_flush_ms:5.1f} ms, idle flush {idle_flush_ms:5.2f} ms, {sqlite_size / 1e6:6.1f} MB")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--active', type=int, default=100, help="users whose data changes between flushes")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        for users in args.users:
+            run(users, args.active, work_dir)
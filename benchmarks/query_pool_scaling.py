@@ -0,0 +1,82 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from utils.hawker_data import build_hawker_data, load_mrt_index, nearest_hawkers, prepare_hawker_data_df, \
+    search_hawkers  # noqa: E402
+from utils.query_pool import QueryPool  # noqa: E402
+from utils.snapshot_cache import save_snapshot  # noqa: E402
+
+# Throughput of searches and location queries from many handler threads, against the number of query processes. The
+# processes read the data from a snapshot cache, as the bot's do.
+SEARCH_QUERIES = ['bedok', 'maxwell', 'tiong bahru', 'amoy', 'chinatown', 'old airport', 'tampines', 'yishun',
+                  'chicken rice', 'west coast drive', 'ang mo kio', 'geylang serai']
+
+
+def load_data(scale):
+    with open(os.path.join(REPO_DIR, 'data', 'hawker_data.json'), 'rb') as f:
+        hawker_data_df = prepare_hawker_data_df(json.loads(f.read()))
+    with open(os.path.join(REPO_DIR, 'data', 'mrt_hawker_topk.npz'), 'rb') as f:
+        mrt_index = load_mrt_index(f.read())
+    if scale > 1:
+        hawker_data_df = pd.concat([hawker_data_df.rename(index=lambda n: f"{n} {i}") if i else hawker_data_df
+                                    for i in range(scale)])
+    return build_hawker_data(hawker_data_df, mrt_index, {'scale': str(scale)})
+
+
+def client(query_pool, data, seed, deadline, counts):
+    rng = random.Random(seed)
+    done = 0
+    while time.perf_counter() < deadline:
+        if rng.random() < 0.6:
+            query_pool.run(data, search_hawkers, rng.choice(SEARCH_QUERIES), 10)
+        else:
+            query_pool.run(data, nearest_hawkers, rng.uniform(1.25, 1.45), rng.uniform(103.65, 103.98), 10)
+        done += 1
+    counts.append(done)
+
+
+def measure(data, processes, threads, duration, cache_dir):
+    query_pool = QueryPool(processes, cache_dir)
+    if processes > 0:
+        query_pool.start()
+    counts = []
+    deadline = time.perf_counter() + duration
+    clients = [threading.Thread(target=client, args=(query_pool, data, i, deadline, counts)) for i in range(threads)]
+    for t in clients:
+        t.start()
+    for t in clients:
+        t.join()
+    query_pool.close()
+    return sum(counts) / duration
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--processes', type=int, nargs='+', default=[0, 1, 2, 4])
+    parser.add_argument('--scale', type=int, nargs='+', default=[1, 10])
+    parser.add_argument('--threads', type=int, default=16, help="handler threads sending queries")
+    parser.add_argument('--duration', type=float, default=5.0)
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPUs")
+    for scale in args.scale:
+        data = load_data(scale)
+        baseline = None
+        with tempfile.TemporaryDirectory() as cache_dir:
+            save_snapshot(cache_dir, data.hawker_data_df, data.mrt_index, data.source_checksums)
+            for processes in args.processes:
+                throughput = measure(data, processes, args.threads, args.duration, cache_dir)
+                baseline = baseline or throughput
+                label = f"{processes} processes" if processes else "in threads"
+                print(f"{scale:3d}x data ({len(data.hawker_data_df)} hawkers), {label:12s}: "
+                      f"{throughput:8.0f} queries/s ({throughput / baseline:.2f}x)")
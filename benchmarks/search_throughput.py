@@ -0,0 +1,75 @@
+import argparse
+import json
+import os
+import sys
+import time
+from fuzzywuzzy import fuzz
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from benchmarks.commands import load_data  # noqa: E402
+from utils.search_engine import normalise  # noqa: E402
+
+# /search throughput in queries per second over the golden queries in tests/data/search_golden.json: fuzzywuzzy's
+# partial_ratio against every hawker name and a sort of all the scores, as search_hawker_by_name did before, against
+# HawkerSearchEngine, at the bundled data size and copies of it scaled up N times.
+#
+# With --write-golden, records the top GOLDEN_RESULTS of the full scan for each golden query instead. Names are
+# compared case-folded, as the engine does: the old scorer compared the raw query with the raw names, so "bedok"
+# ranked centres named "Bedok ..." at 80 alongside unrelated ones.
+GOLDEN_PATH = os.path.join(REPO_DIR, 'tests', 'data', 'search_golden.json')
+GOLDEN_RESULTS = 10
+
+
+def full_scan(names, query, limit=GOLDEN_RESULTS):
+    fuzz_name = [(fuzz.partial_ratio(n, query), n) for n in names]
+    return [name for score, name in sorted(fuzz_name, reverse=True)][:limit]
+
+
+def write_golden(queries, names):
+    normalised_names = {normalise(name): name for name in names}
+    entries = []
+    for query in queries:
+        scores = sorted(((fuzz.partial_ratio(n, normalise(query)), name) for n, name in normalised_names.items()),
+                        key=lambda s: (-s[0], s[1]))[:GOLDEN_RESULTS]
+        expected = ",\n".join(f"  {json.dumps([name, score])}" for score, name in scores)
+        entries.append(f'{{"query": {json.dumps(query)}, "expected": [\n{expected}\n]}}')
+    # One result per line, so that a change to the golden set reads as a diff of results
+    with open(GOLDEN_PATH, 'w') as f:
+        f.write("[\n" + ",\n".join(entries) + "\n]\n")
+
+
+def queries_per_second(search, queries, min_seconds):
+    count = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < min_seconds:
+        for query in queries:
+            search(query)
+        count += len(queries)
+    return count / (time.perf_counter() - started)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', type=int, nargs='+', default=[1, 10])
+    parser.add_argument('--seconds', type=float, default=2.0)
+    parser.add_argument('--write-golden', action='store_true')
+    args = parser.parse_args()
+
+    with open(GOLDEN_PATH) as f:
+        queries = [entry['query'] for entry in json.load(f)]
+    if args.write_golden:
+        write_golden(queries, list(load_data(1).hawker_data_df.index))
+        sys.exit(0)
+
+    for scale in args.scale:
+        started = time.perf_counter()
+        data = load_data(scale)
+        build_ms = (time.perf_counter() - started) * 1000
+        names = list(data.hawker_data_df.index)
+        old_qps = queries_per_second(lambda query: full_scan(names, query), queries, args.seconds)
+        new_qps = queries_per_second(data.search_engine.search, queries, args.seconds)
+        print(f"{scale}x: {len(names)} hawker centres, data and index built in {build_ms:.0f} ms")
+        print(f"  full scan + sort  {old_qps:10.0f} queries/s")
+        print(f"  search engine     {new_qps:10.0f} queries/s")
@@ -0,0 +1,173 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from telegram.utils.request import Request  # noqa: E402
+
+import main  # noqa: E402
+from utils.metrics import sends_coalesced, sends_retried  # noqa: E402
+from utils.rate_limiter import SendLimiter, TokenBucket  # noqa: E402
+
+# Users going through /search and the /mrt flow against a fake Bot API that enforces flood control like Telegram,
+# answering 429 with retry_after when a chat or the bot as a whole sends too fast. Handlers run on UPDATE_WORKERS
+# threads. Reports how long handlers take, how long until each message's final text reaches the API, and whether
+# any was lost.
+TOKEN = '123456:fake-token-for-send-queue'
+
+
+class RateLimitedApi:
+    def __init__(self, global_rate, chat_rate, chat_burst, latency):
+        self.latency = latency
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.chat_buckets = {}
+        self.lock = threading.Lock()
+        self.message_ids = defaultdict(int)
+        # Text of each message as last sent or edited, and when
+        self.messages = {}
+        self.accepted = 0
+        self.rejected = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self.make_handler())
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/bot"
+
+    def make_handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                data = json.loads(self.rfile.read(length)) if length else {}
+                content = json.dumps(api.call(self.path.rsplit('/', 1)[-1], data)).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def call(self, method, data):
+        time.sleep(self.latency)
+        if method == 'getMe':
+            return {'ok': True, 'result': {'id': 123456, 'is_bot': True, 'first_name': 'Bot', 'username': 'bot'}}
+
+        chat_id = int(data['chat_id'])
+        with self.lock:
+            now = time.monotonic()
+            chat_bucket = self.chat_buckets.setdefault(chat_id, TokenBucket(self.chat_rate, self.chat_burst))
+            waits = [(1 - bucket.available(now)) / bucket.rate for bucket in (self.global_bucket, chat_bucket)]
+            if max(waits) > 0:
+                self.rejected += 1
+                retry_after = math.ceil(max(waits))
+                return {'ok': False, 'error_code': 429, 'description': f"Too Many Requests: retry after {retry_after}",
+                        'parameters': {'retry_after': retry_after}}
+            self.global_bucket.reserve(now)
+            chat_bucket.reserve(now)
+            self.accepted += 1
+
+            if method == 'sendMessage':
+                self.message_ids[chat_id] += 1
+                message_id = self.message_ids[chat_id]
+            else:
+                message_id = int(data['message_id'])
+            self.messages[(chat_id, message_id)] = (data['text'], time.monotonic())
+        return {'ok': True, 'result': {'message_id': message_id, 'date': int(time.time()),
+                                       'chat': {'id': chat_id, 'type': 'private'}, 'text': data['text']}}
+
+
+def run_user(bot, chat_id, rng, workers, handler_times, expected):
+    # Each step is one handler; the user waits a moment before the next, as after reading a reply
+    def handle(*sends):
+        started = time.monotonic()
+        with workers:
+            for method, message_id, text in sends:
+                if method == 'send':
+                    bot.send_message(chat_id=chat_id, text=text)
+                else:
+                    bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=text)
+        handler_times.append(time.monotonic() - started)
+        # Only the last text of each message has to arrive
+        for method, message_id, text in sends:
+            expected[(chat_id, message_id)] = (text, started)
+        time.sleep(rng.uniform(0.2, 1.0))
+
+    handle(('send', 1, f"search results for {chat_id}"))
+    handle(('send', 2, "Select the first letter of an MRT/LRT station"))
+    handle(('edit', 2, "Select an MRT/LRT station that starts with B"))
+    handle(('edit', 2, "Searching for hawkers near Bedok"), ('edit', 2, f"hawkers near Bedok for {chat_id}"))
+
+
+def run(users, update_workers, api):
+    bot = main.RateLimitedBot(token=TOKEN, base_url=api.url,
+                              request=Request(con_pool_size=update_workers + main.SEND_WORKERS + 4),
+                              send_limiter=SendLimiter(), send_workers=main.SEND_WORKERS)
+    workers = threading.BoundedSemaphore(update_workers)
+    handler_times = []
+    expected = {}
+    started = time.monotonic()
+    threads = [threading.Thread(target=run_user, args=(bot, 1000 + i, random.Random(i), workers, handler_times,
+                                                       expected))
+               for i in range(users)]
+    for i, thread in enumerate(threads):
+        # Users arrive over the first couple of seconds
+        time.sleep(2 / users)
+        thread.start()
+    for thread in threads:
+        thread.join()
+    bot.send_queue.close(timeout=120)
+    finished = time.monotonic() - started
+
+    delivery, lost = [], 0
+    for key, (text, sent_at) in expected.items():
+        received = api.messages.get(key)
+        if received is None or received[0] != text:
+            lost += 1
+        else:
+            delivery.append(received[1] - sent_at)
+    return np.array(handler_times) * 1000, np.array(delivery) * 1000, lost, finished
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--update-workers', type=int, default=16)
+    parser.add_argument('--latency', type=float, default=0.02, help="seconds the fake API takes per request")
+    parser.add_argument('--api-global-rate', type=float, default=20,
+                        help="sends per second the fake API allows, below the bot's own limit to cause flood control")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    api = RateLimitedApi(args.api_global_rate, chat_rate=1, chat_burst=3, latency=args.latency)
+    handler_ms, delivery_ms, lost, finished = run(args.users, args.update_workers, api)
+    coalesced = int(sum(sends_coalesced.values.values()))
+    retried = int(sum(sends_retried.values.values()))
+    print(f"{args.users} users, {api.accepted} sends accepted and {api.rejected} rejected with 429 in {finished:.1f} s; "
+          f"{coalesced} edits coalesced, {retried} sends retried, {lost} messages lost")
+    print(f"  handler  p50 {np.percentile(handler_ms, 50):8.1f} ms  p99 {np.percentile(handler_ms, 99):8.1f} ms  "
+          f"max {handler_ms.max():8.1f} ms")
+    print(f"  delivery p50 {np.percentile(delivery_ms, 50):8.1f} ms  p99 {np.percentile(delivery_ms, 99):8.1f} ms  "
+          f"max {delivery_ms.max():8.1f} ms")
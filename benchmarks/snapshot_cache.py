@@ -0,0 +1,89 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import main  # noqa: E402
+from utils.data_fetcher import ConditionalFetcher  # noqa: E402
+from utils.snapshot_cache import load_snapshot, save_snapshot  # noqa: E402
+
+# Start-up data load along each of main.py's sources, best of --iterations: the snapshot cache, checked against its
+# checksums and the bundled files' as main.py does, and unchecked; the bundled data/ files; and the network through a
+# local HTTP server standing in for GitHub, so without real network time. The baseline is what start-up did before
+# the cache: the hawker JSON and the all-pairs distance JSON into frames, with the cleaning dates parsed one by one.
+DATE_COLUMNS = ["q1_start", "q1_end", "q2_start", "q2_end", "q3_start", "q3_end", "q4_start", "q4_end"]
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def load_baseline(data_dir):
+    with open(os.path.join(data_dir, 'mrt_hawker_distances.json'), 'rb') as f:
+        hawker_mrt_dist_df = pd.DataFrame.from_records(json.loads(f.read()))
+    with open(os.path.join(data_dir, 'hawker_data.json'), 'rb') as f:
+        hawker_data_df = pd.DataFrame.from_records(json.loads(f.read()))
+    hawker_data_df["not_existing"] = hawker_data_df["hawker_status"].apply(lambda s: "existing" not in s.lower())
+    hawker_data_df = hawker_data_df.set_index("hawker_name")
+    for c in DATE_COLUMNS:
+        hawker_data_df[c] = hawker_data_df[c].apply(lambda d: datetime.strptime(d, "%d/%m/%Y"))
+    return hawker_data_df, hawker_mrt_dist_df
+
+
+def load_network(base_url):
+    hawker_data_fetcher = ConditionalFetcher(f"{base_url}/hawker_data.json")
+    mrt_index_fetcher = ConditionalFetcher(f"{base_url}/mrt_hawker_topk.npz")
+    return main.parse_data(hawker_data_fetcher.fetch(), mrt_index_fetcher.fetch())
+
+
+def best_of(run, iterations):
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        result = run()
+        timings.append(time.perf_counter() - started)
+    assert result is not None
+    return min(timings) * 1000
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=5)
+    args = parser.parse_args()
+
+    data_dir = os.path.join(REPO_DIR, 'data')
+    server = ThreadingHTTPServer(('127.0.0.1', 0), partial(QuietHandler, directory=data_dir))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        main.BUNDLED_DATA_DIR = data_dir
+        save_snapshot(cache_dir, *main.parse_data(*main.load_bundled_data()))
+        results = [
+            ("baseline (JSON + all-pairs frame + strptime)", lambda: load_baseline(data_dir)),
+            ("network, local stand-in", lambda: load_network(base_url)),
+            ("bundled data/ files", lambda: main.parse_data(*main.load_bundled_data())),
+            ("cache, checked", lambda: load_snapshot(cache_dir, bundled_checksums=main.bundled_checksums())),
+            ("cache, unchecked", lambda: load_snapshot(cache_dir, verify=False)),
+        ]
+        for name, run in results:
+            print(f"  {name:46s} {best_of(run, args.iterations):7.1f} ms")
+
+        # What the handlers see is the same whichever way it was loaded
+        hawker_data_df, mrt_index, _ = load_snapshot(cache_dir)
+        bundled_df, bundled_mrt_index, _ = main.parse_data(*main.load_bundled_data())
+        pd.testing.assert_frame_equal(hawker_data_df, bundled_df)
+        assert all(np.array_equal(mrt_index[key], bundled_mrt_index[key]) for key in bundled_mrt_index)
+    server.shutdown()
@@ -0,0 +1,113 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from load_test import REPO_DIR, TOKEN, FakeBotApi
+
+# Start-up profile of main.py against a local fake Bot API server: the slowest imports as reported by
+# python -X importtime, the duration of each start-up stage as logged by the bot, and the time from launching the
+# process to it polling for updates with the data loaded. Exits with status 1 when that is over --budget-ms.
+
+
+def parse_import_times(stderr_text):
+    # Lines look like "import time:   self [us] | cumulative | <indent>package"; the script's own imports have no
+    # indent
+    imports = []
+    for line in stderr_text.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        fields = line[len('import time:'):].split('|')
+        self_us, cumulative_us, name = int(fields[0]), int(fields[1]), fields[2]
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        imports.append((name.strip(), depth, self_us, cumulative_us))
+    return imports
+
+
+def read_stage_times(log_file):
+    stages = []
+    ready_ms = None
+    with open(log_file, encoding='utf-8') as f:
+        for line in f:
+            entry = json.loads(line)
+            if entry.get('event') == 'startup':
+                stages.append((entry['stage'], entry['duration_ms']))
+            elif entry['message'].startswith('Started in '):
+                ready_ms = float(entry['message'].split()[2])
+    return stages, ready_ms
+
+
+def run(work_dir, cached):
+    api = FakeBotApi(send_delay=0)
+    threading.Thread(target=api.server.serve_forever, daemon=True).start()
+    if not cached:
+        shutil.rmtree(os.path.join(work_dir, 'cache'), ignore_errors=True)
+    shutil.rmtree(os.path.join(work_dir, 'logs'), ignore_errors=True)
+
+    env = dict(os.environ, TELEGRAM_BOT_TOKEN=TOKEN, TELEGRAM_BOT_API_URL=api.url, METRICS_PORT='0')
+    stderr_file = os.path.join(work_dir, 'stderr.txt')
+    with open(stderr_file, 'w') as stderr:
+        launched = time.perf_counter()
+        bot = subprocess.Popen([sys.executable, '-X', 'importtime', os.path.join(REPO_DIR, 'main.py')], cwd=work_dir,
+                               env=env, stdout=subprocess.DEVNULL, stderr=stderr)
+        try:
+            if not api.ready.wait(timeout=60):
+                raise RuntimeError("Bot did not start")
+            polling_ms = (time.perf_counter() - launched) * 1000
+            # Polling may start before the data is loaded; the bot logs when it has both
+            log_file = os.path.join(work_dir, 'logs', 'sghawkerbot.log')
+            deadline = time.monotonic() + 60
+            while True:
+                stages, ready_ms = read_stage_times(log_file) if os.path.exists(log_file) else ([], None)
+                if ready_ms is not None or time.monotonic() > deadline:
+                    break
+                time.sleep(0.05)
+            if ready_ms is None:
+                raise RuntimeError("Bot did not finish starting")
+        finally:
+            bot.terminate()
+            bot.wait(timeout=30)
+            api.server.shutdown()
+
+    with open(stderr_file) as f:
+        imports = parse_import_times(f.read())
+    return polling_ms, imports, stages, ready_ms
+
+
+def report(label, polling_ms, imports, stages, ready_ms, top):
+    import_ms = sum(cumulative for _, depth, _, cumulative in imports if depth == 0) / 1000
+    print(f"{label}: polling {polling_ms:.0f} ms after launch, imports {import_ms:.0f} ms, "
+          f"main ready {ready_ms:.0f} ms after imports")
+    for stage, duration_ms in stages:
+        print(f"  stage {stage:14s} {duration_ms:8.1f} ms")
+    print("  slowest imports by cumulative time:")
+    for name, depth, self_us, cumulative_us in sorted(imports, key=lambda i: -i[3])[:top]:
+        print(f"    {'  ' * depth}{name:40s} {cumulative_us / 1000:8.1f} ms (self {self_us / 1000:.1f} ms)")
+    return import_ms + ready_ms
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--budget-ms', type=float, default=2500,
+                        help="from launch to serving with the data loaded, with and without the cache")
+    parser.add_argument('--top', type=int, default=15, help="number of imports to list")
+    args = parser.parse_args()
+
+    over_budget = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.symlink(os.path.join(REPO_DIR, 'data'), os.path.join(work_dir, 'data'))
+        for label, cached in (('bundled data', False), ('cache', True)):
+            polling_ms, imports, stages, ready_ms = run(work_dir, cached)
+            total_ms = report(label, polling_ms, imports, stages, ready_ms, args.top)
+            print(f"  total {total_ms:.0f} ms (budget {args.budget_ms:.0f} ms)")
+            if total_ms > args.budget_ms:
+                over_budget.append(label)
+
+    if over_budget:
+        print(f"OVER BUDGET: {', '.join(over_budget)}")
+        sys.exit(1)
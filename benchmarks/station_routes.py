@@ -0,0 +1,101 @@
+import argparse
+import os
+import random
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from utils.hawker_data import load_mrt_index  # noqa: E402
+from utils.station_graph import StationGraph  # noqa: E402
+
+# /route queries between random pairs of stations: the station graph merging each station's top-K list against a
+# rescan of the all-pairs hawker/station distance table for the stations on the route, for the nearest hawker
+# centres along the route and for all of them within a distance. The table is scaled up with copies of each hawker
+# centre moved up to SCALE_JITTER_KM away, with the top-K lists rebuilt from it. Checks that both give the same
+# distances.
+SCALE_JITTER_KM = 1.0
+
+
+def scaled_tables(mrt_index, all_pairs_df, scale, rng):
+    if scale > 1:
+        copies = [all_pairs_df]
+        for i in range(1, scale):
+            copy = all_pairs_df.copy()
+            copy['hawker_name'] = copy['hawker_name'] + f" #{i}"
+            copy['distance'] += rng.uniform(0, SCALE_JITTER_KM, len(copy))
+            copies.append(copy)
+        all_pairs_df = pd.concat(copies, ignore_index=True)
+
+    # The same top-K index as mrt_hawker_dist.build_station_topk_index, for the stations in mrt_index
+    dist_matrix = all_pairs_df.pivot(index='station_num', columns='hawker_name', values='distance')
+    dist_matrix = dist_matrix.loc[mrt_index['station_nums']]
+    k = mrt_index['hawker_idx'].shape[1]
+    distances = dist_matrix.to_numpy()
+    nearest = np.argsort(distances, axis=1, kind='stable')[:, :k]
+    mrt_index = dict(mrt_index, hawker_names=dist_matrix.columns.to_numpy(dtype=str), hawker_idx=nearest,
+                     distances=np.take_along_axis(distances, nearest, axis=1).astype(np.float32))
+    return mrt_index, all_pairs_df
+
+
+def rescan(all_pairs_df, station_nums, k, max_km=None):
+    rows = all_pairs_df[all_pairs_df['station_num'].isin(station_nums)]
+    if max_km is not None:
+        rows = rows[rows['distance'] <= max_km]
+    return rows.groupby('hawker_name')['distance'].min().nsmallest(k)
+
+
+def measure(run, queries):
+    latencies = np.empty(len(queries))
+    results = []
+    for i, query in enumerate(queries):
+        started = time.perf_counter()
+        results.append(run(*query))
+        latencies[i] = time.perf_counter() - started
+    return latencies * 1000, results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--max-km', type=float, default=1.0)
+    args = parser.parse_args()
+
+    with open(os.path.join(REPO_DIR, 'data', 'mrt_hawker_topk.npz'), 'rb') as f:
+        base_mrt_index = load_mrt_index(f.read())
+    base_all_pairs_df = pd.read_json(os.path.join(REPO_DIR, 'data', 'mrt_hawker_distances.json'))
+
+    for scale in args.scale:
+        rng = np.random.default_rng(scale)
+        mrt_index, all_pairs_df = scaled_tables(base_mrt_index, base_all_pairs_df, scale, rng)
+        started = time.perf_counter()
+        graph = StationGraph(mrt_index)
+        build_ms = (time.perf_counter() - started) * 1000
+
+        pairs = random.Random(scale).choices(range(len(graph)), k=args.queries * 2)
+        route_ms, routes = measure(graph.route, list(zip(pairs[::2], pairs[1::2])))
+        node_station_nums = [[] for _ in range(len(graph))]
+        for station_num in mrt_index['station_nums']:
+            node_station_nums[graph.nodes_by_code[station_num.split('/')[0].strip().lower()]].append(station_num)
+        route_stations = [[station_num for node in route for station_num in node_station_nums[node]]
+                          for route in routes]
+        print(f"{scale}x: {len(all_pairs_df)} hawker/station pairs, {len(graph)} stations, graph built in "
+              f"{build_ms:.1f} ms, {np.mean([len(route) for route in routes]):.1f} stations per route, "
+              f"route p50 {np.percentile(route_ms, 50):.3f} ms")
+
+        for name, max_km in (('nearest', None), (f"within {args.max_km:g} km", args.max_km)):
+            merge_ms, merged = measure(lambda route: graph.hawkers_near(route, args.k, max_km),
+                                       [(route,) for route in routes])
+            rescan_ms, rescanned = measure(lambda station_nums: rescan(all_pairs_df, station_nums, args.k, max_km),
+                                           [(station_nums,) for station_nums in route_stations])
+            for merged_hawkers, rescanned_hawkers in zip(merged, rescanned):
+                assert np.allclose([hawker.distance for hawker in merged_hawkers], rescanned_hawkers.to_numpy(),
+                                   atol=1e-4), 'the merge finds the same distances as the rescan'
+            print(f"  {name:14s} merge p50 {np.percentile(merge_ms, 50):7.3f} ms  "
+                  f"p99 {np.percentile(merge_ms, 99):7.3f} ms  |  rescan p50 {np.percentile(rescan_ms, 50):8.3f} ms  "
+                  f"p99 {np.percentile(rescan_ms, 99):8.3f} ms")
@@ -1,38 +1,100 @@
 import telegram
 from telegram.ext import Updater
-from fuzzywuzzy import fuzz
 import logging
-import pandas as pd
-import requests
+import html
+import json
 import os
 import sys
 import random
-import geopy.distance
-from datetime import datetime
+import re
+import secrets
+import threading
+import time
+import pytz
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime, time as dt_time, timedelta
+from urllib.parse import urlparse
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.date import DateTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from telegram.ext import (
     CommandHandler,
     MessageHandler,
     ConversationHandler,
+    Defaults,
     Filters,
-    PicklePersistence,
 )
+from telegram.ext.extbot import ExtBot
+from telegram.utils.request import Request
+from utils.data_fetcher import ConditionalFetcher
+from utils.date_utils import get_date_range_in_weeks
+from utils.hawker_data import (
+    build_hawker_data,
+    hawkers_within,
+    load_mrt_index,
+    nearest_hawkers,
+    prepare_hawker_data_df,
+    search_hawkers,
+    search_hawkers_incremental,
+)
+from utils.logging_utils import (
+    log_event,
+    logged_command,
+    record_result_count,
+    set_sample_rate,
+    setup_logging,
+)
+from utils.lru_cache import LRUCache
+from utils.metrics import (
+    data_refresh_seconds,
+    format_stats,
+    inline_queries_superseded,
+    inline_query_seconds,
+    measured,
+    start_metrics_server,
+    telegram_request_seconds,
+    timed,
+)
+from utils.query_pool import QueryPool
+from utils.rate_limiter import SendLimiter
+from utils.search_engine import normalise
+from utils.send_queue import SendQueue
+from utils.snapshot_cache import (
+    checksum_bytes,
+    checksum_file,
+    load_snapshot,
+    save_snapshot,
+)
+from utils.sqlite_persistence import SQLitePersistence
+from utils.subscriptions import SubscriptionStore
+from utils.webhook_server import WebhookServer
 
 
-def log_command_pressed(update):
-    user = update.message.from_user
-    username = user.username
-    user_id = user.id
-    first_name = user.first_name
+class RateLimitedBot(ExtBot):
+    __slots__ = ("send_limiter", "send_queue")
 
-    if update.message.location is not None:
-        lat = update.message.location.latitude
-        long = update.message.location.longitude
-        logging.info(
-            f"{username}/{first_name} ({user_id}) sent a location: {lat}, {long}."
-        )
-    else:
-        command = update.message.text[:255]
-        logging.info(f"{username}/{first_name} ({user_id}) sent {command}.")
+    def __init__(self, *args, send_limiter, send_workers, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.send_limiter = send_limiter
+        self.send_queue = SendQueue(self.send_now, send_limiter, send_workers)
+
+    def send_now(self, endpoint, data, timeout, api_kwargs):
+        with timed(telegram_request_seconds, endpoint):
+            return super()._post(endpoint, data, timeout, api_kwargs)
+
+    def _post(self, endpoint, data=None, timeout=None, api_kwargs=None):
+        if endpoint == "getUpdates":
+            # A long poll, which takes as long as no update comes in
+            return super()._post(endpoint, data, timeout, api_kwargs)
+        # Every send and edit goes through here; callback and inline query answers have no chat and are not limited,
+        # and methods whose result the caller needs, e.g. getChat, are sent right away
+        if endpoint not in QUEUED_METHODS or (data or {}).get("chat_id") is None:
+            return self.send_now(endpoint, data, timeout, api_kwargs)
+        # Sent by the queue's threads, so a handler never waits for a rate limit or flood control. Handlers do not
+        # use the sent message, and True is what the bot methods return when there is none.
+        self.send_queue.enqueue(endpoint, data, timeout, api_kwargs)
+        return True
 
 
 def get_shuffled_emojis():
@@ -41,32 +103,39 @@ def get_shuffled_emojis():
     return emojis
 
 
-def start(update, context):
-    log_command_pressed(update)
-
+def start_reply(update):
     reply_text = [
         f"Hello, {update.message.from_user.first_name}! This is SG Hawker bot.",
         f"\nDo you need information about SG's hawker centres?",
-        f"\n\t 🧹 /closed tells you which hawker centres are closed today.",
-        f"\t 🔍 /search Input a search term and I'll tell you the hawker centres that best match your query."
+        f"\n\t 🧹 /closed tells you which hawker centres are closed today. "
+        f"Use /closed_this_week or /closed_next_week to plan ahead.",
+        f"\t 🔍 /search Input a search term and I'll tell you the hawker centres whose name, address or nearby MRT/LRT station best match your query. "
         f"For example, <b>/search bedok</b> or <b>/search west coast drive</b>.",
         f"\t 🚝 /mrt lets you know the hawker centres near an MRT/LRT station.",
-        f"\t 🧭 Want to know which hawker centres are near you? Simply send me your location!",
+        f"\t 🚆 /route finds the hawker centres along your commute, e.g. <b>/route bedok to outram park</b>, "
+        f"or <b>/route bedok to outram park 1</b> for all of them within 1 km of a station on the way.",
+        f"\t 🧭 Want to know which hawker centres are near you? Simply send me your location! "
+        f"Then <b>/nearby 2</b> lists all of them within 2 km, or <b>/nearby 2 open</b> only those open today.",
+        f"\t 💬 You can also search from any chat: type my username followed by a search term.",
+        f"\t 🔔 /subscribe tells you when a hawker centre closes or opens again, e.g. <b>/subscribe maxwell</b>, "
+        f"or <b>/subscribe nearest</b> for the ones near the location you last sent me.",
         f"\t ℹ Need more information about me? Type /info.",
     ]
 
-    reply_text = "\n".join(reply_text)
-    context.bot.send_message(
-        chat_id=update.effective_chat.id,
-        text=reply_text,
+    return dict(
+        text="\n".join(reply_text),
         parse_mode=telegram.ParseMode.HTML,
         disable_web_page_preview=True,
     )
 
 
-def get_info(update, context):
-    log_command_pressed(update)
+@measured
+@logged_command
+def start(update, context):
+    context.bot.send_message(chat_id=update.effective_chat.id, **start_reply(update))
 
+
+def info_reply(update):
     reply_text = [
         f"Hello, {update.message.from_user.first_name}! This is SG Hawker bot.",
         f"\nSome things about me:",
@@ -82,15 +151,19 @@ def get_info(update, context):
         f'\t• My picture is from <a href="https://www.flaticon.com/authors/iconixar">flaticon.com</a>.',
     ]
 
-    reply_text = "\n".join(reply_text)
-    context.bot.send_message(
-        chat_id=update.effective_chat.id,
-        text=reply_text,
+    return dict(
+        text="\n".join(reply_text),
         parse_mode=telegram.ParseMode.HTML,
         disable_web_page_preview=True,
     )
 
 
+@measured
+@logged_command
+def get_info(update, context):
+    context.bot.send_message(chat_id=update.effective_chat.id, **info_reply(update))
+
+
 def get_date_today():
     date_today = datetime.today()
     return date_today
@@ -100,67 +173,104 @@ def get_date_today_str(fmt="%d/%m/%Y"):
     return get_date_today().strftime(fmt)
 
 
-def hawkers_washing_today():
-    date_today = get_date_today()
-    quarter = pd.Timestamp(date_today).quarter
+def hawkers_washing_between(data, start_date, end_date):
+    cleaning_hawkers = data.cleaning_schedule.overlapping(start_date, end_date)
 
-    qtr_start_col = f"q{quarter}_start"
-    qtr_end_col = f"q{quarter}_end"
+    # Format for printing
+    cleaning_hawkers["start_date"] = cleaning_hawkers["start_date"].dt.strftime("%d/%m")
+    cleaning_hawkers["end_date"] = cleaning_hawkers["end_date"].dt.strftime("%d/%m")
 
-    # Get hawkers that are cleaning as of today
-    cleaning_hawkers = hawker_data_df[
-        (hawker_data_df[qtr_start_col] <= date_today)
-        & (hawker_data_df[qtr_end_col] >= date_today)
-    ]
+    return cleaning_hawkers
 
-    # Rename start and end date for easy reference by other functions
-    cleaning_hawkers = cleaning_hawkers[[qtr_start_col, qtr_end_col]].rename(
-        columns={qtr_start_col: "start_date", qtr_end_col: "end_date"}
-    )
 
-    # Format for printing
-    cleaning_hawkers["start_date"] = cleaning_hawkers["start_date"].apply(
-        lambda dt: dt.strftime("%d/%m")
-    )
-    cleaning_hawkers["end_date"] = cleaning_hawkers["end_date"].apply(
-        lambda dt: dt.strftime("%d/%m")
+def compute_closure_state(data, date_today):
+    washing_hawkers_df = hawkers_washing_between(data, date_today, date_today)
+    # Per hawker centre, in the order of hawker_data_df, for the /nearby filters
+    existing = ~data.hawker_data_df["not_existing"].to_numpy(dtype=bool)
+    filter_masks = {
+        "existing": existing,
+        "open": existing & ~data.hawker_data_df.index.isin(washing_hawkers_df.index),
+    }
+    state = ClosureState(
+        date=date_today,
+        data=data,
+        washing_hawkers_df=washing_hawkers_df,
+        closed_hawkers=hawkers_not_existing(data.hawker_data_df),
+        filter_masks=filter_masks,
+        mrt_render=None,
     )
+    # MRT replies only change with the data or the day, so they are rendered once per closure state
+    return state._replace(mrt_render=render_mrt_replies(state))
 
-    return cleaning_hawkers
 
+def refresh_closure_state():
+    global closure_state
+
+    # Built aside and swapped in with a single assignment, so handlers see either the old or the new state
+    with timed(data_refresh_seconds, "closure_state"):
+        new_state = compute_closure_state(hawker_data, get_date_today().date())
+    closure_state = new_state
+    return new_state
 
-def hawkers_not_existing():
+
+def get_closure_state():
+    if not data_ready.is_set():
+        # Updates are taken in while the data is still being loaded at start-up
+        data_ready.wait()
+    # Handlers take the data snapshot from the closure state so that both always come from the same load
+    state = closure_state
+    if state.date != get_date_today().date() or state.data is not hawker_data:
+        # The midnight or reload job has not caught up yet
+        state = refresh_closure_state()
+    return state
+
+
+def hawkers_not_existing(hawker_data_df):
     return list(hawker_data_df[hawker_data_df["not_existing"]].index)
 
 
-def append_closed_hawker_info(hawker_name):
+def append_closed_hawker_info(hawker_name, state):
     closed_text = ""
-    if hawker_name in washing_hawkers_df.index:
-        row = washing_hawkers_df.loc[hawker_name]
+    if hawker_name in state.washing_hawkers_df.index:
+        row = state.washing_hawkers_df.loc[hawker_name]
         start_date = row["start_date"]
         end_date = row["end_date"]
         closed_text += f"\t\t * <b>Closed</b> from {start_date} to {end_date}\n"
 
-    if hawker_name in closed_hawkers:
-        hawker_status = hawker_data_df.loc[hawker_name]["hawker_status"]
+    if hawker_name in state.closed_hawkers:
+        hawker_status = state.data.hawker_data_df.loc[hawker_name]["hawker_status"]
         closed_text += f"\t\t * <b>{hawker_status}</b>\n"
 
     return closed_text
 
 
+@measured
+@logged_command
 def search_hawker_by_name(update, context):
-    log_command_pressed(update)
-
-    all_hawker_names = hawker_data_df.index.unique()
     query = " ".join(context.args)
-    logging.info(f"Received query for hawker name search: {query}")
-
-    fuzz_name = [(fuzz.partial_ratio(n, query), n) for n in all_hawker_names]
-    sorted_name_fuzz = sorted(fuzz_name, reverse=True)
+    if not query.strip():
+        context.bot.send_message(
+            chat_id=update.message.chat_id,
+            text="🔍 Use <b>/search</b> followed by what you are looking for, e.g. <b>/search bedok</b>.",
+            parse_mode=telegram.ParseMode.HTML,
+        )
+        return
+
+    state = get_closure_state()
+    hawker_data_df = state.data.hawker_data_df
+
+    search_started = time.perf_counter()
+    search_results = query_pool.run(state.data, search_hawkers, query, RESULTS_TO_SHOW)
+    search_ms = (time.perf_counter() - search_started) * 1000
+    record_result_count(len(search_results))
+    if search_ms > SEARCH_LATENCY_BUDGET_MS:
+        logging.warning(
+            f"Search for {query} took longer than {SEARCH_LATENCY_BUDGET_MS} ms"
+        )
 
-    top_10_names = [name for score, name in sorted_name_fuzz][:10]
+    top_10_names = [name for name, score in search_results]
     reply_text = (
-        f"<i>Here are the top {RESULTS_TO_SHOW} hawker centres that match your query </i>{query}. "
+        f"<i>Here are the top {RESULTS_TO_SHOW} hawker centres that match your query </i>{html.escape(query)}. "
         f"<i>Click on each link to open its location.</i>\n\n"
     )
 
@@ -170,7 +280,7 @@ def search_hawker_by_name(update, context):
         reply_text += (
             f"{list_of_emojis[idx]} <a href='{hawker_gmaps_url}'>{hawker_name}</a>\n"
         )
-        reply_text += append_closed_hawker_info(hawker_name)
+        reply_text += append_closed_hawker_info(hawker_name, state)
 
     context.bot.send_message(
         chat_id=update.message.chat_id,
@@ -180,100 +290,260 @@ def search_hawker_by_name(update, context):
     )
 
 
-def search_hawker_by_mrt(update, context):
-    log_command_pressed(update)
+def closed_hawker_summary(hawker_name, state):
+    # Plain text version of append_closed_hawker_info, for the description of an inline result
+    if hawker_name in state.washing_hawkers_df.index:
+        row = state.washing_hawkers_df.loc[hawker_name]
+        return f"Closed from {row['start_date']} to {row['end_date']}"
+    if hawker_name in state.closed_hawkers:
+        return str(state.data.hawker_data_df.loc[hawker_name]["hawker_status"])
+    return ""
 
-    search_df = hawker_mrt_dist_df.copy()
-    unique_station_names_nums = search_df[
-        ["station_name_cleaned", "station_num"]
-    ].drop_duplicates()
-    unique_station_names_nums["first_letter"] = unique_station_names_nums[
-        "station_name_cleaned"
-    ].apply(lambda s: s[0])
 
-    sorted_unique_first_letters = sorted(
-        unique_station_names_nums["first_letter"].unique()
+def inline_article(hawker_name, state):
+    hawker_data_df = state.data.hawker_data_df
+    row = hawker_data_df.loc[hawker_name]
+    message_text = (
+        f"<a href='{row['hawker_gmaps_url']}'>{hawker_name}</a>\n{row['address']}\n"
+        + append_closed_hawker_info(hawker_name, state)
+    )
+    return telegram.InlineQueryResultArticle(
+        id=str(hawker_data_df.index.get_loc(hawker_name)),
+        title=hawker_name,
+        description=" · ".join(
+            filter(None, [closed_hawker_summary(hawker_name, state), row["address"]])
+        ),
+        url=row["hawker_gmaps_url"],
+        thumb_url=row["hawker_photo_url"] or None,
+        input_message_content=telegram.InputTextMessageContent(
+            message_text,
+            parse_mode=telegram.ParseMode.HTML,
+            disable_web_page_preview=True,
+        ),
     )
 
-    keyboard = []
-    for letter in sorted_unique_first_letters:
-        button_text = f"{letter.upper()}"
-        keyboard.append(
-            [telegram.InlineKeyboardButton(button_text, callback_data=letter)]
+
+def answer_inline_query(inline_query, results, received, cache):
+    # Telegram may also keep the answer for anyone sending the same query
+    inline_query.answer(results, cache_time=INLINE_CACHE_TTL)
+    inline_query_seconds.observe(time.perf_counter() - received, cache)
+
+
+@measured
+@logged_command
+def inline_search(update, context):
+    received = time.perf_counter()
+    inline_query = update.inline_query
+    # Any query still waiting for this user's is superseded, whether or not this one is cached
+    latest_inline_queries.put(inline_query.from_user.id, inline_query.id)
+
+    state = get_closure_state()
+    cache_key = (state.data.version, state.date, normalise(inline_query.query))
+    results = inline_results_cache.get(cache_key)
+    if results is not None:
+        record_result_count(len(results))
+        answer_inline_query(inline_query, results, received, "hit")
+        return
+
+    run_after(
+        context.job_queue,
+        debounced_inline_search,
+        INLINE_DEBOUNCE_SECONDS,
+        context=(inline_query, received),
+    )
+
+
+def debounced_inline_search(context):
+    inline_query, received = context.job.context
+    user_id = inline_query.from_user.id
+    if latest_inline_queries.get(user_id) != inline_query.id:
+        inline_queries_superseded.inc()
+        return
+
+    state = get_closure_state()
+    query = normalise(inline_query.query)
+    cache_key = (state.data.version, state.date, query)
+    # Someone else may have sent the same query in the meantime
+    results = inline_results_cache.get(cache_key)
+    if results is None:
+        # The user's previous search is where this one most likely continues from
+        version, previous = inline_search_states.get(user_id, (None, None))
+        search_results, search_state = search_hawkers_incremental(
+            state.data,
+            query,
+            RESULTS_TO_SHOW,
+            previous if version == state.data.version else None,
+        )
+        if search_state is not None:
+            inline_search_states.put(user_id, (state.data.version, search_state))
+        results = [inline_article(name, state) for name, score in search_results]
+        inline_results_cache.put(cache_key, results)
+    answer_inline_query(inline_query, results, received, "miss")
+
+
+def render_mrt_replies(state):
+    mrt_index = state.data.mrt_index
+    gmaps_urls = state.data.hawker_data_df["hawker_gmaps_url"].to_dict()
+
+    # Stations in the index are already sorted by their cleaned name
+    station_buttons = {}
+    station_replies = {}
+    for station_pos, (station_name, station_num) in enumerate(
+        zip(mrt_index["station_names_cleaned"], mrt_index["station_nums"])
+    ):
+        button_text = f"{station_name.title()} ({station_num})"
+        station_buttons.setdefault(station_name[0], []).append(
+            [telegram.InlineKeyboardButton(button_text, callback_data=station_num)]
+        )
+
+        # Emojis are shuffled per reply, so each line is kept without one. The index may name hawker centres that
+        # are no longer in the hawker data, so the nearest ones still in it are shown.
+        lines = []
+        for hawker_idx, dist in zip(
+            mrt_index["hawker_idx"][station_pos], mrt_index["distances"][station_pos]
+        ):
+            if len(lines) >= RESULTS_TO_SHOW:
+                break
+            hawker_name = mrt_index["hawker_names"][hawker_idx]
+            if hawker_name not in gmaps_urls:
+                continue
+            dist = round(float(dist), 1)
+            lines.append(
+                f"({dist} km) <a href='{gmaps_urls[hawker_name]}'>{hawker_name}</a>\n"
+                + append_closed_hawker_info(hawker_name, state)
+            )
+
+        header = (
+            f"<i>Here are the {len(lines)} hawker centres nearest to {station_name.title()}"
+            f" ({station_num}). Click on each link to open its location on Google Maps</i>\n\n"
+        )
+        station_replies[station_num] = (station_name, header, lines)
+
+    letter_keyboard = telegram.InlineKeyboardMarkup(
+        [
+            [telegram.InlineKeyboardButton(letter.upper(), callback_data=letter)]
+            for letter in sorted(station_buttons)
+        ]
+    )
+    station_keyboards = {
+        letter: telegram.InlineKeyboardMarkup(buttons)
+        for letter, buttons in station_buttons.items()
+    }
+
+    return MrtRender(letter_keyboard, station_keyboards, station_replies)
+
+
+def route_reply(query, state):
+    match = ROUTE_QUERY_PATTERN.fullmatch(query.strip())
+    if match is None:
+        return (
+            "🚆 Tell me where you get on and off, e.g. <b>/route bedok to outram park</b>, or add a distance, "
+            "e.g. <b>/route bedok to outram park 1</b>, for all the hawker centres within 1 km of a station on the way."
+        ), 0
+
+    station_graph = state.data.station_graph
+    stations = []
+    for station_query in match.group(1, 2):
+        station = station_graph.find_station(station_query)
+        if station is None:
+            return (
+                f"Sorry, I couldn't find an MRT/LRT station called <b>{html.escape(station_query)}</b>.",
+                0,
+            )
+        stations.append(station)
+    route = station_graph.route(*stations)
+    if route is None:
+        return "Sorry, I couldn't find a route between these stations.", 0
+
+    route_text = (
+        f"{station_graph.display_name(route[0])} to {station_graph.display_name(route[-1])}, "
+        f"{len(route) - 1} stops"
+    )
+    if match.group(3) is None:
+        route_hawkers = station_graph.hawkers_near(route, RESULTS_TO_SHOW)
+        reply_text = f"<i>Here are the {len(route_hawkers)} hawker centres nearest to your route from {route_text}.</i>\n\n"
+    else:
+        max_km = float(match.group(3))
+        route_hawkers = station_graph.hawkers_near(route, RESULTS_TO_SHOW, max_km)
+        reply_text = (
+            f"<i>Here are the hawker centres within {max_km:g} km of a station on your route from {route_text}"
+            f"{f', the nearest {RESULTS_TO_SHOW}' if len(route_hawkers) >= RESULTS_TO_SHOW else ''}.</i>\n\n"
         )
+        if not route_hawkers:
+            reply_text += "There are none. Try a larger distance."
+
+    hawker_data_df = state.data.hawker_data_df
+    hawker_names = state.data.mrt_index["hawker_names"]
+    list_of_emojis = get_shuffled_emojis()
+    for emoji, (hawker_idx, dist, station) in zip(list_of_emojis, route_hawkers):
+        hawker_name = hawker_names[hawker_idx]
+        gmaps_url = hawker_data_df.loc[hawker_name]["hawker_gmaps_url"]
+        reply_text += (
+            f"{emoji} ({round(dist, 1)} km from {station_graph.names[station].title()}) "
+            f"<a href='{gmaps_url}'>{hawker_name}</a>\n"
+        ) + append_closed_hawker_info(hawker_name, state)
+    return reply_text, len(route_hawkers)
+
+
+@measured
+@logged_command
+def search_hawker_by_route(update, context):
+    reply_text, num_results = route_reply(" ".join(context.args), get_closure_state())
+    record_result_count(num_results)
+    context.bot.send_message(
+        chat_id=update.effective_chat.id,
+        text=reply_text,
+        parse_mode=telegram.ParseMode.HTML,
+        disable_web_page_preview=True,
+    )
+
+
+@measured
+@logged_command
+def search_hawker_by_mrt(update, context):
+    mrt_render = get_closure_state().mrt_render
 
-    reply_markup = telegram.InlineKeyboardMarkup(keyboard)
     update.message.reply_text(
-        "🚉 Select the first letter of an MRT/LRT station:", reply_markup=reply_markup
+        "🚉 Select the first letter of an MRT/LRT station:",
+        reply_markup=mrt_render.letter_keyboard,
     )
     return MRT_FIRST
 
 
+@measured
+@logged_command
 def selected_mrt_station_letter(update, context):
     query = update.callback_query
     first_letter = query.data
+    mrt_render = get_closure_state().mrt_render
 
-    search_df = hawker_mrt_dist_df.copy()
-    stations = search_df[["station_name_cleaned", "station_num"]].drop_duplicates()
-    selected_stations = stations[
-        stations["station_name_cleaned"].apply(lambda s: s[0] == first_letter)
-    ]
-    sorted_station_names_nums = selected_stations.sort_values(by="station_name_cleaned")
-
-    keyboard = []
-    for idx, row in sorted_station_names_nums.reset_index(drop=True).iterrows():
-        station_name = row["station_name_cleaned"]
-        station_num = row["station_num"]
-        button_text = f"{station_name.title()} ({station_num})"
-        keyboard.append(
-            [telegram.InlineKeyboardButton(button_text, callback_data=station_num)]
-        )
-
-    reply_markup = telegram.InlineKeyboardMarkup(keyboard)
     query.edit_message_text(
         text=f"🚉 Select an MRT/LRT station that starts with {first_letter.upper()}:",
-        reply_markup=reply_markup,
+        reply_markup=mrt_render.station_keyboards.get(first_letter),
     )
     return MRT_SECOND
 
 
+@measured
+@logged_command
 def selected_mrt_station(update, context):
     query = update.callback_query
     query.answer()
 
-    search_df = hawker_mrt_dist_df.copy()
-    unique_stations = search_df[
-        ["station_name_cleaned", "station_num"]
-    ].drop_duplicates()
-    unique_stations = unique_stations.set_index("station_num")
-
+    state = get_closure_state()
     selected_station_num = query.data
-    selected_station_name = unique_stations.loc[selected_station_num][
-        "station_name_cleaned"
+    selected_station_name, header, lines = state.mrt_render.station_replies[
+        selected_station_num
     ]
 
     user_update_text = f"Searching for hawkers near <i>{selected_station_name.title()} ({selected_station_num})</i>"
     query.edit_message_text(parse_mode=telegram.ParseMode.HTML, text=user_update_text)
 
-    search_df = search_df[search_df["station_num"] == selected_station_num]
-    search_df = (
-        search_df.sort_values(by="distance", ascending=True)
-        .iloc[:RESULTS_TO_SHOW]
-        .reset_index(drop=True)
-    )
-
-    reply_text = (
-        f"<i>Here are the {RESULTS_TO_SHOW} hawker centres nearest to {selected_station_name.title()}"
-        f" ({selected_station_num}). Click on each link to open its location on Google Maps</i>\n\n"
-    )
-
+    record_result_count(len(lines))
     list_of_emojis = get_shuffled_emojis()
-    for idx, row in search_df.iterrows():
-        dist = round(row["distance"], 1)
-        hawker_name = row["hawker_name"]
-        gmaps_url = hawker_data_df.loc[hawker_name]["hawker_gmaps_url"]
-        reply_text += f"{list_of_emojis[idx]} ({dist} km) <a href='{gmaps_url}'>{hawker_name}</a>\n"
-        reply_text += append_closed_hawker_info(hawker_name)
+    reply_text = header + "".join(
+        f"{emoji} {line}" for emoji, line in zip(list_of_emojis, lines)
+    )
 
     query.edit_message_text(
         parse_mode=telegram.ParseMode.HTML,
@@ -282,24 +552,30 @@ def selected_mrt_station(update, context):
     )
 
 
+@measured
 def search_hawker_by_location_prompt(update, context):
     reply_text = "To list the hawker centres near you, simply send your location!"
     context.bot.send_message(chat_id=update.effective_chat.id, text=reply_text)
 
 
+@measured
+@logged_command
 def search_hawker_by_location(update, context):
-    log_command_pressed(update)
+    state = get_closure_state()
+    hawker_data_df = state.data.hawker_data_df
 
     user_location = update.message.location
-    user_coords = (user_location.latitude, user_location.longitude)
-
-    search_df = hawker_data_df.copy()
-
-    search_df["dist_from_user"] = search_df["hawker_coords"].apply(
-        lambda hc: geopy.distance.distance(hc, user_coords).km
+    # For /subscribe nearest
+    context.user_data["location"] = (user_location.latitude, user_location.longitude)
+    nearest_idx, nearest_dists = query_pool.run(
+        state.data,
+        nearest_hawkers,
+        user_location.latitude,
+        user_location.longitude,
+        RESULTS_TO_SHOW,
     )
 
-    search_df = search_df.sort_values(by="dist_from_user").iloc[:RESULTS_TO_SHOW]
+    record_result_count(len(nearest_idx))
 
     reply_text = (
         f"<i>Here are the top {RESULTS_TO_SHOW} hawker centres near you."
@@ -307,11 +583,12 @@ def search_hawker_by_location(update, context):
     )
 
     list_of_emojis = get_shuffled_emojis()
-    for idx, (hawker_name, row) in enumerate(search_df.iterrows()):
-        dist = round(row["dist_from_user"], 1)
-        gmaps_url = row["hawker_gmaps_url"]
+    for idx, (hawker_idx, dist) in enumerate(zip(nearest_idx, nearest_dists)):
+        hawker_name = hawker_data_df.index[hawker_idx]
+        dist = round(float(dist), 1)
+        gmaps_url = hawker_data_df.iloc[hawker_idx]["hawker_gmaps_url"]
         reply_text += f"{list_of_emojis[idx]} <a href='{gmaps_url}'>{hawker_name}</a> ({dist} km)\n"
-        reply_text += append_closed_hawker_info(hawker_name)
+        reply_text += append_closed_hawker_info(hawker_name, state)
 
     context.bot.send_message(
         chat_id=update.message.chat_id,
@@ -321,14 +598,261 @@ def search_hawker_by_location(update, context):
     )
 
 
-def list_hawker_cleaning(update, context):
-    log_command_pressed(update)
+def parse_nearby_args(args):
+    radius_km, hawker_filter = NEARBY_DEFAULT_KM, None
+    for arg in args:
+        arg = arg.lower()
+        if arg in NEARBY_FILTERS:
+            hawker_filter = arg
+            continue
+        try:
+            radius_km = float(arg[:-2] if arg.endswith("km") else arg)
+        except ValueError:
+            return None
+        if not 0 < radius_km <= NEARBY_MAX_KM:
+            return None
+    return radius_km, hawker_filter
+
+
+@measured
+@logged_command
+def search_hawker_by_radius(update, context):
+    state = get_closure_state()
+    hawker_data_df = state.data.hawker_data_df
+    chat_id = update.effective_chat.id
+
+    location = context.user_data.get("location")
+    nearby_args = parse_nearby_args(context.args)
+    if location is None or nearby_args is None:
+        reply_text = (
+            f"📍 Send me your location, then use <b>/nearby</b> followed by a distance of up to {NEARBY_MAX_KM} km to "
+            f"list the hawker centres within it, e.g. <b>/nearby 2</b>. Add <b>open</b> for only those open today, "
+            f"or <b>existing</b> to leave out those under construction or renovation."
+        )
+        context.bot.send_message(
+            chat_id=chat_id, text=reply_text, parse_mode=telegram.ParseMode.HTML
+        )
+        return
+
+    radius_km, hawker_filter = nearby_args
+    mask = state.filter_masks[hawker_filter] if hawker_filter is not None else None
+    within_idx, within_dists = query_pool.run(
+        state.data, hawkers_within, *location, radius_km, mask
+    )
+    record_result_count(len(within_idx))
+
+    reply_text = (
+        f"<i>There are {len(within_idx)} hawker centres"
+        f"{' ' + NEARBY_FILTERS[hawker_filter] if hawker_filter is not None else ''} "
+        f"within {radius_km:g} km of the location you last sent me"
+        f"{f', here are the nearest {RESULTS_TO_SHOW}' if len(within_idx) > RESULTS_TO_SHOW else ''}. "
+        "Click on each link to open its location</i>\n\n"
+    )
+
+    open_today = state.filter_masks["open"]
+    list_of_emojis = get_shuffled_emojis()
+    for emoji, hawker_idx, dist in zip(list_of_emojis, within_idx, within_dists):
+        hawker_name = hawker_data_df.index[hawker_idx]
+        gmaps_url = hawker_data_df.iloc[hawker_idx]["hawker_gmaps_url"]
+        reply_text += f"{emoji} <a href='{gmaps_url}'>{hawker_name}</a> ({round(float(dist), 1)} km)\n"
+        if not open_today[hawker_idx]:
+            reply_text += append_closed_hawker_info(hawker_name, state)
+
+    context.bot.send_message(
+        chat_id=chat_id,
+        parse_mode=telegram.ParseMode.HTML,
+        text=reply_text,
+        disable_web_page_preview=True,
+    )
+
+
+def subscriptions_reply(chat_id, state, notice=""):
+    hawker_names = subscription_store.subscriptions(chat_id)
+    reply_text = notice
+    if not hawker_names:
+        reply_text += (
+            "🔔 Use <b>/subscribe</b> followed by a search term to get a message when the hawker centre that best "
+            "matches it closes or opens again, or <b>/subscribe nearest</b> for the ones nearest to the location "
+            "you last sent me."
+        )
+    else:
+        reply_text += (
+            "<i>You will get a message when these hawker centres close or open again. Use /unsubscribe to stop "
+            "all of them, or /unsubscribe followed by a search term to stop one.</i>\n\n"
+        )
+        for hawker_name in hawker_names:
+            reply_text += f"🔔 {hawker_name}\n" + append_closed_hawker_info(
+                hawker_name, state
+            )
+
+    return dict(
+        text=reply_text,
+        parse_mode=telegram.ParseMode.HTML,
+        disable_web_page_preview=True,
+    )
+
+
+@measured
+@logged_command
+def subscribe(update, context):
+    state = get_closure_state()
+    chat_id = update.effective_chat.id
+    query = " ".join(context.args)
+
+    if query.lower() == "nearest":
+        location = context.user_data.get("location")
+        if location is None:
+            context.bot.send_message(
+                chat_id=chat_id,
+                text="Send me your location first, then try /subscribe nearest again.",
+            )
+            return
+        nearest_idx, _ = query_pool.run(
+            state.data, nearest_hawkers, *location, SUBSCRIBE_NEAREST
+        )
+        hawker_names = [state.data.hawker_data_df.index[i] for i in nearest_idx]
+    elif query:
+        search_results = query_pool.run(state.data, search_hawkers, query, 1)
+        hawker_names = [
+            name for name, score in search_results if score >= SUBSCRIBE_MIN_SCORE
+        ]
+        if not hawker_names:
+            record_result_count(0)
+            context.bot.send_message(
+                chat_id=chat_id,
+                text=f"Sorry, I couldn't find a hawker centre matching <b>{html.escape(query)}</b>.",
+                parse_mode=telegram.ParseMode.HTML,
+            )
+            return
+    else:
+        hawker_names = []
+
+    subscription_store.subscribe(chat_id, hawker_names)
+    record_result_count(len(hawker_names))
+    context.bot.send_message(chat_id=chat_id, **subscriptions_reply(chat_id, state))
+
+
+@measured
+@logged_command
+def unsubscribe(update, context):
+    state = get_closure_state()
+    chat_id = update.effective_chat.id
+    query = " ".join(context.args)
+
+    notice = ""
+    if query:
+        # The best match among the chat's own subscriptions, which need not be the best match of all
+        subscribed = set(subscription_store.subscriptions(chat_id))
+        search_results = query_pool.run(
+            state.data, search_hawkers, query, len(state.data.hawker_data_df)
+        )
+        hawker_names = [
+            name
+            for name, score in search_results
+            if name in subscribed and score >= SUBSCRIBE_MIN_SCORE
+        ][:1]
+        if hawker_names:
+            subscription_store.unsubscribe(chat_id, hawker_names)
+        else:
+            notice = f"Sorry, none of your hawker centres match <b>{html.escape(query)}</b>.\n\n"
+    else:
+        subscription_store.unsubscribe(chat_id)
+    context.bot.send_message(
+        chat_id=chat_id, **subscriptions_reply(chat_id, state, notice)
+    )
+
+
+def current_closures(state):
+    # What /closed shows for today, as an alert per hawker centre
+    washing_hawkers_df = state.washing_hawkers_df
+    closures = {
+        hawker_name: f"🧹 <b>{hawker_name}</b> is closed for cleaning from {start_date} to {end_date}"
+        for hawker_name, start_date, end_date in zip(
+            washing_hawkers_df.index,
+            washing_hawkers_df["start_date"],
+            washing_hawkers_df["end_date"],
+        )
+    }
+    for hawker_name in state.closed_hawkers:
+        hawker_status = state.data.hawker_data_df.loc[hawker_name]["hawker_status"]
+        closures[hawker_name] = f"🏗 <b>{hawker_name}</b> is closed ({hawker_status})"
+    return closures
+
+
+def closure_alerts(previous_closures, closures):
+    # New or changed closures, and the hawker centres that are no longer closed
+    alerts = {
+        hawker_name: text
+        for hawker_name, text in closures.items()
+        if previous_closures.get(hawker_name) != text
+    }
+    for hawker_name in previous_closures:
+        if hawker_name not in closures:
+            alerts[hawker_name] = f"✅ <b>{hawker_name}</b> is open again"
+    return alerts
+
+
+def send_closure_alerts(context):
+    state = get_closure_state()
+    today = state.date.isoformat()
+    alert_state = subscription_store.alert_state()
+    if alert_state is not None and alert_state["date"] == today:
+        if alert_state["done"]:
+            return
+        # An interrupted fan-out carries on after the last chat it got to
+    else:
+        closures = current_closures(state)
+        previous_closures = alert_state["closures"] if alert_state is not None else {}
+        alert_state = dict(
+            date=today,
+            closures=closures,
+            alerts=closure_alerts(previous_closures, closures),
+            after_chat_id=None,
+            done=False,
+        )
+        subscription_store.save_alert_state(alert_state)
+
+    alerts = alert_state["alerts"]
+    started = time.perf_counter()
+    num_chats = 0
+    # Streamed from the store in chat order, one message per chat however many of its hawker centres changed
+    for chat_id, hawker_names in subscription_store.subscribers(
+        sorted(alerts), alert_state["after_chat_id"]
+    ):
+        # The send queue paces the alerts; only so many of them wait in it at a time
+        context.bot.send_queue.wait_below(ALERT_MAX_QUEUED)
+        context.bot.send_message(
+            chat_id=chat_id,
+            text="\n".join(alerts[hawker_name] for hawker_name in hawker_names),
+            parse_mode=telegram.ParseMode.HTML,
+        )
+        num_chats += 1
+        if num_chats % ALERT_CHECKPOINT_INTERVAL == 0:
+            subscription_store.save_alert_state(
+                dict(alert_state, after_chat_id=chat_id)
+            )
+
+    subscription_store.save_alert_state(dict(alert_state, done=True))
+    log_event(
+        "closure_alerts",
+        f"Queued closure alerts about {len(alerts)} hawker centres for {num_chats} chats",
+        hawkers=len(alerts),
+        chats=num_chats,
+        duration_ms=round((time.perf_counter() - started) * 1000, 1),
+    )
+
+
+def hawker_cleaning_reply(update, state, washing_hawkers_df, period_text):
+    closed_hawkers = state.closed_hawkers
+    record_result_count(len(closed_hawkers) + len(washing_hawkers_df))
+    hawker_data_df = state.data.hawker_data_df
 
     if len(closed_hawkers) + len(washing_hawkers_df) <= 0:
-        reply_text = "No hawkers are closed today!"
+        reply_text = f"No hawkers are closed {period_text}!"
     else:
-        formatted_date = get_date_today_str("%d/%m/%Y")
-        reply_text = f"<i>The following hawker centres are closed today ({formatted_date}):</i>\n\n"
+        reply_text = (
+            f"<i>The following hawker centres are closed {period_text}:</i>\n\n"
+        )
 
         if len(washing_hawkers_df) > 0:
             reply_text += "<b>🧹 Hawkers cleaning:</b>\n"
@@ -345,40 +869,608 @@ def list_hawker_cleaning(update, context):
                 status = hawker_data_df.loc[h_name]["hawker_status"]
                 reply_text += f"{idx + 1}) {h_name} ({status})\n"
 
-    context.bot.send_message(
-        chat_id=update.message.chat_id,
-        parse_mode=telegram.ParseMode.HTML,
+    return dict(
         text=reply_text,
+        parse_mode=telegram.ParseMode.HTML,
         disable_web_page_preview=True,
     )
 
 
-def get_json_data_from_url(url):
-    response = requests.get(url)
-    if response.status_code == 200:
-        return response.json()
+def closed_today_reply(update):
+    state = get_closure_state()
+    formatted_date = get_date_today_str("%d/%m/%Y")
+    return hawker_cleaning_reply(
+        update, state, state.washing_hawkers_df, f"today ({formatted_date})"
+    )
+
+
+def closed_weeks_reply(update, start_week, end_week):
+    state = get_closure_state()
+    start_date, end_date = get_date_range_in_weeks(start_week, end_week)
+    period_text = (
+        f"from {start_date.strftime('%d/%m/%Y')} to {end_date.strftime('%d/%m/%Y')}"
+    )
+    washing_hawkers_df = hawkers_washing_between(state.data, start_date, end_date)
+    return hawker_cleaning_reply(update, state, washing_hawkers_df, period_text)
+
+
+def closed_this_week_reply(update):
+    return closed_weeks_reply(update, start_week=0, end_week=1)
+
+
+def closed_next_week_reply(update):
+    return closed_weeks_reply(update, start_week=1, end_week=2)
+
+
+@measured
+@logged_command
+def list_hawker_cleaning(update, context):
+    context.bot.send_message(
+        chat_id=update.effective_chat.id, **closed_today_reply(update)
+    )
+
+
+@measured
+@logged_command
+def list_hawker_cleaning_this_week(update, context):
+    context.bot.send_message(
+        chat_id=update.effective_chat.id, **closed_this_week_reply(update)
+    )
+
+
+@measured
+@logged_command
+def list_hawker_cleaning_next_week(update, context):
+    context.bot.send_message(
+        chat_id=update.effective_chat.id, **closed_next_week_reply(update)
+    )
+
+
+def midnight_rollover(context):
+    data_ready.wait()
+    state = refresh_closure_state()
+    logging.info(f"Today's date: {get_date_today_str()}")
+    logging.info(f"Number of hawkers washing today: {len(state.washing_hawkers_df)}")
+    logging.info(f"Number of hawkers closed today: {len(state.closed_hawkers)}")
+
+
+def fetch_if_changed(fetcher):
+    try:
+        return fetcher.fetch()
+    # Includes the exceptions of requests
+    except OSError as e:
+        logging.warning(
+            f"Failed to fetch {fetcher.url}, keeping the last good copy: {e}"
+        )
+        return None
+
+
+def parse_data(hawker_data_content, mrt_index_content):
+    # Same form as a loaded snapshot: what build_hawker_data takes
+    return (
+        prepare_hawker_data_df(json.loads(hawker_data_content)),
+        load_mrt_index(mrt_index_content),
+        {
+            "hawker_data": checksum_bytes(hawker_data_content),
+            "mrt_index": checksum_bytes(mrt_index_content),
+        },
+    )
+
+
+def load_bundled_data():
+    with open(os.path.join(BUNDLED_DATA_DIR, HAWKER_DATA_FILE), "rb") as f:
+        hawker_data_content = f.read()
+    with open(os.path.join(BUNDLED_DATA_DIR, MRT_INDEX_FILE), "rb") as f:
+        mrt_index_content = f.read()
+    return hawker_data_content, mrt_index_content
+
+
+def bundled_checksums():
+    # The source checksums of the bundled files, as parse_data gives them, or None without them
+    try:
+        return {
+            "hawker_data": checksum_file(
+                os.path.join(BUNDLED_DATA_DIR, HAWKER_DATA_FILE)
+            ),
+            "mrt_index": checksum_file(os.path.join(BUNDLED_DATA_DIR, MRT_INDEX_FILE)),
+        }
+    except OSError:
+        return None
+
+
+def load_network_data():
+    return hawker_data_fetcher.fetch(), mrt_index_fetcher.fetch()
+
+
+def save_to_cache(data):
+    try:
+        save_snapshot(
+            CACHE_DIR,
+            data.hawker_data_df,
+            data.mrt_index,
+            data.source_checksums,
+            bundled_checksums(),
+        )
+    except OSError as e:
+        logging.warning(f"Failed to write data cache: {e}")
+
+
+def load_initial_data():
+    # Returns the parsed sources and whether they came from the cache, or None if there is no data at all
+    cached = load_snapshot(CACHE_DIR, bundled_checksums=bundled_checksums())
+    if cached is not None:
+        logging.info(f"Loaded data from cache in {CACHE_DIR}")
+        return cached, True
+
+    for source, load in (
+        ("bundled data", load_bundled_data),
+        ("network", load_network_data),
+    ):
+        try:
+            sources = parse_data(*load())
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Failed to load data from {source}: {e}")
+            continue
+
+        logging.info(f"Loaded data from {source}")
+        return sources, False
+
+    return None
+
+
+@contextmanager
+def startup_stage(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration_ms = (time.perf_counter() - started) * 1000
+        log_event(
+            "startup",
+            f"Start-up stage {name} took {duration_ms:.0f} ms",
+            stage=name,
+            duration_ms=round(duration_ms, 1),
+        )
+
+
+def read_token():
+    token = os.environ.get("TELEGRAM_BOT_TOKEN")
+    if token is None:
+        with open("token.txt", "r") as f:
+            token = f.read()
+    return token.strip()
+
+
+def load_data():
+    global hawker_data, closure_state, hawker_data_fetcher, mrt_index_fetcher
+
+    # Runs on its own thread at start-up, while the bot is set up and connects to Telegram
+    hawker_data_fetcher = ConditionalFetcher(HAWKER_DATA_URL)
+    mrt_index_fetcher = ConditionalFetcher(MRT_INDEX_URL)
+    with startup_stage("data load"), timed(data_refresh_seconds, "startup"):
+        loaded = load_initial_data()
+    if loaded is None:
+        return
+    sources, from_cache = loaded
+
+    with startup_stage("index build"):
+        data = build_hawker_data(*sources)
+        state = compute_closure_state(data, get_date_today().date())
+    # The query processes read the data from the cache, so it is written before the data is served
+    if not from_cache:
+        save_to_cache(data)
+    hawker_data = data
+    closure_state = state
+    data_ready.set()
+
+    # Content that is already loaded is not downloaded and parsed again by the first reload
+    hawker_data_fetcher.checksum = data.source_checksums["hawker_data"]
+    mrt_index_fetcher.checksum = data.source_checksums["mrt_index"]
+    logging.info(
+        f"Loaded {len(data.hawker_data_df)} hawkers, {len(data.mrt_station_positions)} stations, "
+        f"{len(data.cleaning_schedule)} cleaning windows; {len(state.washing_hawkers_df)} hawkers washing "
+        f"and {len(state.closed_hawkers)} closed today"
+    )
+
+
+def reload_data(context):
+    global hawker_data, closure_state
+
+    data_ready.wait()
+
+    with timed(data_refresh_seconds, "fetch"):
+        hawker_data_content = fetch_if_changed(hawker_data_fetcher)
+        mrt_index_content = fetch_if_changed(mrt_index_fetcher)
+    if hawker_data_content is None and mrt_index_content is None:
+        return
+
+    # Runs on the job queue's thread; handlers keep using the current snapshot until the swap below
+    current_data = hawker_data
+    source_checksums = dict(current_data.source_checksums)
+    try:
+        with timed(data_refresh_seconds, "parse"):
+            if hawker_data_content is None:
+                hawker_data_df = current_data.hawker_data_df
+            else:
+                hawker_data_df = prepare_hawker_data_df(json.loads(hawker_data_content))
+                source_checksums["hawker_data"] = checksum_bytes(hawker_data_content)
+
+            if mrt_index_content is None:
+                mrt_index = current_data.mrt_index
+            else:
+                mrt_index = load_mrt_index(mrt_index_content)
+                source_checksums["mrt_index"] = checksum_bytes(mrt_index_content)
+
+            new_data = build_hawker_data(hawker_data_df, mrt_index, source_checksums)
+        # Built before anything is swapped in, so that data the bot cannot serve from is never live
+        with timed(data_refresh_seconds, "closure_state"):
+            new_state = compute_closure_state(new_data, get_date_today().date())
+    except Exception:
+        logging.exception("Failed to load new data, keeping the current data")
+        # Forget the validators so that the same content is downloaded and tried again
+        hawker_data_fetcher.reset()
+        mrt_index_fetcher.reset()
+        return
+
+    # Written before it is served, for the query processes to read
+    save_to_cache(new_data)
+    # Data first: a handler in between sees a state for other data and builds one for the new data itself
+    hawker_data = new_data
+    closure_state = new_state
+    logging.info(
+        f"Reloaded data: {len(hawker_data_df)} hawkers, {len(new_data.mrt_station_positions)} stations, "
+        f"{len(new_state.washing_hawkers_df)} hawkers washing today"
+    )
+
+
+def flush_persistence(context):
+    # Changes are written in batches; the updater also flushes on shutdown
+    user_persistence.flush()
+
+
+def direct_webhook_reply(update):
+    # Picks the handler the same way the dispatcher would: the first match in the default group
+    for handler in dispatcher.handlers[0]:
+        check = handler.check_update(update)
+        if check is not None and check is not False:
+            break
     else:
-        sys.exit(-1)
+        return None
+
+    reply_function = DIRECT_REPLIES.get(handler.callback)
+    if reply_function is None:
+        return None
+    # A reply in the webhook response cannot be delayed, so it only goes out while the rate limits allow it
+    if not bot.send_limiter.try_acquire(update.effective_chat.id):
+        return None
+    return dict(
+        method="sendMessage", chat_id=update.effective_chat.id, **reply_function(update)
+    )
+
+
+def handle_webhook_updates(updates):
+    decoded_updates = [telegram.Update.de_json(u, bot) for u in updates]
+
+    # Only one method fits in the response, so a batch is always dispatched as usual
+    if len(decoded_updates) == 1:
+        reply = direct_webhook_reply(decoded_updates[0])
+        if reply is not None:
+            return reply
+
+    for update in decoded_updates:
+        updater.update_queue.put(update)
+    return None
+
+
+def start_webhook():
+    webhook_server = WebhookServer(
+        WEBHOOK_LISTEN,
+        WEBHOOK_PORT,
+        urlparse(WEBHOOK_URL).path,
+        WEBHOOK_SECRET_TOKEN,
+        handle_webhook_updates,
+    )
+    try:
+        webhook_server.start()
+    except (OSError, TimeoutError):
+        logging.exception("Failed to start the webhook server")
+        raise
+
+    # This version of set_webhook does not take the secret token as an argument yet
+    bot.set_webhook(url=WEBHOOK_URL, api_kwargs={"secret_token": WEBHOOK_SECRET_TOKEN})
+    updater.job_queue.start()
+    dispatcher_ready = threading.Event()
+    threading.Thread(
+        target=dispatcher.start, name="dispatcher", kwargs={"ready": dispatcher_ready}
+    ).start()
+    dispatcher_ready.wait()
+
+    # Lets updater.idle() stop the job queue and dispatcher on SIGINT/SIGTERM, as it does when polling
+    updater.running = True
+    return webhook_server
+
+
+def stats_reply(update):
+    return dict(
+        text=f"<pre>{html.escape(format_stats())}</pre>",
+        parse_mode=telegram.ParseMode.HTML,
+        disable_web_page_preview=True,
+    )
+
+
+@measured
+@logged_command
+def get_stats(update, context):
+    # Only registered for the admins; anyone else gets the unknown command reply
+    context.bot.send_message(chat_id=update.effective_chat.id, **stats_reply(update))
 
 
+# The jobs are given trigger instances rather than the aliases run_once, run_daily and run_repeating pass. The
+# scheduler resolves an alias through pkg_resources entry points on first use, which checks the requirements of every
+# installed distribution and takes a few hundred ms.
+def run_after(job_queue, callback, seconds, context=None):
+    run_date = datetime.now(pytz.utc) + timedelta(seconds=seconds)
+    trigger = DateTrigger(run_date=run_date, timezone=pytz.utc)
+    return job_queue.run_custom(callback, {"trigger": trigger}, context=context)
+
+
+def run_daily_at(job_queue, callback, at: dt_time):
+    trigger = CronTrigger(
+        hour=at.hour, minute=at.minute, second=at.second, timezone=at.tzinfo
+    )
+    return job_queue.run_custom(callback, {"trigger": trigger})
+
+
+def run_every(job_queue, callback, interval, first):
+    start_date = datetime.now(pytz.utc) + timedelta(seconds=first)
+    trigger = IntervalTrigger(
+        seconds=interval, start_date=start_date, timezone=pytz.utc
+    )
+    return job_queue.run_custom(callback, {"trigger": trigger})
+
+
+def create_updater(token):
+    bot = RateLimitedBot(
+        token=token,
+        base_url=TELEGRAM_BOT_API_URL,
+        # A connection per update worker and send worker, kept alive, plus a few for polling and jobs
+        request=Request(con_pool_size=UPDATE_WORKERS + SEND_WORKERS + 4),
+        defaults=Defaults(run_async=True),
+        send_limiter=SendLimiter(),
+        send_workers=SEND_WORKERS,
+    )
+
+    user_persistence = SQLitePersistence(
+        os.path.join(PERSISTENCE_DIR, "user_persistence.sqlite3")
+    )
+    # Earlier versions kept everything in one pickle file
+    legacy_persistence_file = os.path.join(PERSISTENCE_DIR, "user_persistence")
+    if os.path.exists(legacy_persistence_file):
+        user_persistence.migrate_from_pickle(legacy_persistence_file)
+
+    updater = Updater(
+        bot=bot,
+        workers=UPDATE_WORKERS,
+        use_context=True,
+        persistence=user_persistence,
+    )
+    dispatcher = updater.dispatcher
+
+    # Local midnight, as get_date_today() uses the server's local date. The job queue only takes pytz timezones.
+    local_utc_offset = datetime.now().astimezone().utcoffset()
+    local_timezone = pytz.FixedOffset(int(local_utc_offset.total_seconds() // 60))
+    run_daily_at(
+        updater.job_queue, midnight_rollover, dt_time(0, 0, tzinfo=local_timezone)
+    )
+    run_daily_at(
+        updater.job_queue,
+        send_closure_alerts,
+        CLOSURE_ALERT_TIME.replace(tzinfo=local_timezone),
+    )
+    if datetime.now().time() >= CLOSURE_ALERT_TIME:
+        # Today's alerts may not have gone out, or not to everyone, before a restart
+        run_after(updater.job_queue, send_closure_alerts, 60)
+    # The first reload runs shortly after start-up to catch up if we started from the cache or bundled data
+    run_every(updater.job_queue, reload_data, DATA_RELOAD_INTERVAL, first=60)
+    run_every(
+        updater.job_queue,
+        flush_persistence,
+        PERSISTENCE_FLUSH_INTERVAL,
+        first=PERSISTENCE_FLUSH_INTERVAL,
+    )
+
+    dispatcher.add_handler(CommandHandler("start", start))
+    dispatcher.add_handler(CommandHandler("closed", list_hawker_cleaning))
+    dispatcher.add_handler(
+        CommandHandler("closed_this_week", list_hawker_cleaning_this_week)
+    )
+    dispatcher.add_handler(
+        CommandHandler("closed_next_week", list_hawker_cleaning_next_week)
+    )
+    dispatcher.add_handler(CommandHandler("search", search_hawker_by_name))
+    dispatcher.add_handler(CommandHandler("subscribe", subscribe))
+    dispatcher.add_handler(CommandHandler("unsubscribe", unsubscribe))
+    dispatcher.add_handler(CommandHandler("info", get_info))
+    dispatcher.add_handler(
+        CommandHandler("stats", get_stats, filters=Filters.user(user_id=ADMIN_USER_IDS))
+    )
+
+    mrt_conv_handler = ConversationHandler(
+        entry_points=[CommandHandler("mrt", search_hawker_by_mrt)],
+        states={
+            MRT_FIRST: [telegram.ext.CallbackQueryHandler(selected_mrt_station_letter)],
+            MRT_SECOND: [telegram.ext.CallbackQueryHandler(selected_mrt_station)],
+        },
+        per_message=False,
+        fallbacks=[CommandHandler("mrt", search_hawker_by_mrt)],
+    )
+    dispatcher.add_handler(mrt_conv_handler)
+    dispatcher.add_handler(CommandHandler("route", search_hawker_by_route))
+
+    dispatcher.add_handler(CommandHandler("nearest", search_hawker_by_location_prompt))
+    dispatcher.add_handler(CommandHandler("nearby", search_hawker_by_radius))
+    location_handler = MessageHandler(
+        Filters.location & (~Filters.command), search_hawker_by_location
+    )
+    dispatcher.add_handler(location_handler)
+
+    sticker_handler = MessageHandler(
+        Filters.sticker & (~Filters.command), handle_stickers
+    )
+    dispatcher.add_handler(sticker_handler)
+
+    random_text_handler = MessageHandler(Filters.text & (~Filters.command), start)
+    dispatcher.add_handler(random_text_handler)
+
+    dispatcher.add_handler(telegram.ext.InlineQueryHandler(inline_search))
+
+    # Must be added last
+    unknown_handler = MessageHandler(Filters.command, unknown)
+    dispatcher.add_handler(unknown_handler)
+    return updater
+
+
+@measured
 def handle_stickers(update, context):
     context.bot.send_message(
         chat_id=update.effective_chat.id, text=update.message.sticker.emoji
     )
 
 
+@measured
+@logged_command
 def unknown(update, context):
-    log_command_pressed(update)
-
     context.bot.send_message(
         chat_id=update.effective_chat.id,
         text="Sorry, I didn't understand that. Try /start to see a list of instructions.",
     )
 
 
+ClosureState = namedtuple(
+    "ClosureState",
+    [
+        "date",
+        "data",
+        "washing_hawkers_df",
+        "closed_hawkers",
+        "filter_masks",
+        "mrt_render",
+    ],
+)
+MrtRender = namedtuple(
+    "MrtRender", ["letter_keyboard", "station_keyboards", "station_replies"]
+)
+
+# Set up by main when it is run; handlers wait for data_ready
+hawker_data = None
+closure_state = None
+data_ready = threading.Event()
+hawker_data_fetcher = None
+mrt_index_fetcher = None
+# Queries run in the handler threads unless main starts query processes
+query_pool = QueryPool(0)
+subscription_store = None
+updater = None
+bot = None
+dispatcher = None
+user_persistence = None
+# Conversation states of /mrt
+MRT_FIRST, MRT_SECOND = range(2)
 RESULTS_TO_SHOW = 10
+# /nearby [km] [filter], around the user's last location
+NEARBY_DEFAULT_KM = 1.0
+NEARBY_MAX_KM = 10
+NEARBY_FILTERS = {
+    "open": "open today",
+    "existing": "not under construction or renovation",
+}
+# /route <station> to <station> [km]
+ROUTE_QUERY_PATTERN = re.compile(
+    r"(.+?)\s+to\s+(.+?)(?:\s+(?:within\s+)?(\d+(?:\.\d+)?)\s*(?:km)?)?", re.IGNORECASE
+)
+# Inline queries come in on every keystroke; one that is not cached is searched once no newer query from the same
+# user has come in for this long
+INLINE_DEBOUNCE_SECONDS = 0.3
+# Rendered inline results, by data version, date and normalised query
+INLINE_CACHE_SIZE = 4096
+INLINE_CACHE_TTL = 300  # seconds
+# Per user, for debouncing and to continue from the previous search
+INLINE_USERS = 10000
+INLINE_SEARCH_STATES = 1000
+INLINE_SEARCH_STATE_TTL = 60  # seconds
+inline_results_cache = LRUCache(INLINE_CACHE_SIZE, INLINE_CACHE_TTL)
+latest_inline_queries = LRUCache(INLINE_USERS)
+inline_search_states = LRUCache(INLINE_SEARCH_STATES, INLINE_SEARCH_STATE_TTL)
+# From the start of main to serving with the data loaded, imports excluded
+STARTUP_BUDGET_MS = 2000
+SEARCH_LATENCY_BUDGET_MS = 5
+# The data files bundled in the repository, which the update workflow refreshes, are reloaded from it
+DATA_DIR = "data"
+HAWKER_DATA_FILE = "hawker_data.json"
+MRT_INDEX_FILE = "mrt_hawker_topk.npz"
+REPO_CONTENT_URL = "https://raw.githubusercontent.com/darensin01/SGHawkerBot/main"
+HAWKER_DATA_URL = f"{REPO_CONTENT_URL}/{DATA_DIR}/{HAWKER_DATA_FILE}"
+MRT_INDEX_URL = f"{REPO_CONTENT_URL}/{DATA_DIR}/{MRT_INDEX_FILE}"
+DATA_RELOAD_INTERVAL = 60 * 60  # seconds
+CACHE_DIR = "./cache"
+BUNDLED_DATA_DIR = os.path.join(".", DATA_DIR)
 LOGS_DIR = "./logs"
 PERSISTENCE_DIR = "./persistence"
+PERSISTENCE_FLUSH_INTERVAL = 30  # seconds
+# The log file is rolled over at midnight and when it reaches LOG_MAX_BYTES
+LOG_MAX_BYTES = 50 * 1024 * 1024
+LOG_BACKUP_COUNT = 30
+# Share of per-command records that are logged; slow and failed commands always are
+COMMAND_LOG_SAMPLE_RATE = float(os.environ.get("COMMAND_LOG_SAMPLE_RATE", "1.0"))
+# Updates are handled concurrently by this many worker threads, so a slow send only holds up its own chat
+UPDATE_WORKERS = int(os.environ.get("UPDATE_WORKERS", "16"))
+# Threads sending the queued messages and edits, and so the most sends in flight at a time
+SEND_WORKERS = 8
+# Fire-and-forget methods, which are queued per chat; the bot returns True for them rather than the sent message
+QUEUED_METHODS = frozenset(
+    {
+        "sendMessage",
+        "editMessageText",
+        "editMessageReplyMarkup",
+        "sendLocation",
+        "sendVenue",
+    }
+)
+# On shutdown, queued sends get this long to go out
+SEND_QUEUE_DRAIN_TIMEOUT = 5  # seconds
+# e.g. a local Bot API server
+TELEGRAM_BOT_API_URL = os.environ.get("TELEGRAM_BOT_API_URL")
+# Updates are received through a webhook instead of long polling when this is set, e.g.
+# https://example.com/sghawkerbot behind a reverse proxy that terminates TLS and forwards to WEBHOOK_PORT
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL")
+# Searches and location queries run in this many processes, to use more than one core; 0 runs them in the
+# handler threads
+QUERY_PROCESSES = int(os.environ.get("QUERY_PROCESSES", "0"))
+# Prometheus metrics are served on http://METRICS_LISTEN:METRICS_PORT/metrics when METRICS_PORT is set, e.g. to 9464
+METRICS_LISTEN = os.environ.get("METRICS_LISTEN", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))
+# /subscribe nearest subscribes to this many hawker centres nearest to the user's last location
+SUBSCRIBE_NEAREST = 3
+# Search score a hawker centre needs to be (un)subscribed to by a search term. Below it, the term at best shares a
+# common word ("food", "blk") with the hawker centre, or only looks a little like its name.
+SUBSCRIBE_MIN_SCORE = 7.0
+# Local time of the daily closure alerts to subscribers
+CLOSURE_ALERT_TIME = dt_time(7, 0)
+# Alerts waiting in the send queue at a time during the fan-out, and how often the fan-out records how far it got
+ALERT_MAX_QUEUED = 1000
+ALERT_CHECKPOINT_INTERVAL = 1000
+# Comma-separated Telegram user ids allowed to use /stats
+ADMIN_USER_IDS = [
+    int(user_id)
+    for user_id in os.environ.get("ADMIN_USER_IDS", "").split(",")
+    if user_id.strip()
+]
+WEBHOOK_LISTEN = os.environ.get("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.environ.get("WEBHOOK_PORT", "8443"))
+# Telegram sends it back with every update; a new one is registered on each start if it is not set
+WEBHOOK_SECRET_TOKEN = os.environ.get("WEBHOOK_SECRET_TOKEN") or secrets.token_urlsafe(
+    32
+)
 EMOJIS = [
     "🍲",  # pot of food
     "🥗",  # salad
@@ -392,94 +1484,76 @@ EMOJIS = [
     "🍚",  # cooked rice
 ]
 
-if not os.path.isdir(LOGS_DIR):
-    os.mkdir(LOGS_DIR)
-
-if not os.path.isdir(PERSISTENCE_DIR):
-    os.mkdir(PERSISTENCE_DIR)
-
-logging.basicConfig(
-    filename=os.path.join(LOGS_DIR, "{}.log".format(get_date_today_str("%d%m%Y"))),
-    filemode="a",
-    datefmt="%H:%M:%S",
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    level=logging.INFO,
-)
-logging.getLogger().addHandler(logging.StreamHandler(sys.stdout))
-logging.info(f"Today's date: {get_date_today_str()}")
-
-# Data preparation section
-with open("token.txt", "r") as f:
-    token = f.read()
-
-hawker_mrt_dist_json = get_json_data_from_url(
-    "https://raw.githubusercontent.com/darensin01/SGHawkerBot/main"
-    "/mrt_hawker_distances.json"
-)
-hawker_mrt_dist_df = pd.DataFrame.from_records(hawker_mrt_dist_json)
-logging.info(f"Number of entries in MRT hawker distance DF: {len(hawker_mrt_dist_df)}")
-
-hawker_data_json = get_json_data_from_url(
-    "https://raw.githubusercontent.com/darensin01/SGHawkerBot/main/hawker_data" ".json"
-)
-hawker_data_df = pd.DataFrame.from_records(hawker_data_json)
-hawker_data_df["not_existing"] = hawker_data_df["hawker_status"].apply(
-    lambda s: "existing" not in s.lower()
-)
-hawker_data_df = hawker_data_df.set_index("hawker_name")
-logging.info(f"Number of entries in hawker information DF: {len(hawker_data_df)}")
-
-for c in ["q1_start", "q1_end", "q2_start", "q2_end", "q3_start", "q3_end", "q4_end"]:
-    hawker_data_df[c] = hawker_data_df[c].apply(
-        lambda d: datetime.strptime(d, "%d/%m/%Y")
-    )
-
-washing_hawkers_df = hawkers_washing_today()
-closed_hawkers = hawkers_not_existing()
-logging.info(f"Number of hawkers washing today: {len(washing_hawkers_df)}")
-logging.info(f"Number of hawkers closed today: {len(closed_hawkers)}")
-
-# Start of handler/dispatcher code
-bot = telegram.Bot(token=token)
-
-user_persistence = PicklePersistence(
-    filename=os.path.join(PERSISTENCE_DIR, "user_persistence")
-)
-
-updater = Updater(token=token, use_context=True, persistence=user_persistence)
-dispatcher = updater.dispatcher
-dispatcher.add_handler(CommandHandler("start", start))
-dispatcher.add_handler(CommandHandler("closed", list_hawker_cleaning))
-dispatcher.add_handler(CommandHandler("search", search_hawker_by_name))
-dispatcher.add_handler(CommandHandler("info", get_info))
-
-MRT_FIRST, MRT_SECOND = range(2)
-mrt_conv_handler = ConversationHandler(
-    entry_points=[CommandHandler("mrt", search_hawker_by_mrt)],
-    states={
-        MRT_FIRST: [telegram.ext.CallbackQueryHandler(selected_mrt_station_letter)],
-        MRT_SECOND: [telegram.ext.CallbackQueryHandler(selected_mrt_station)],
-    },
-    per_message=False,
-    fallbacks=[CommandHandler("mrt", search_hawker_by_mrt)],
-)
-dispatcher.add_handler(mrt_conv_handler)
-
-dispatcher.add_handler(CommandHandler("nearest", search_hawker_by_location_prompt))
-location_handler = MessageHandler(
-    Filters.location & (~Filters.command), search_hawker_by_location
-)
-dispatcher.add_handler(location_handler)
-
-sticker_handler = MessageHandler(Filters.sticker & (~Filters.command), handle_stickers)
-dispatcher.add_handler(sticker_handler)
-
-random_text_handler = MessageHandler(Filters.text & (~Filters.command), start)
-dispatcher.add_handler(random_text_handler)
-
-# Must be added last
-unknown_handler = MessageHandler(Filters.command, unknown)
-dispatcher.add_handler(unknown_handler)
+# Simple commands whose reply can be sent in the webhook response, without a call to the Bot API
+DIRECT_REPLIES = {
+    start: measured(logged_command(start_reply)),
+    get_info: measured(logged_command(info_reply)),
+    list_hawker_cleaning: measured(logged_command(closed_today_reply)),
+    list_hawker_cleaning_this_week: measured(logged_command(closed_this_week_reply)),
+    list_hawker_cleaning_next_week: measured(logged_command(closed_next_week_reply)),
+}
+
+# Importing this module only defines the handlers; the bot is set up and started when it is run
+if __name__ == "__main__":
+    started = time.perf_counter()
+    with startup_stage("config"):
+        if not os.path.isdir(LOGS_DIR):
+            os.mkdir(LOGS_DIR)
+
+        if not os.path.isdir(PERSISTENCE_DIR):
+            os.mkdir(PERSISTENCE_DIR)
+
+        setup_logging(
+            os.path.join(LOGS_DIR, "sghawkerbot.log"), LOG_MAX_BYTES, LOG_BACKUP_COUNT
+        )
+        set_sample_rate("command", COMMAND_LOG_SAMPLE_RATE)
+        logging.info(f"Today's date: {get_date_today_str()}")
+        token = read_token()
+        query_pool = QueryPool(QUERY_PROCESSES, CACHE_DIR)
+        if QUERY_PROCESSES > 0:
+            query_pool.start()
+        subscription_store = SubscriptionStore(
+            os.path.join(PERSISTENCE_DIR, "subscriptions.sqlite3")
+        )
 
-updater.start_polling()
-updater.idle()
+    # Handlers that need the data wait for it, so the bot can already start taking in updates
+    data_loader = threading.Thread(target=load_data, name="data_loader")
+    data_loader.start()
+
+    with startup_stage("updater"):
+        updater = create_updater(token)
+        bot = updater.bot
+        dispatcher = updater.dispatcher
+        user_persistence = updater.persistence
+
+    with startup_stage("serve"):
+        metrics_server = (
+            start_metrics_server(METRICS_LISTEN, METRICS_PORT)
+            if METRICS_PORT > 0
+            else None
+        )
+        if WEBHOOK_URL is None:
+            updater.start_polling()
+            webhook_server = None
+        else:
+            webhook_server = start_webhook()
+
+    data_loader.join()
+    if hawker_data is not None:
+        startup_ms = (time.perf_counter() - started) * 1000
+        logging.info(f"Started in {startup_ms:.0f} ms")
+        if startup_ms > STARTUP_BUDGET_MS:
+            logging.warning(f"Start-up took longer than {STARTUP_BUDGET_MS} ms")
+        updater.idle()
+    else:
+        logging.error("No data source available")
+        updater.stop()
+
+    if webhook_server is not None:
+        webhook_server.stop()
+    bot.send_queue.close(SEND_QUEUE_DRAIN_TIMEOUT)
+    query_pool.close()
+    if metrics_server is not None:
+        metrics_server.shutdown()
+    if hawker_data is None:
+        sys.exit(-1)
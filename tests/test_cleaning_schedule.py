@@ -0,0 +1,107 @@
+import json
+import os
+from datetime import date, timedelta
+import pandas as pd
+import pytest
+from utils.cleaning_schedule import CleaningSchedule
+from utils.hawker_data import prepare_hawker_data_df
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def record(name, *windows):
+    # One window per quarter, (start, end) as the data.gov.sg records write them; quarters not given are TBC
+    windows = list(windows) + [('TBC', 'TBC')] * (4 - len(windows))
+    dates = {}
+    for quarter, (start, end) in enumerate(windows, start=1):
+        dates[f'q{quarter}_start'], dates[f'q{quarter}_end'] = start, end
+    return dict(hawker_name=name, hawker_status='Existing', **dates)
+
+
+SYNTHETIC = [
+    record('One Window', ('5/2/2024', '8/2/2024')),
+    # Two windows in the same week, and a later one in the same month
+    record('Two Windows', ('4/3/2024', '5/3/2024'), ('7/3/2024', '9/3/2024'), ('25/3/2024', '26/3/2024')),
+    # Windows across the end of a month and of a quarter
+    record('Across Months', ('30/1/2024', '2/2/2024'), ('29/3/2024', '3/4/2024')),
+    # Listed out of order, the later quarter's window first
+    record('Out Of Order', ('10/6/2024', '11/6/2024'), ('20/5/2024', '21/5/2024')),
+    record('All TBC'),
+    record('TBC Written As Date', ('14/1/1990', '14/1/1990'), ('12/2/2024', '13/2/2024')),
+    record('Half TBC', ('TBC', '8/2/2024'), ('6/2/2024', 'TBC'), ('1/7/2024', '2/7/2024')),
+    record('End Before Start', ('9/2/2024', '7/2/2024')),
+    record('Same Day', ('29/2/2024', '29/2/2024')),
+]
+
+
+def brute_force(df, start_date, end_date):
+    # Every scheduled window that overlaps the range, the earliest per hawker, as a plain filter over the quarters
+    start_date, end_date = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    windows = pd.concat([
+        df[[f'q{quarter}_start', f'q{quarter}_end']].set_axis(['start_date', 'end_date'], axis=1)
+        for quarter in range(1, 5)
+    ]).dropna()
+    windows = windows[(windows['start_date'] <= windows['end_date'])
+                      & (windows['start_date'] <= end_date) & (windows['end_date'] >= start_date)]
+    windows = windows.sort_values('start_date', kind='stable')
+    return windows[~windows.index.duplicated(keep='first')]
+
+
+def spans(year):
+    days = [date(year, 1, 1) + timedelta(days=i) for i in range(366)]
+    for day in days:
+        yield day, day
+    for monday in days[::7]:
+        yield monday, monday + timedelta(days=6)
+        yield monday + timedelta(days=7), monday + timedelta(days=13)
+    # Across the end of each month
+    for month in range(1, 13):
+        first = date(year, month, 1)
+        yield first - timedelta(days=3), first + timedelta(days=3)
+    yield date(year - 1, 12, 1), date(year + 1, 1, 31)
+
+
+def assert_same(schedule, df, start_date, end_date):
+    found = schedule.overlapping(start_date, end_date)
+    expected = brute_force(df, start_date, end_date)
+    assert list(found.index) == list(expected.index), (start_date, end_date)
+    assert (found['start_date'].to_numpy() == expected['start_date'].to_numpy()).all(), (start_date, end_date)
+    assert (found['end_date'].to_numpy() == expected['end_date'].to_numpy()).all(), (start_date, end_date)
+
+
+@pytest.fixture(scope='module')
+def synthetic():
+    df = prepare_hawker_data_df(SYNTHETIC)
+    return CleaningSchedule.from_hawker_df(df), df
+
+
+@pytest.fixture(scope='module')
+def bundled():
+    with open(os.path.join(REPO_DIR, 'data', 'hawker_data.json'), 'rb') as f:
+        df = prepare_hawker_data_df(json.loads(f.read()))
+    return CleaningSchedule.from_hawker_df(df), df
+
+
+def test_tbc_windows_are_left_out(synthetic):
+    schedule, df = synthetic
+    assert set(schedule.hawker_names) == set(df.index) - {'All TBC', 'End Before Start'}
+    assert list(schedule.hawker_names).count('Half TBC') == 1
+    assert list(schedule.hawker_names).count('TBC Written As Date') == 1
+
+
+def test_earliest_window_in_range(synthetic):
+    schedule, df = synthetic
+    week = schedule.overlapping(date(2024, 3, 4), date(2024, 3, 10))
+    assert week.loc['Two Windows', 'start_date'] == pd.Timestamp(2024, 3, 4)
+    month = schedule.overlapping(date(2024, 5, 1), date(2024, 6, 30))
+    assert month.loc['Out Of Order', 'start_date'] == pd.Timestamp(2024, 5, 20)
+    across = schedule.overlapping(date(2024, 4, 1), date(2024, 4, 7))
+    assert across.loc['Across Months', 'end_date'] == pd.Timestamp(2024, 4, 3)
+
+
+# The bundled data's windows are in 2021
+@pytest.mark.parametrize('data, year', [('synthetic', 2024), ('bundled', 2021)])
+def test_matches_brute_force(request, data, year):
+    schedule, df = request.getfixturevalue(data)
+    for start_date, end_date in spans(year):
+        assert_same(schedule, df, start_date, end_date)
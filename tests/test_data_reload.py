@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import requests
+import main
+from utils.data_fetcher import ConditionalFetcher
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+LAST_MODIFIED = 'Mon, 01 Jan 2024 00:00:00 GMT'
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    # Serves server.files, {path: (status, content)}, with an ETag and Last-Modified when server.validators is set,
+    # as raw.githubusercontent.com does
+    def do_GET(self):
+        self.server.requests.append((self.path, dict(self.headers)))
+        status, content = self.server.files[self.path]
+        etag = f'"{hashlib.sha256(content).hexdigest()[:16]}"'
+        if status == 200 and self.server.validators and self.headers.get('If-None-Match') == etag:
+            status, content = 304, b''
+        self.send_response(status)
+        if status == 200 and self.server.validators:
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', LAST_MODIFIED)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    server.files, server.requests, server.validators = {}, [], True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def read_bundled(name):
+    with open(os.path.join(DATA_DIR, name), 'rb') as f:
+        return f.read()
+
+
+def test_fetcher_revalidates(server):
+    server.files['/data.json'] = (200, b'[1]')
+    fetcher = ConditionalFetcher(server.url + '/data.json')
+
+    assert fetcher.fetch() == b'[1]'
+    # Not modified: the server answers 304 to the validators of the last fetch
+    assert fetcher.fetch() is None
+    assert server.requests[-1][1]['If-None-Match'] == fetcher.etag
+    assert server.requests[-1][1]['If-Modified-Since'] == LAST_MODIFIED
+
+    server.files['/data.json'] = (200, b'[2]')
+    assert fetcher.fetch() == b'[2]'
+
+    server.files['/data.json'] = (500, b'')
+    with pytest.raises(requests.HTTPError):
+        fetcher.fetch()
+    # The validators of the last good fetch are kept
+    server.files['/data.json'] = (200, b'[2]')
+    assert fetcher.fetch() is None
+
+
+def test_fetcher_without_validators_compares_content(server):
+    server.validators = False
+    server.files['/data.json'] = (200, b'[1]')
+    fetcher = ConditionalFetcher(server.url + '/data.json')
+
+    assert fetcher.fetch() == b'[1]'
+    assert fetcher.fetch() is None
+    assert 'If-None-Match' not in server.requests[-1][1]
+    server.files['/data.json'] = (200, b'[2]')
+    assert fetcher.fetch() == b'[2]'
+
+
+@pytest.fixture
+def bot_data(server, tmp_path, monkeypatch):
+    # The bot as main sets it up, started from the bundled files, with the stand-in in place of GitHub
+    for name in ('hawker_data', 'closure_state', 'hawker_data_fetcher', 'mrt_index_fetcher'):
+        monkeypatch.setattr(main, name, None)
+    monkeypatch.setattr(main, 'data_ready', threading.Event())
+    monkeypatch.setattr(main, 'CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(main, 'BUNDLED_DATA_DIR', DATA_DIR)
+    monkeypatch.setattr(main, 'HAWKER_DATA_URL', server.url + '/hawker_data.json')
+    monkeypatch.setattr(main, 'MRT_INDEX_URL', server.url + '/mrt_hawker_topk.npz')
+    server.files['/hawker_data.json'] = (200, read_bundled('hawker_data.json'))
+    server.files['/mrt_hawker_topk.npz'] = (200, read_bundled('mrt_hawker_topk.npz'))
+    main.load_data()
+    assert main.data_ready.is_set()
+
+
+def test_reload_data(server, bot_data):
+    loaded = main.hawker_data
+
+    # The same content as was loaded, then not modified
+    main.reload_data(None)
+    assert main.hawker_data is loaded
+    main.reload_data(None)
+    assert main.hawker_data is loaded
+    hawker_data_requests = [headers for path, headers in server.requests if path == '/hawker_data.json']
+    assert hawker_data_requests[-1]['If-None-Match'] == main.hawker_data_fetcher.etag
+
+    # Changed content is swapped in, together with a closure state for it
+    records = json.loads(read_bundled('hawker_data.json'))
+    renamed = records[0]['hawker_name']
+    records[0]['hawker_name'] = 'Renamed Hawker Centre'
+    server.files['/hawker_data.json'] = (200, json.dumps(records).encode())
+    main.reload_data(None)
+    reloaded = main.hawker_data
+    assert reloaded is not loaded
+    assert 'Renamed Hawker Centre' in reloaded.hawker_data_df.index
+    assert renamed not in reloaded.hawker_data_df.index
+    assert main.closure_state.data is reloaded
+    assert reloaded.mrt_index is loaded.mrt_index
+
+    # A failed fetch keeps the last good data
+    server.files['/hawker_data.json'] = (500, b'')
+    main.reload_data(None)
+    assert main.hawker_data is reloaded
+
+    # So does content that does not parse, and it is downloaded and tried again on the next reload
+    server.files['/hawker_data.json'] = (200, b'{"not": "a list of records"')
+    main.reload_data(None)
+    assert main.hawker_data is reloaded
+    assert main.closure_state.data is reloaded
+    assert main.hawker_data_fetcher.checksum is None and main.mrt_index_fetcher.checksum is None
@@ -0,0 +1,46 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from utils.mrt_hawker_dist import build_distance_matrix, build_station_topk_index, correct_top_k_distances, \
+    distance_matrix_to_df
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+# data/mrt_hawker_distances.json holds geopy's geodesic distances for every pair
+MAX_RELATIVE_ERROR = 1e-6
+
+
+@pytest.fixture(scope='module')
+def sources():
+    station_df = pd.read_csv(os.path.join(DATA_DIR, 'mrt_data.csv'), index_col=0)
+    hawker_data_df = pd.read_json(os.path.join(DATA_DIR, 'hawker_data.json'))[['hawker_name', 'hawker_coords']]
+    return station_df, hawker_data_df
+
+
+def build_frame(station_df, hawker_data_df, exact_top_k):
+    dist_matrix = build_distance_matrix(hawker_data_df['hawker_coords'], station_df)
+    if exact_top_k:
+        dist_matrix = correct_top_k_distances(dist_matrix, hawker_data_df['hawker_coords'], station_df)
+    mrt_hawker_df = distance_matrix_to_df(dist_matrix, hawker_data_df['hawker_name'], station_df)
+    return mrt_hawker_df.sort_values(by=["hawker_name", "station_name", "station_num"])
+
+
+def test_distances_match_geopy(sources):
+    expected = pd.read_json(os.path.join(DATA_DIR, 'mrt_hawker_distances.json'))
+    mrt_hawker_df = build_frame(*sources, exact_top_k=False).reset_index(drop=True)
+
+    assert list(mrt_hawker_df.columns) == list(expected.columns)
+    for column in ('hawker_name', 'station_name', 'station_name_cleaned', 'station_num'):
+        assert mrt_hawker_df[column].tolist() == expected[column].tolist()
+    relative_error = np.abs(mrt_hawker_df['distance'] - expected['distance']) / expected['distance']
+    assert relative_error.max() <= MAX_RELATIVE_ERROR
+
+
+def test_top_k_index_matches_bundled(sources):
+    station_df, hawker_data_df = sources
+    topk_index = build_station_topk_index(build_frame(station_df, hawker_data_df, exact_top_k=True), station_df)
+
+    with np.load(os.path.join(DATA_DIR, 'mrt_hawker_topk.npz')) as bundled:
+        for key in ('station_nums', 'station_names', 'hawker_names', 'hawker_idx'):
+            assert np.array_equal(topk_index[key], bundled[key]), key
+        np.testing.assert_allclose(topk_index['distances'], bundled['distances'], rtol=MAX_RELATIVE_ERROR)
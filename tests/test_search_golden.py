@@ -0,0 +1,68 @@
+import json
+import os
+import pytest
+from utils.hawker_data import build_hawker_data, load_mrt_index, prepare_hawker_data_df
+from utils.search_engine import normalise
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The top 10 of partial_ratio against every hawker name, as /search ranked them before the search engine, for 30
+# place-name queries; benchmarks/search_throughput.py --write-golden rewrites it
+GOLDEN_PATH = os.path.join(REPO_DIR, 'tests', 'data', 'search_golden.json')
+# Below this the full scan's results are names with no word of the query in them, mostly tied, and share no trigram
+# with it; /search ranks other fields above them
+STRONG_MATCH = 80
+RESULTS = 10
+
+with open(GOLDEN_PATH) as f:
+    GOLDEN = json.load(f)
+
+
+@pytest.fixture(scope='module')
+def data():
+    with open(os.path.join(REPO_DIR, 'data', 'hawker_data.json'), 'rb') as f:
+        hawker_data_df = prepare_hawker_data_df(json.loads(f.read()))
+    with open(os.path.join(REPO_DIR, 'data', 'mrt_hawker_topk.npz'), 'rb') as f:
+        mrt_index = load_mrt_index(f.read())
+    return build_hawker_data(hawker_data_df, mrt_index, {})
+
+
+def strong_matches(entry):
+    return [(name, score) for name, score in entry['expected'] if score >= STRONG_MATCH]
+
+
+def test_golden_set():
+    assert len(GOLDEN) == 30
+    assert all(len(entry['expected']) == RESULTS for entry in GOLDEN)
+
+
+@pytest.mark.parametrize('entry', GOLDEN, ids=[entry['query'] for entry in GOLDEN])
+def test_shortlist_keeps_strong_matches(data, entry):
+    engine = data.search_engine
+    query = normalise(entry['query'])
+    name_scores = engine.name_scores(query, engine.shortlist(query))
+    for name, score in strong_matches(entry):
+        doc_id = engine.names.index(name)
+        assert doc_id in name_scores, name
+        assert name_scores[doc_id] * 100 == pytest.approx(score, abs=1), name
+
+
+@pytest.mark.parametrize('entry', GOLDEN, ids=[entry['query'] for entry in GOLDEN])
+def test_search_keeps_strong_matches(data, entry):
+    results = [name for name, score in data.search_engine.search(entry['query'], RESULTS)]
+    expected = strong_matches(entry)
+    assert set(name for name, score in expected) <= set(results)
+    if expected:
+        # Other fields may reorder equally good name matches, but not rank a weaker one first
+        assert results[0] in [name for name, score in expected if score == expected[0][1]]
+
+
+@pytest.mark.parametrize('entry', GOLDEN, ids=[entry['query'] for entry in GOLDEN])
+def test_incremental_search_matches_search(data, entry):
+    # Typing the query a keystroke at a time and deleting it again, each search continuing from the one before
+    query = entry['query']
+    keystrokes = [query[:i] for i in range(1, len(query) + 1)] + [query[:i] for i in range(len(query) - 1, 0, -1)]
+    previous = None
+    for typed in keystrokes:
+        results, state = data.search_engine.search_incremental(typed, RESULTS, previous)
+        assert results == data.search_engine.search(typed, RESULTS), typed
+        previous = state if state is not None else previous
@@ -0,0 +1,47 @@
+import json
+import os
+import pandas as pd
+from utils.hawker_data import load_mrt_index, prepare_hawker_data_df
+from utils.snapshot_cache import load_snapshot, save_snapshot
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+BUNDLED = {'hawker_data': 'a' * 64, 'mrt_index': 'b' * 64}
+
+
+def save(cache_dir, source_checksums, bundled_checksums=None):
+    with open(os.path.join(DATA_DIR, 'hawker_data.json'), 'rb') as f:
+        hawker_data_df = prepare_hawker_data_df(json.loads(f.read()))
+    with open(os.path.join(DATA_DIR, 'mrt_hawker_topk.npz'), 'rb') as f:
+        mrt_index = load_mrt_index(f.read())
+    save_snapshot(cache_dir, hawker_data_df, mrt_index, source_checksums, bundled_checksums)
+    return hawker_data_df
+
+
+def test_round_trip(tmp_path):
+    hawker_data_df = save(tmp_path, BUNDLED)
+    cached_df, mrt_index, source_checksums = load_snapshot(tmp_path, bundled_checksums=BUNDLED)
+    pd.testing.assert_frame_equal(cached_df, hawker_data_df)
+    assert source_checksums == BUNDLED
+
+
+def test_cache_of_network_data_is_kept_while_the_bundled_files_are_the_same(tmp_path):
+    network = dict(BUNDLED, hawker_data='c' * 64)
+    save(tmp_path, network, BUNDLED)
+    assert load_snapshot(tmp_path, bundled_checksums=BUNDLED)[2] == network
+
+
+def test_cache_is_ignored_once_the_bundled_files_change(tmp_path):
+    save(tmp_path, BUNDLED)
+    assert load_snapshot(tmp_path, bundled_checksums=dict(BUNDLED, mrt_index='d' * 64)) is None
+    save(tmp_path, dict(BUNDLED, hawker_data='c' * 64), BUNDLED)
+    assert load_snapshot(tmp_path, bundled_checksums=dict(BUNDLED, hawker_data='e' * 64)) is None
+
+
+def test_corrupt_file_is_detected(tmp_path):
+    save(tmp_path, BUNDLED)
+    snapshot_dir = next(p for p in tmp_path.iterdir() if p.name.startswith('snapshot-'))
+    with open(snapshot_dir / 'hawker.latitude.npy', 'r+b') as f:
+        f.seek(-1, os.SEEK_END)
+        f.write(b'\xff')
+    assert load_snapshot(tmp_path) is None
+    assert load_snapshot(tmp_path, verify=False) is not None
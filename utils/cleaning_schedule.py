@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+
+
+def to_day_number(d) -> int:
+    return int(np.datetime64(pd.Timestamp(d).date(), 'D').astype(np.int64))
+
+
+class CleaningSchedule:
+    def __init__(self, hawker_names, start_days, end_days):
+        start_days = np.asarray(start_days, dtype=np.int64)
+        end_days = np.asarray(end_days, dtype=np.int64)
+
+        # Sorted by start day so that a query only looks at the windows that start before it ends
+        order = np.argsort(start_days, kind='stable')
+        self.hawker_names = np.asarray(hawker_names, dtype=object)[order]
+        self.start_days = start_days[order]
+        self.end_days = end_days[order]
+        self.max_duration = int((self.end_days - self.start_days).max()) if len(order) > 0 else 0
+
+    def __len__(self):
+        return len(self.start_days)
+
+    @classmethod
+    def from_hawker_df(cls, df: pd.DataFrame) -> 'CleaningSchedule':
+        hawker_names, start_days, end_days = [], [], []
+        for quarter in range(1, 5):
+            starts = np.asarray(df[f"q{quarter}_start"], dtype='datetime64[D]')
+            ends = np.asarray(df[f"q{quarter}_end"], dtype='datetime64[D]')
+            # Dates still to be confirmed are NaT
+            scheduled = ~np.isnat(starts) & ~np.isnat(ends) & (starts <= ends)
+            hawker_names.append(df.index.to_numpy()[scheduled])
+            start_days.append(starts[scheduled].astype(np.int64))
+            end_days.append(ends[scheduled].astype(np.int64))
+
+        return cls(np.concatenate(hawker_names), np.concatenate(start_days), np.concatenate(end_days))
+
+    def overlapping(self, start_date, end_date) -> pd.DataFrame:
+        query_start = to_day_number(start_date)
+        query_end = to_day_number(end_date)
+
+        # Only windows starting in [query_start - max_duration, query_end] can overlap the query range
+        lo = np.searchsorted(self.start_days, query_start - self.max_duration, side='left')
+        hi = np.searchsorted(self.start_days, query_end, side='right')
+        candidates = np.arange(lo, hi)[self.end_days[lo:hi] >= query_start]
+
+        cleaning_hawkers = pd.DataFrame({
+            'start_date': self.start_days[candidates].astype('datetime64[D]'),
+            'end_date': self.end_days[candidates].astype('datetime64[D]'),
+        }, index=pd.Index(self.hawker_names[candidates], name='hawker_name'))
+
+        # A hawker keeps only its earliest window in the range
+        return cleaning_hawkers[~cleaning_hawkers.index.duplicated(keep='first')]
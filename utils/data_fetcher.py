@@ -0,0 +1,51 @@
+from typing import TYPE_CHECKING, Optional
+import hashlib
+import logging
+
+if TYPE_CHECKING:
+    import requests
+
+
+class ConditionalFetcher:
+    def __init__(self, url: str, session: Optional['requests.Session'] = None, timeout=30):
+        self.url = url
+        self.session = session
+        self.timeout = timeout
+        self.reset()
+
+    def reset(self):
+        self.etag = None
+        self.last_modified = None
+        self.checksum = None
+
+    def fetch(self) -> Optional[bytes]:
+        # Returns the new content, or None if it has not changed since the last successful fetch
+        if self.session is None:
+            # Imported on the first fetch rather than at start-up, which usually loads from the cache instead
+            import requests
+            self.session = requests.Session()
+
+        headers = {}
+        if self.etag is not None:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified is not None:
+            headers['If-Modified-Since'] = self.last_modified
+
+        response = self.session.get(self.url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304:
+            logging.info(f"{self.url} not modified")
+            return None
+        response.raise_for_status()
+
+        content = response.content
+        checksum = hashlib.sha256(content).hexdigest()
+        self.etag = response.headers.get('ETag')
+        self.last_modified = response.headers.get('Last-Modified')
+
+        # Servers without validators send everything again, so compare the content as well
+        if checksum == self.checksum:
+            logging.info(f"{self.url} unchanged")
+            return None
+
+        self.checksum = checksum
+        return content
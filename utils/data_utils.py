@@ -1,14 +1,30 @@
-import requests
-import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import argparse
 import json
+import logging
+import os
+import sys
 import pandas as pd
-import utils
-import date_utils
-from datetime import datetime
-from itertools import chain
-
-logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-                    level=logging.INFO)
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from utils import date_utils, utils
+from utils.cleaning_schedule import CleaningSchedule
+from utils.hawker_data import TBC_DATE, prepare_hawker_data_df
+
+# Written in place of "TBC" cleaning dates; prepare_hawker_data_df reads it back as NaT
+TBC_DATE_TEXT = f"{TBC_DATE.day}/{TBC_DATE.month}/{TBC_DATE.year}"
+DATASTORE_URL = 'https://data.gov.sg/api/action/datastore_search'
+HAWKER_RESOURCE_ID = 'b80cb643-a732-480d-86b5-e03957bc82aa'
+HAWKER_DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'hawker_data.json')
+RECORDS_PER_PAGE = 100
+MAX_CONCURRENT_PAGES = 4
+# Seconds to connect and to wait for a response
+REQUEST_TIMEOUT = (5, 30)
+RETRY_STATUSES = (429, 500, 502, 503, 504)
 
 
 def get_hawker_mrt_dist_df(config):
@@ -19,39 +35,21 @@ def get_hawker_mrt_dist_df(config):
 
 def get_hawker_data_df(config):
     hawker_data_json = utils.get_json_data_from_url(config.get("urls", "hawker_data"))
-    df = pd.DataFrame.from_records(hawker_data_json)
-    df = prepare_hawker_data(df)
-    return df
+    return prepare_hawker_data_df(hawker_data_json)
 
 
-def get_hawkers_washing(df, this_week=False, next_week=False) -> pd.DataFrame:
+def get_hawkers_washing(schedule: CleaningSchedule, this_week=False, next_week=False) -> pd.DataFrame:
     start_date = end_date = date_utils.get_date_today()
     if this_week:
         start_date, end_date = date_utils.get_date_range_in_weeks(start_week=0, end_week=1)
     elif next_week:
         start_date, end_date = date_utils.get_date_range_in_weeks(start_week=1, end_week=2)
 
-    query_date_range = set(pd.date_range(start_date, end_date, freq='D').tolist())
-
-    cleaning_hawkers = []
-    for quarter in range(1, 5):
-        quarter_date_range_col = f"q{quarter}_date_range"
-        quarter_start_col = f"q{quarter}_start"
-        quarter_end_col = f"q{quarter}_end"
-        cleaning_hawkers = df[
-            (df[quarter_date_range_col].apply(lambda qdr: len(set.intersection(set(qdr.tolist()),
-                                                                               query_date_range)) > 0))
-        ][[quarter_start_col, quarter_end_col]].rename(columns={
-            quarter_start_col: "start_date",
-            quarter_end_col: "end_date"
-        })
-
-        if len(cleaning_hawkers) > 0:
-            break
+    cleaning_hawkers = schedule.overlapping(start_date, end_date)
 
     # Format for printing
-    cleaning_hawkers['start_date'] = cleaning_hawkers['start_date'].apply(lambda dt: dt.strftime("%d/%m"))
-    cleaning_hawkers['end_date'] = cleaning_hawkers['end_date'].apply(lambda dt: dt.strftime("%d/%m"))
+    cleaning_hawkers['start_date'] = cleaning_hawkers['start_date'].dt.strftime("%d/%m")
+    cleaning_hawkers['end_date'] = cleaning_hawkers['end_date'].dt.strftime("%d/%m")
 
     return cleaning_hawkers
 
@@ -60,58 +58,117 @@ def hawkers_not_existing(df) -> List:
     return list(df[df['not_existing']].index)
 
 
-def prepare_hawker_data(df: pd.DataFrame) -> pd.DataFrame:
-    df['not_existing'] = df['hawker_status'].apply(lambda s: "existing" not in s.lower())
-    df = df.set_index("hawker_name")
-
-    cleaning_columns = ["q1_start", "q1_end", "q2_start", "q2_end", "q3_start", "q3_end", "q4_end"]
-    for c in cleaning_columns:
-        df[c] = df[c].apply(lambda d: datetime.strptime(d, "%d/%m/%Y"))
-
-    for q in range(1, 5):
-        quarter_start = f"q{q}_start"
-        quarter_end = f"q{q}_end"
-        df[f"q{q}_date_range"] = df[[quarter_start, quarter_end]] \
-            .apply(lambda row: pd.date_range(row[quarter_start], row[quarter_end], freq='D'), axis=1)
-
-    return df
-
-
-def fetch_records_from_api() -> list:
-    all_records = []
-    num_results_per_page = 100
-    should_get_more_results = True
-    base_url = 'https://data.gov.sg'
-    api_link = '/api/action/datastore_search?resource_id=b80cb643-a732-480d-86b5-e03957bc82aa'
-
-    while should_get_more_results:
-        logging.info("Fetching records from %s..." % api_link)
-        resp = requests.get(base_url + api_link)
-        resp_json = resp.json()
-
-        if 'result' not in resp_json:
-            logging.error("'result' key not found in JSON response")
-            break
-
-        result = resp_json['result']
-
-        if 'records' not in result:
-            logging.error("'records' key not found in JSON response")
-            break
-
-        records = result['records']
-        all_records.append(records)
-        should_get_more_results = len(records) >= num_results_per_page
-
-        if '_links' not in result and 'next' not in result['_links']:
-            logging.error("'_links' key not found in JSON response")
-            break
-
-        api_link = result['_links']['next']
-
-    all_records = list(chain.from_iterable(all_records))
-    logging.info("Number of records retrieved: %s" % len(all_records))
-    return all_records
+def make_session(max_concurrent_pages=MAX_CONCURRENT_PAGES, retries=5, backoff_factor=0.5) -> requests.Session:
+    # Failed requests are retried with exponential backoff, waiting as long as a 429 or 503 asks to
+    retry = Retry(total=retries, backoff_factor=backoff_factor, status_forcelist=RETRY_STATUSES,
+                  allowed_methods=['GET'], respect_retry_after_header=True)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrent_pages, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def fetch_page(session: requests.Session, url: str, resource_id: str, offset: int) -> Dict:
+    logging.info(f"Fetching records {offset} to {offset + RECORDS_PER_PAGE} from {url}...")
+    response = session.get(url, params={'resource_id': resource_id, 'offset': offset, 'limit': RECORDS_PER_PAGE},
+                           timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    resp_json = response.json()
+
+    if 'result' not in resp_json:
+        raise ValueError("'result' key not found in JSON response")
+    for key in ('records', 'total'):
+        if key not in resp_json['result']:
+            raise ValueError(f"'{key}' key not found in JSON response")
+    return resp_json['result']
+
+
+def iter_pages(session: requests.Session, url: str, resource_id: str, offsets: Iterable[int],
+               max_concurrent_pages: int) -> Iterator[Tuple[int, List[Dict]]]:
+    # Pages in order of offset, with at most max_concurrent_pages fetched or waiting to be written at a time
+    offsets = iter(offsets)
+    with ThreadPoolExecutor(max_workers=max_concurrent_pages, thread_name_prefix='fetch_page') as executor:
+        pending = deque()
+        for offset in offsets:
+            pending.append((offset, executor.submit(fetch_page, session, url, resource_id, offset)))
+            if len(pending) == max_concurrent_pages:
+                break
+        while pending:
+            offset, future = pending.popleft()
+            try:
+                page = future.result()
+            except Exception:
+                for _, other in pending:
+                    other.cancel()
+                raise
+            next_offset = next(offsets, None)
+            if next_offset is not None:
+                pending.append((next_offset, executor.submit(fetch_page, session, url, resource_id, next_offset)))
+            yield offset, page['records']
+
+
+def read_checkpoint(checkpoint_path: str, partial_path: str, resource_id: str) -> Optional[Dict]:
+    if not os.path.exists(checkpoint_path) or not os.path.exists(partial_path):
+        return None
+    with open(checkpoint_path) as f:
+        checkpoint = json.load(f)
+    return checkpoint if checkpoint['resource_id'] == resource_id else None
+
+
+def write_checkpoint(checkpoint_path: str, checkpoint: Dict):
+    with open(checkpoint_path + '.tmp', 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(checkpoint_path + '.tmp', checkpoint_path)
+
+
+def fetch_records_to_file(path: str, transform: Callable[[Dict], Dict], url=DATASTORE_URL,
+                          resource_id=HAWKER_RESOURCE_ID, max_concurrent_pages=MAX_CONCURRENT_PAGES,
+                          session: Optional[requests.Session] = None) -> int:
+    # Records are appended to path + '.partial' as their pages arrive, and after each page the checkpoint records
+    # where to continue from, so that running this again after a failure resumes after the last page written
+    session = session or make_session(max_concurrent_pages)
+    partial_path = path + '.partial'
+    checkpoint_path = path + '.checkpoint'
+
+    checkpoint = read_checkpoint(checkpoint_path, partial_path, resource_id)
+    offset = checkpoint['offset'] if checkpoint else 0
+    # The first page comes with the total number of records, from which the other pages are known
+    first_page = fetch_page(session, url, resource_id, offset)
+    if checkpoint and first_page['total'] != checkpoint['total']:
+        logging.warning("Number of records has changed since the checkpoint, fetching them all again")
+        checkpoint, offset = None, 0
+        first_page = fetch_page(session, url, resource_id, offset)
+    total = first_page['total']
+    if checkpoint:
+        logging.info(f"Resuming from record {offset} of {total}")
+
+    with open(partial_path, 'r+b' if checkpoint else 'wb') as f:
+        if checkpoint:
+            f.truncate(checkpoint['size'])
+            f.seek(checkpoint['size'])
+            count = checkpoint['count']
+        else:
+            f.write(b'[')
+            count = 0
+
+        pages = chain([(offset, first_page['records'])],
+                      iter_pages(session, url, resource_id, range(offset + RECORDS_PER_PAGE, total, RECORDS_PER_PAGE),
+                                 max_concurrent_pages))
+        for page_offset, records in pages:
+            for record in records:
+                f.write((b', ' if count else b'') + json.dumps(transform(record)).encode())
+                count += 1
+            f.flush()
+            write_checkpoint(checkpoint_path, {'resource_id': resource_id, 'total': total,
+                                               'offset': page_offset + RECORDS_PER_PAGE, 'count': count,
+                                               'size': f.tell()})
+        f.write(b']')
+
+    os.replace(partial_path, path)
+    os.remove(checkpoint_path)
+    logging.info("Number of records retrieved: %s" % count)
+    return count
 
 
 def get_gmaps_url(hawker_name):
@@ -136,21 +193,32 @@ def get_relevant_fields_as_dict(record) -> dict:
         'longitude': long,
         'latitude': lat,
         'hawker_coords': (lat, long),
-        'q1_start': record['q1_cleaningstartdate'].replace("TBC", "14/1/1990"),
-        'q1_end': record['q1_cleaningenddate'].replace("TBC", "14/1/1990"),
-        'q2_start': record['q2_cleaningstartdate'].replace("TBC", "14/1/1990"),
-        'q2_end': record['q2_cleaningenddate'].replace("TBC", "14/1/1990"),
-        'q3_start': record['q3_cleaningstartdate'].replace("TBC", "14/1/1990"),
-        'q3_end': record['q3_cleaningenddate'].replace("TBC", "14/1/1990"),
-        'q4_start': record['q4_cleaningstartdate'].replace("TBC", "14/1/1990"),
-        'q4_end': record['q4_cleaningenddate'].replace("TBC", "14/1/1990"),
+        'q1_start': record['q1_cleaningstartdate'].replace("TBC", TBC_DATE_TEXT),
+        'q1_end': record['q1_cleaningenddate'].replace("TBC", TBC_DATE_TEXT),
+        'q2_start': record['q2_cleaningstartdate'].replace("TBC", TBC_DATE_TEXT),
+        'q2_end': record['q2_cleaningenddate'].replace("TBC", TBC_DATE_TEXT),
+        'q3_start': record['q3_cleaningstartdate'].replace("TBC", TBC_DATE_TEXT),
+        'q3_end': record['q3_cleaningenddate'].replace("TBC", TBC_DATE_TEXT),
+        'q4_start': record['q4_cleaningstartdate'].replace("TBC", TBC_DATE_TEXT),
+        'q4_end': record['q4_cleaningenddate'].replace("TBC", TBC_DATE_TEXT),
     }
 
 
-logging.info("Fetching hawker records from API")
-api_records = fetch_records_from_api()
-hawker_data = [get_relevant_fields_as_dict(r) for r in api_records]
-
-logging.info("Dumping results into JSON file")
-with open("../data/hawker_data.json", 'w') as f:
-    json.dump(hawker_data, f)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default=DATASTORE_URL)
+    parser.add_argument('--output', default=HAWKER_DATA_PATH)
+    parser.add_argument('--max-concurrent-pages', type=int, default=MAX_CONCURRENT_PAGES)
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                        level=logging.INFO)
+
+    logging.info("Fetching hawker records from API")
+    try:
+        fetch_records_to_file(args.output, get_relevant_fields_as_dict, args.url,
+                              max_concurrent_pages=args.max_concurrent_pages)
+    except (OSError, ValueError) as e:
+        # Includes the exceptions of requests, and responses that are not JSON
+        logging.error(f"Fetching hawker records failed, run again to resume: {e}")
+        sys.exit(-1)
@@ -0,0 +1,158 @@
+from typing import Optional, Tuple
+import numpy as np
+
+# WGS84 ellipsoid, the same model geopy.distance.distance uses
+WGS84_A_KM = 6378.137
+WGS84_F = 1 / 298.257223563
+WGS84_E2 = WGS84_F * (2 - WGS84_F)
+EARTH_MEAN_RADIUS_KM = 6371.0088
+MAX_DEGREES_PER_KM = float(np.degrees(1 / (WGS84_A_KM * (1 - WGS84_E2))))
+
+# Extra candidates taken from the spherical shortlist so that near-ties at the
+# k-th place are settled by the ellipsoidal refinement and not by the sphere
+SHORTLIST_SLACK = 8
+
+# Side of a GridIndex cell; a radius query looks at the cells its bounding box overlaps
+GRID_CELL_KM = 1.0
+
+# From this many points NearestNeighbourIndex finds the k nearest with a GridIndex rather than a scan of every point.
+# benchmarks/nearest_neighbour.py --crossover, top 10 over random points in Singapore: the scan takes ~60 us up to a
+# few thousand points (~250 us with the grid at the 120-odd hawker centres), and the grid is ahead from about 5,000
+GRID_MIN_POINTS = 5000
+
+
+def to_unit_vectors(lats, longs) -> np.ndarray:
+    lats = np.radians(np.asarray(lats, dtype=float))
+    longs = np.radians(np.asarray(longs, dtype=float))
+    cos_lats = np.cos(lats)
+    return np.stack([cos_lats * np.cos(longs), cos_lats * np.sin(longs), np.sin(lats)], axis=-1)
+
+
+def haversine_km(lat1, long1, lat2, long2, radius=EARTH_MEAN_RADIUS_KM):
+    lat1, long1, lat2, long2 = map(np.radians, (lat1, long1, lat2, long2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((long2 - long1) / 2) ** 2
+    return 2 * radius * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def ellipsoidal_distance_km(lat1, long1, lat2, long2):
+    # Haversine on a sphere is off by up to ~0.6% against the WGS84 geodesic around Singapore, enough to
+    # swap neighbouring hawker centres in the rankings. Scaling the latitude/longitude differences by the
+    # ellipsoid's radii of curvature at the mid-latitude agrees with geopy to about 1e-6 over the island
+    # (degrading to ~1% for points hundreds of km away, where the ordering no longer matters).
+    lat1, long1, lat2, long2 = map(np.radians, (lat1, long1, lat2, long2))
+    mid_lat = (lat1 + lat2) / 2
+    w = np.sqrt(1 - WGS84_E2 * np.sin(mid_lat) ** 2)
+    meridional_radius = WGS84_A_KM * (1 - WGS84_E2) / w ** 3
+    normal_radius = WGS84_A_KM / w
+    d_long = (long2 - long1 + np.pi) % (2 * np.pi) - np.pi
+    return np.hypot(meridional_radius * (lat2 - lat1), normal_radius * np.cos(mid_lat) * d_long)
+
+
+class NearestNeighbourIndex:
+    def __init__(self, lats, longs, grid_min_points=GRID_MIN_POINTS):
+        self.lats = np.asarray(lats, dtype=float)
+        self.longs = np.asarray(longs, dtype=float)
+        self.unit_vectors = to_unit_vectors(self.lats, self.longs)
+        # Below grid_min_points one matrix product over the unit vectors beats the grid's cell lookups, and scipy
+        # (for a cKDTree) is not a dependency
+        self.grid_index = None
+        if len(self.lats) >= max(grid_min_points, 1):
+            self.grid_index = GridIndex(self.lats, self.longs)
+            self.span_km = float(ellipsoidal_distance_km(self.lats.min(), self.longs.min(),
+                                                         self.lats.max(), self.longs.max()))
+
+    def __len__(self):
+        return len(self.lats)
+
+    def nearest(self, lat, long, k) -> Tuple[np.ndarray, np.ndarray]:
+        n = len(self)
+        k = min(k, n)
+        if k <= 0:
+            return np.empty(0, dtype=int), np.empty(0, dtype=float)
+        if self.grid_index is not None:
+            nearest = self.grid_nearest(lat, long, k)
+            if nearest is not None:
+                return nearest
+
+        # Broad phase: a larger dot product between unit vectors means a shorter great-circle distance
+        similarity = self.unit_vectors @ to_unit_vectors(lat, long)
+        num_candidates = min(k + SHORTLIST_SLACK, n)
+        if num_candidates < n:
+            candidates = np.argpartition(-similarity, num_candidates - 1)[:num_candidates]
+        else:
+            candidates = np.arange(n)
+
+        # Refinement on the shortlist only, then a partial selection of the k nearest
+        dists = ellipsoidal_distance_km(self.lats[candidates], self.longs[candidates], lat, long)
+        if k < len(candidates):
+            top_k = np.argpartition(dists, k - 1)[:k]
+        else:
+            top_k = np.arange(len(candidates))
+        order = top_k[np.argsort(dists[top_k], kind="stable")]
+        return candidates[order], dists[order]
+
+    def grid_nearest(self, lat, long, k) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        # Once k points are within the radius, no point outside it can be nearer. None for a query so far from the
+        # points that doubling the radius past their span still finds fewer than k.
+        radius_km = GRID_CELL_KM
+        while True:
+            idx, dists = self.grid_index.within(lat, long, radius_km)
+            if len(idx) >= k:
+                return idx[:k], dists[:k]
+            if radius_km > self.span_km:
+                return None
+            radius_km *= 2
+
+
+class GridIndex:
+    def __init__(self, lats, longs, cell_km=GRID_CELL_KM):
+        self.lats = np.asarray(lats, dtype=float)
+        self.longs = np.asarray(longs, dtype=float)
+        n = len(self.lats)
+        self.origin_lat = float(self.lats.min()) if n else 0.0
+        self.origin_long = float(self.longs.min()) if n else 0.0
+        # Cells are cell_km or more on each side; neither radius of curvature is ever smaller than the meridional
+        # one at the equator
+        max_abs_lat = float(np.abs(self.lats).max()) if n else 0.0
+        self.lat_step = cell_km * MAX_DEGREES_PER_KM
+        self.long_step = self.lat_step / max(np.cos(np.radians(max_abs_lat)), 1e-6)
+
+        rows, cols = self.cells(self.lats, self.longs)
+        self.num_rows = int(rows.max()) + 1 if n else 0
+        self.num_cols = int(cols.max()) + 1 if n else 0
+        # Points sorted by cell, row by row, so the cells of a row between two columns are one slice of the order
+        cell_ids = rows * self.num_cols + cols
+        self.order = np.argsort(cell_ids, kind="stable")
+        self.cell_starts = np.searchsorted(cell_ids[self.order], np.arange(self.num_rows * self.num_cols + 1))
+
+    def __len__(self):
+        return len(self.lats)
+
+    def cells(self, lats, longs) -> Tuple[np.ndarray, np.ndarray]:
+        rows = np.floor((np.asarray(lats) - self.origin_lat) / self.lat_step).astype(np.int64)
+        cols = np.floor((np.asarray(longs) - self.origin_long) / self.long_step).astype(np.int64)
+        return rows, cols
+
+    def within(self, lat, long, radius_km, mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        # Points within radius_km, nearest first, leaving out those where mask is False
+        lat_margin = radius_km * MAX_DEGREES_PER_KM
+        long_margin = lat_margin / max(np.cos(np.radians(abs(lat) + lat_margin)), 1e-6)
+        (row_lo, row_hi), (col_lo, col_hi) = self.cells([lat - lat_margin, lat + lat_margin],
+                                                        [long - long_margin, long + long_margin])
+        row_lo, row_hi = max(row_lo, 0), min(row_hi, self.num_rows - 1)
+        col_lo, col_hi = max(col_lo, 0), min(col_hi, self.num_cols - 1)
+        if row_lo > row_hi or col_lo > col_hi:
+            return np.empty(0, dtype=int), np.empty(0, dtype=float)
+
+        row_starts = np.arange(row_lo, row_hi + 1) * self.num_cols
+        slices = [self.order[start:end] for start, end in zip(self.cell_starts[row_starts + col_lo],
+                                                              self.cell_starts[row_starts + col_hi + 1])]
+        candidates = np.concatenate(slices)
+        if mask is not None:
+            candidates = candidates[mask[candidates]]
+
+        dists = ellipsoidal_distance_km(self.lats[candidates], self.longs[candidates], lat, long)
+        is_within = dists <= radius_km
+        candidates, dists = candidates[is_within], dists[is_within]
+        order = np.argsort(dists, kind="stable")
+        return candidates[order], dists[order]
@@ -0,0 +1,111 @@
+from collections import namedtuple
+from datetime import datetime
+from typing import Dict, List, Optional
+import hashlib
+import io
+import json
+import numpy as np
+import pandas as pd
+from utils.cleaning_schedule import CleaningSchedule
+from utils.geo_utils import GridIndex, NearestNeighbourIndex
+from utils.search_engine import HawkerSearchEngine, SearchState
+from utils.station_graph import StationGraph, station_name
+
+# Stations within this distance of a hawker centre are searchable as part of it
+NEARBY_STATION_KM = 1.0
+DATE_COLUMNS = [f"q{q}_{side}" for q in range(1, 5) for side in ("start", "end")]
+# data_utils writes this in place of "TBC" cleaning dates
+TBC_DATE = datetime(1990, 1, 14)
+
+HawkerData = namedtuple("HawkerData", [
+    "hawker_data_df",
+    "location_index",
+    "grid_index",
+    "cleaning_schedule",
+    "mrt_index",
+    "mrt_station_positions",
+    "station_graph",
+    "search_engine",
+    "source_checksums",
+    "version",
+])
+
+
+def prepare_hawker_data_df(hawker_data_json: List[Dict]) -> pd.DataFrame:
+    # The same as latitude and longitude, as a list per row
+    df = pd.DataFrame.from_records(hawker_data_json).drop(columns="hawker_coords", errors="ignore")
+    df = df.set_index("hawker_name")
+
+    # A handful of distinct values, stored once each with a small code per row
+    df["hawker_status"] = df["hawker_status"].astype("category")
+    df["not_existing"] = ~df["hawker_status"].str.lower().str.contains("existing", regex=False).astype(bool)
+
+    # All the cleaning dates in one pass; TBC dates, written as TBC_DATE or left as is, become NaT
+    dates = pd.to_datetime(df[DATE_COLUMNS].to_numpy().ravel(), format="%d/%m/%Y", errors="coerce")
+    dates = dates.where(dates != TBC_DATE).to_numpy(dtype="datetime64[s]")
+    df[DATE_COLUMNS] = pd.DataFrame(dates.reshape(len(df), len(DATE_COLUMNS)), index=df.index, columns=DATE_COLUMNS)
+
+    return df
+
+
+def load_mrt_index(content: bytes) -> Dict[str, np.ndarray]:
+    with np.load(io.BytesIO(content)) as npz:
+        return {key: npz[key] for key in npz.files}
+
+
+def nearby_station_names(hawker_names, mrt_index: Dict[str, np.ndarray], max_km=NEARBY_STATION_KM) -> List[List[str]]:
+    positions = {name: pos for pos, name in enumerate(hawker_names)}
+    nearby_stations = [[] for _ in positions]
+
+    # Inverts the per-station top-K lists; a hawker within max_km of a station is well inside its top K
+    for station_pos, station_name_cleaned in enumerate(mrt_index["station_names_cleaned"]):
+        name = station_name(station_name_cleaned)
+        is_close = mrt_index["distances"][station_pos] <= max_km
+        for hawker_idx in mrt_index["hawker_idx"][station_pos][is_close]:
+            pos = positions.get(mrt_index["hawker_names"][hawker_idx])
+            # Interchanges appear once per line
+            if pos is not None and name not in nearby_stations[pos]:
+                nearby_stations[pos].append(name)
+
+    return nearby_stations
+
+
+def data_version(source_checksums: Dict[str, str]) -> str:
+    return hashlib.sha256(json.dumps(source_checksums, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def build_hawker_data(hawker_data_df: pd.DataFrame, mrt_index: Dict[str, np.ndarray],
+                      source_checksums: Dict[str, str]) -> HawkerData:
+    return HawkerData(
+        hawker_data_df=hawker_data_df,
+        location_index=NearestNeighbourIndex(hawker_data_df["latitude"], hawker_data_df["longitude"]),
+        grid_index=GridIndex(hawker_data_df["latitude"], hawker_data_df["longitude"]),
+        cleaning_schedule=CleaningSchedule.from_hawker_df(hawker_data_df),
+        mrt_index=mrt_index,
+        mrt_station_positions={num: pos for pos, num in enumerate(mrt_index["station_nums"])},
+        station_graph=StationGraph(mrt_index, hawker_data_df.index),
+        search_engine=HawkerSearchEngine(
+            hawker_data_df.index,
+            hawker_data_df["address"],
+            hawker_data_df["description"],
+            nearby_station_names(hawker_data_df.index, mrt_index),
+        ),
+        source_checksums=source_checksums,
+        version=data_version(source_checksums),
+    )
+
+
+def search_hawkers(data: HawkerData, query: str, limit: int):
+    return data.search_engine.search(query, limit)
+
+
+def search_hawkers_incremental(data: HawkerData, query: str, limit: int, previous: Optional[SearchState]):
+    return data.search_engine.search_incremental(query, limit, previous)
+
+
+def nearest_hawkers(data: HawkerData, lat: float, long: float, k: int):
+    return data.location_index.nearest(lat, long, k)
+
+
+def hawkers_within(data: HawkerData, lat: float, long: float, radius_km: float, mask: Optional[np.ndarray] = None):
+    return data.grid_index.within(lat, long, radius_km, mask)
@@ -0,0 +1,160 @@
+from datetime import datetime
+from functools import wraps
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+from typing import Dict, Optional
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+# Share of command records that are written; slow and failed commands are always written
+DEFAULT_SAMPLE_RATES = {'command': 1.0}
+# Commands slower than this are always logged, whatever the sampling
+SLOW_COMMAND_MS = 100
+
+sample_rates = dict(DEFAULT_SAMPLE_RATES)
+current_command = threading.local()
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class LogQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only what cannot be handed to another thread as is gets rendered on the calling thread: the message
+        # arguments and the traceback. Formatting is left to the listener.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class SizedTimedRotatingFileHandler(TimedRotatingFileHandler):
+    # Rolls over at local midnight and whenever the file grows past max_bytes. Rolled files are named after the
+    # day they cover, with a counter for the ones rolled over by size: bot.log.2021-05-01, bot.log.2021-05-01.1, ...
+    def __init__(self, filename: str, max_bytes: int, backup_count: int):
+        super().__init__(filename, when='midnight', backupCount=backup_count, encoding='utf-8')
+        self.max_bytes = max_bytes
+        self.namer = self.unused_name
+
+    @staticmethod
+    def unused_name(name: str) -> str:
+        counter = 0
+        candidate = name
+        while os.path.exists(candidate):
+            counter += 1
+            candidate = f"{name}.{counter}"
+        return candidate
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if super().shouldRollover(record):
+            return True
+        return self.max_bytes > 0 and self.stream is not None and self.stream.tell() >= self.max_bytes
+
+
+def setup_logging(log_file: str, max_bytes: int, backup_count: int, level=logging.INFO) -> QueueListener:
+    # Handlers only put records on a queue; a background thread formats and writes them
+    file_handler = SizedTimedRotatingFileHandler(log_file, max_bytes, backup_count)
+    file_handler.setFormatter(JsonFormatter())
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setFormatter(logging.Formatter(fmt="%(asctime)s - %(levelname)s - %(message)s"))
+
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+
+    root_logger = logging.getLogger()
+    for handler in root_logger.handlers[:]:
+        root_logger.removeHandler(handler)
+        handler.close()
+    root_logger.addHandler(LogQueueHandler(log_queue))
+    root_logger.setLevel(level)
+
+    listener.start()
+    # Writes out what is still queued however the process exits
+    atexit.register(listener.stop)
+    return listener
+
+
+def set_sample_rate(event: str, rate: float):
+    sample_rates[event] = rate
+
+
+def log_event(event: str, message: str, level=logging.INFO, force=False, **fields):
+    rate = sample_rates.get(event, 1.0)
+    if not force and rate < 1.0 and random.random() >= rate:
+        return
+    fields['event'] = event
+    if rate < 1.0:
+        # Lets counts be scaled back up
+        fields['sample_rate'] = rate
+    logging.log(level, message, extra={'fields': fields})
+
+
+def command_text(update) -> str:
+    if update.callback_query is not None:
+        return f"callback {update.callback_query.data}"
+    if update.message is None:
+        # The other kind of update with handlers
+        return f"inline {update.inline_query.query[:255]}"
+    if update.message.location is not None:
+        return "location"
+    return (update.message.text or "")[:255]
+
+
+def log_command_pressed(update, latency_ms: Optional[float] = None, result_count: Optional[int] = None,
+                        failed=False):
+    user = update.effective_user
+    fields: Dict = {'user_id': user.id if user else None, 'command': command_text(update)}
+    if update.message is not None and update.message.location is not None:
+        fields['latitude'] = update.message.location.latitude
+        fields['longitude'] = update.message.location.longitude
+    if latency_ms is not None:
+        fields['latency_ms'] = round(latency_ms, 3)
+    if result_count is not None:
+        fields['result_count'] = result_count
+
+    slow = latency_ms is not None and latency_ms > SLOW_COMMAND_MS
+    log_event('command', f"{fields['user_id']} sent {fields['command']}",
+              level=logging.WARNING if failed else logging.INFO, force=slow or failed, failed=failed, **fields)
+
+
+def record_result_count(count: int):
+    # Called by a handler to add its number of results to the record of the command it is handling
+    current_command.result_count = count
+
+
+def logged_command(handler):
+    @wraps(handler)
+    def wrapper(update, *args, **kwargs):
+        current_command.result_count = None
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = handler(update, *args, **kwargs)
+            failed = False
+            return result
+        finally:
+            latency_ms = (time.perf_counter() - started) * 1000
+            log_command_pressed(update, latency_ms, current_command.result_count, failed)
+
+    return wrapper
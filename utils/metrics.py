@@ -0,0 +1,225 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Sequence, Tuple
+import logging
+import math
+import threading
+import time
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+REFRESH_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def format_labels(label_names: Sequence[str], label_values: Tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    def __init__(self, name: str, description: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self.values: Dict[Tuple, float] = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def value(self, *label_values) -> float:
+        return self.values.get(label_values, 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for label_values, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{format_labels(self.label_names, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, description: str, label_names: Sequence[str] = (), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self.bounds = tuple(buckets)
+        # Per label values: observations per bucket (the last one is +Inf), their sum and their count
+        self.series: Dict[Tuple, list] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        bucket = bisect_left(self.bounds, value)
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [[0] * (len(self.bounds) + 1), 0.0, 0]
+            series[0][bucket] += 1
+            series[1] += value
+            series[2] += 1
+
+    def labelled(self) -> List[Tuple]:
+        with self.lock:
+            return sorted(self.series)
+
+    def snapshot(self, *label_values) -> Optional[Tuple[List[int], float, int]]:
+        with self.lock:
+            series = self.series.get(label_values)
+            return None if series is None else (list(series[0]), series[1], series[2])
+
+    def quantile(self, q: float, *label_values) -> float:
+        # Interpolated within the bucket, as Prometheus' histogram_quantile does
+        snapshot = self.snapshot(*label_values)
+        if snapshot is None or snapshot[2] == 0:
+            return math.nan
+        bucket_counts, _, count = snapshot
+        rank = q * count
+        cumulative = 0
+        for i, bucket_count in enumerate(bucket_counts):
+            if cumulative + bucket_count >= rank:
+                if i == len(self.bounds):
+                    return self.bounds[-1]
+                lower = self.bounds[i - 1] if i > 0 else 0.0
+                return lower + (self.bounds[i] - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.bounds[-1]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            series = {labels: (list(s[0]), s[1], s[2]) for labels, s in self.series.items()}
+        for label_values, (bucket_counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.bounds + (math.inf,), bucket_counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == math.inf else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{format_labels(self.label_names, label_values, le)} {cumulative}")
+            labels = format_labels(self.label_names, label_values)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+handler_seconds = Histogram("sghawkerbot_handler_seconds", "Time taken to handle an update, by handler",
+                            ["handler"])
+handler_errors = Counter("sghawkerbot_handler_errors_total", "Updates whose handler raised an exception, by handler",
+                         ["handler"])
+telegram_request_seconds = Histogram("sghawkerbot_telegram_request_seconds",
+                                     "Duration of Bot API requests, excluding rate limit waits, by method", ["method"])
+data_refresh_seconds = Histogram("sghawkerbot_data_refresh_seconds",
+                                 "Time taken to load data or to refresh what is derived from it, by stage", ["stage"],
+                                 buckets=REFRESH_BUCKETS)
+inline_query_seconds = Histogram("sghawkerbot_inline_query_seconds",
+                                 "Time from receiving an inline query to answering it, by cache hit or miss",
+                                 ["cache"])
+inline_queries_superseded = Counter("sghawkerbot_inline_queries_superseded_total",
+                                    "Inline queries left unanswered because a newer one from the same user came in")
+send_queue_seconds = Histogram("sghawkerbot_send_queue_seconds",
+                               "Time from a message or edit being queued to it being sent, by method", ["method"])
+sends_coalesced = Counter("sghawkerbot_sends_coalesced_total",
+                          "Queued edits replaced by a later edit of the same message before being sent, by method",
+                          ["method"])
+sends_retried = Counter("sghawkerbot_sends_retried_total", "Sends tried again, by reason", ["reason"])
+sends_dropped = Counter("sghawkerbot_sends_dropped_total", "Sends given up on, by method", ["method"])
+ALL_METRICS = [handler_seconds, handler_errors, telegram_request_seconds, data_refresh_seconds, inline_query_seconds,
+               inline_queries_superseded, send_queue_seconds, sends_coalesced, sends_retried, sends_dropped]
+
+
+def render_metrics() -> str:
+    return '\n'.join(line for metric in ALL_METRICS for line in metric.render()) + '\n'
+
+
+def format_stats() -> str:
+    # Plain text summary of the metrics, for the /stats command
+    lines = [f"{'handler':30s} {'calls':>7s} {'errors':>6s} {'p50 ms':>7s} {'p99 ms':>7s}"]
+    for (name,) in handler_seconds.labelled():
+        _, _, count = handler_seconds.snapshot(name)
+        p50_ms, p99_ms = handler_seconds.quantile(0.5, name) * 1000, handler_seconds.quantile(0.99, name) * 1000
+        lines.append(f"{name:30s} {count:7d} {int(handler_errors.value(name)):6d} {p50_ms:7.1f} {p99_ms:7.1f}")
+    for title, histogram in (('bot api method', telegram_request_seconds), ('send queue wait', send_queue_seconds),
+                             ('data refresh', data_refresh_seconds), ('inline query cache', inline_query_seconds)):
+        lines.append('')
+        lines.append(f"{title:30s} {'calls':>7s} {'mean ms':>14s} {'p99 ms':>7s}")
+        for (label,) in histogram.labelled():
+            _, total, count = histogram.snapshot(label)
+            lines.append(f"{label:30s} {count:7d} {total / count * 1000:14.1f} "
+                         f"{histogram.quantile(0.99, label) * 1000:7.1f}")
+    lines.append('')
+    lines.append(inline_cache_summary())
+    lines.append(send_queue_summary())
+    return '\n'.join(lines)
+
+
+def inline_cache_summary() -> str:
+    hits = (inline_query_seconds.snapshot('hit') or (None, 0, 0))[2]
+    misses = (inline_query_seconds.snapshot('miss') or (None, 0, 0))[2]
+    hit_rate = hits / (hits + misses) if hits + misses else math.nan
+    return (f"inline cache hit rate {hit_rate:.1%} of {hits + misses} answered, "
+            f"{int(inline_queries_superseded.value())} superseded")
+
+
+def send_queue_summary() -> str:
+    def total(counter):
+        return int(sum(counter.values.values()))
+
+    return (f"sends coalesced {total(sends_coalesced)}, retried {total(sends_retried)}, "
+            f"dropped {total(sends_dropped)}")
+
+
+def measured(handler):
+    name = handler.__name__
+
+    @wraps(handler)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return handler(*args, **kwargs)
+        except Exception:
+            handler_errors.inc(name)
+            raise
+        finally:
+            handler_seconds.observe(time.perf_counter() - started, name)
+
+    return wrapper
+
+
+@contextmanager
+def timed(histogram: Histogram, *label_values):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - started, *label_values)
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        content = render_metrics().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_metrics_server(listen: str, port: int) -> Optional[ThreadingHTTPServer]:
+    # The bot runs without the endpoint rather than not at all, e.g. when another process has the port
+    try:
+        server = ThreadingHTTPServer((listen, port), MetricsRequestHandler)
+    except OSError as e:
+        logging.error(f"Not serving metrics on {listen}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics_server", daemon=True).start()
+    logging.info(f"Serving metrics on http://{listen}:{port}/metrics")
+    return server
@@ -1,4 +1,4 @@
-import geopandas
+import numpy as np
 import pandas as pd
 from geopy import distance
 import zipfile
@@ -7,9 +7,19 @@ import glob
 import shutil
 import logging
 import requests
+from utils.geo_utils import ellipsoidal_distance_km
 
 MRT_DATA_FOLDER = "./mrt_station_data"
+# Read from and written to the bundled data files, wherever this is run from
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+HAWKER_DATA_PATH = os.path.join(DATA_DIR, 'hawker_data.json')
+MRT_DATA_PATH = os.path.join(DATA_DIR, 'mrt_data.csv')
+MRT_HAWKER_DISTANCES_PATH = os.path.join(DATA_DIR, 'mrt_hawker_distances.json')
+MRT_INDEX_PATH = os.path.join(DATA_DIR, 'mrt_hawker_topk.npz')
 MRT_DATA_ZIP_FOLDER = "TrainStation.zip"
+TOP_K_HAWKERS = 20
+# Replace the vectorised distances of the pairs that make it into the top-K index with exact geodesic ones
+EXACT_TOP_K_DISTANCES = True
 
 
 def renew_data_folder():
@@ -47,54 +57,106 @@ def clean_mrt_station(s):
     return s.lower().replace(" mrt station", "")
 
 
-logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-                    level=logging.INFO)
-
-logging.info("Downloading new MRT data")
-download_and_unzip_mrt_data()
-
-logging.info("Reading SHP file")
-df = geopandas.read_file(os.path.join(MRT_DATA_FOLDER, "MRTLRTStnPtt.shp"))
-df = df.to_crs(crs="WGS84")
-
-df['lat'] = df['geometry'].apply(lambda p: p.y)
-df['long'] = df['geometry'].apply(lambda p: p.x)
-
-df = df[['STN_NAME', 'STN_NO', 'lat', 'long']].drop_duplicates(subset=["STN_NAME", "STN_NO"])
-logging.info("Converting SHP file to CSV file")
-df.to_csv("./mrt_data.csv")
-
-# Read in Hawker Centre locations
-logging.info("Reading in Hawker data file")
-hawker_data_df = pd.read_json("../data/hawker_data.json")[['hawker_name', 'hawker_coords']]
-
-mrt_hawker_dist = []
-for _, hawker_row in hawker_data_df.iterrows():
-    hawker_name = hawker_row['hawker_name']
-    h_coords = hawker_row['hawker_coords']
-
-    for idx, row in df.iterrows():
-        station_name = row['STN_NAME']
-        station_long = row['long']
-        station_lat = row['lat']
-        station_num = row['STN_NO']
-
-        dist = distance.distance(h_coords, (station_lat, station_long)).km
-        mrt_hawker_dist.append({
-            'hawker_name': hawker_name,
-            'station_name': station_name,
-            'station_name_cleaned': clean_mrt_station(station_name),
-            'distance': dist,
-            'station_num': station_num
-        })
-
-logging.info("Finished iterating through hawker and MRT information")
-mrt_hawker_df = pd.DataFrame(mrt_hawker_dist)
-mrt_hawker_df = mrt_hawker_df.sort_values(by=["hawker_name", "station_name", "station_num"])
-
-if not mrt_hawker_df.index.is_unique:
-    logging.info(mrt_hawker_df.index.value_counts())
-    logging.warning("MRT/Hawker DataFrame is not unique")
-
-logging.info("Number of Hawker/Station pairs: {}".format(len(mrt_hawker_df)))
-mrt_hawker_df.to_json("./mrt_hawker_distances.json", orient='records')
+def build_distance_matrix(hawker_coords, station_df) -> np.ndarray:
+    hawker_coords = np.asarray(list(hawker_coords), dtype=float)
+    station_lats = station_df['lat'].to_numpy(dtype=float)
+    station_longs = station_df['long'].to_numpy(dtype=float)
+
+    # Hawkers down the rows, stations across the columns
+    return ellipsoidal_distance_km(hawker_coords[:, [0]], hawker_coords[:, [1]],
+                                   station_lats[np.newaxis, :], station_longs[np.newaxis, :])
+
+
+def correct_top_k_distances(dist_matrix, hawker_coords, station_df, k=TOP_K_HAWKERS) -> np.ndarray:
+    hawker_coords = list(hawker_coords)
+    station_coords = list(zip(station_df['lat'], station_df['long']))
+    k = min(k, dist_matrix.shape[0])
+    nearest = np.argpartition(dist_matrix, k - 1, axis=0)[:k]
+
+    dist_matrix = dist_matrix.copy()
+    for station_idx, station_coord in enumerate(station_coords):
+        for hawker_idx in nearest[:, station_idx]:
+            dist_matrix[hawker_idx, station_idx] = distance.distance(hawker_coords[hawker_idx], station_coord).km
+    return dist_matrix
+
+
+def distance_matrix_to_df(dist_matrix, hawker_names, station_df) -> pd.DataFrame:
+    num_hawkers, num_stations = dist_matrix.shape
+    station_names = station_df['STN_NAME'].to_numpy()
+    return pd.DataFrame({
+        'hawker_name': np.repeat(np.asarray(hawker_names), num_stations),
+        'station_name': np.tile(station_names, num_hawkers),
+        'station_name_cleaned': np.tile([clean_mrt_station(s) for s in station_names], num_hawkers),
+        'distance': dist_matrix.ravel(),
+        'station_num': np.tile(station_df['STN_NO'].to_numpy(), num_hawkers),
+    })
+
+
+def build_station_topk_index(mrt_hawker_df, station_df, k=TOP_K_HAWKERS) -> dict:
+    # One row per station, one column per hawker centre
+    dist_matrix = mrt_hawker_df.pivot(index="station_num", columns="hawker_name", values="distance")
+    stations = mrt_hawker_df[["station_num", "station_name", "station_name_cleaned"]] \
+        .drop_duplicates(subset="station_num") \
+        .merge(station_df[["STN_NO", "lat", "long"]], left_on="station_num", right_on="STN_NO", how="left") \
+        .sort_values(by=["station_name_cleaned", "station_num"])
+    dist_matrix = dist_matrix.loc[stations["station_num"]]
+
+    k = min(k, dist_matrix.shape[1])
+    distances = dist_matrix.to_numpy()
+    nearest = np.argsort(distances, axis=1, kind="stable")[:, :k]
+
+    return {
+        'station_nums': stations['station_num'].to_numpy(dtype=str),
+        'station_names': stations['station_name'].to_numpy(dtype=str),
+        'station_names_cleaned': stations['station_name_cleaned'].to_numpy(dtype=str),
+        'station_lats': stations['lat'].to_numpy(dtype=float),
+        'station_longs': stations['long'].to_numpy(dtype=float),
+        'hawker_names': dist_matrix.columns.to_numpy(dtype=str),
+        'hawker_idx': nearest.astype(np.int16),
+        'distances': np.take_along_axis(distances, nearest, axis=1).astype(np.float32),
+    }
+
+
+if __name__ == '__main__':
+    # Only needed to read LTA's shapefile
+    import geopandas
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                        level=logging.INFO)
+
+    logging.info("Downloading new MRT data")
+    download_and_unzip_mrt_data()
+
+    logging.info("Reading SHP file")
+    df = geopandas.read_file(os.path.join(MRT_DATA_FOLDER, "MRTLRTStnPtt.shp"))
+    df = df.to_crs(crs="WGS84")
+
+    df['lat'] = df['geometry'].apply(lambda p: p.y)
+    df['long'] = df['geometry'].apply(lambda p: p.x)
+
+    df = df[['STN_NAME', 'STN_NO', 'lat', 'long']].drop_duplicates(subset=["STN_NAME", "STN_NO"])
+    logging.info("Converting SHP file to CSV file")
+    df.to_csv(MRT_DATA_PATH)
+
+    # Read in Hawker Centre locations
+    logging.info("Reading in Hawker data file")
+    hawker_data_df = pd.read_json(HAWKER_DATA_PATH)[['hawker_name', 'hawker_coords']]
+
+    dist_matrix = build_distance_matrix(hawker_data_df['hawker_coords'], df)
+    if EXACT_TOP_K_DISTANCES:
+        logging.info("Computing exact distances for the top-{} hawkers of each station".format(TOP_K_HAWKERS))
+        dist_matrix = correct_top_k_distances(dist_matrix, hawker_data_df['hawker_coords'], df)
+
+    logging.info("Finished computing distances between hawker and MRT locations")
+    mrt_hawker_df = distance_matrix_to_df(dist_matrix, hawker_data_df['hawker_name'], df)
+    mrt_hawker_df = mrt_hawker_df.sort_values(by=["hawker_name", "station_name", "station_num"])
+
+    if not mrt_hawker_df.index.is_unique:
+        logging.info(mrt_hawker_df.index.value_counts())
+        logging.warning("MRT/Hawker DataFrame is not unique")
+
+    logging.info("Number of Hawker/Station pairs: {}".format(len(mrt_hawker_df)))
+    mrt_hawker_df.to_json(MRT_HAWKER_DISTANCES_PATH, orient='records')
+
+    logging.info("Building top-{} nearest hawker index per station".format(TOP_K_HAWKERS))
+    np.savez_compressed(MRT_INDEX_PATH, **build_station_topk_index(mrt_hawker_df, df))
@@ -0,0 +1,90 @@
+import logging
+import multiprocessing
+import signal
+import threading
+from utils.hawker_data import build_hawker_data, data_version
+from utils.snapshot_cache import load_snapshot
+
+# How long a handler waits for a pool process before running the query itself
+QUERY_TIMEOUT = 5  # seconds
+
+# The data snapshot the pool process is serving, the snapshot cache it is read from, and a version found not to be
+# in the cache, which is not looked for again
+worker_data = None
+worker_cache_dir = None
+worker_missing_version = None
+
+
+def pool_context():
+    # The processes are forked from a single-threaded server process rather than from the bot, whose other threads
+    # may hold locks (logging's, the HTTP pools') at the time of the fork
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(['utils.hawker_data'])
+        return context
+    return multiprocessing.get_context('spawn')
+
+
+def init_worker(cache_dir):
+    global worker_cache_dir
+
+    # Ctrl-C and shutdown are the parent's business
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    worker_cache_dir = cache_dir
+
+
+def load_worker_data(version):
+    global worker_data, worker_missing_version
+
+    # The bot writes each snapshot to the cache before serving from it. The cached arrays are memory-mapped, so
+    # the processes share their pages rather than each loading a copy.
+    loaded = load_snapshot(worker_cache_dir, verify=False)
+    if loaded is None or data_version(loaded[2]) != version:
+        worker_missing_version = version
+        return
+    worker_data = build_hawker_data(*loaded)
+
+
+def run_in_worker(version, query_function, args):
+    if worker_data is None or worker_data.version != version:
+        if version == worker_missing_version:
+            return None
+        load_worker_data(version)
+        # A query for a snapshot that is older than the cache, or not cached at all, runs in the bot
+        if worker_data is None or worker_data.version != version:
+            return None
+    return query_function(worker_data, *args)
+
+
+class QueryPool:
+    def __init__(self, processes: int, cache_dir=None):
+        self.processes = processes
+        self.cache_dir = cache_dir
+        self.pool = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        # Started once; the processes load each new snapshot from the cache when a query for it first arrives
+        with self.lock:
+            self.pool = pool_context().Pool(self.processes, initializer=init_worker, initargs=(self.cache_dir,))
+        logging.info(f"Started {self.processes} query processes")
+
+    def run(self, data, query_function, *args):
+        pool = self.pool
+        if pool is not None:
+            try:
+                result = pool.apply_async(run_in_worker, (data.version, query_function, args)).get(QUERY_TIMEOUT)
+            except (ValueError, multiprocessing.TimeoutError):
+                # Closed in the meantime, or stuck
+                result = None
+            if result is not None:
+                return result
+        return query_function(data, *args)
+
+    def close(self):
+        with self.lock:
+            pool, self.pool = self.pool, None
+        if pool is not None:
+            pool.close()
+            pool.join()
@@ -0,0 +1,88 @@
+import threading
+import time
+
+# Telegram's documented limits: about 30 messages per second overall, one per second in a private chat
+# (short bursts are tolerated) and 20 per minute in a group
+GLOBAL_RATE = 30
+# Sends are spread evenly rather than let through in bursts, so no one-second window goes over the global rate
+GLOBAL_BURST = 1
+PRIVATE_CHAT_RATE = 1
+PRIVATE_CHAT_BURST = 3
+GROUP_CHAT_RATE = 20 / 60
+GROUP_CHAT_BURST = 20
+# Idle buckets are full again and can be dropped
+MAX_CHAT_BUCKETS = 10000
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, now: float) -> float:
+        # Takes a token, going into debt if there is none, and returns how long to wait before using it
+        self.tokens = self.available(now)
+        self.updated = now
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+    def available(self, now: float) -> float:
+        return min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+
+    def hold(self, now: float, seconds: float):
+        # Makes the next token available no sooner than seconds from now
+        self.tokens = min(self.available(now), 1 - seconds * self.rate)
+        self.updated = now
+
+    def is_full(self, now: float) -> bool:
+        return self.available(now) >= self.capacity
+
+
+class SendLimiter:
+    def __init__(self, global_rate=GLOBAL_RATE):
+        self.lock = threading.Lock()
+        self.global_bucket = TokenBucket(global_rate, GLOBAL_BURST)
+        self.chat_buckets = {}
+
+    def chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            # Group and channel ids are negative, channels can also be given by @username
+            if str(chat_id).startswith(('-', '@')):
+                bucket = TokenBucket(GROUP_CHAT_RATE, GROUP_CHAT_BURST)
+            else:
+                bucket = TokenBucket(PRIVATE_CHAT_RATE, PRIVATE_CHAT_BURST)
+            self.chat_buckets[chat_id] = bucket
+        return bucket
+
+    def prune(self, now: float):
+        self.chat_buckets = {c: b for c, b in self.chat_buckets.items() if not b.is_full(now)}
+
+    def reserve(self, chat_id) -> float:
+        with self.lock:
+            now = time.monotonic()
+            if len(self.chat_buckets) > MAX_CHAT_BUCKETS:
+                self.prune(now)
+            return max(self.global_bucket.reserve(now), self.chat_bucket(chat_id).reserve(now))
+
+    def back_off(self, chat_id, retry_after: float) -> float:
+        # Telegram's flood control asked to wait before sending again. Whether it was this chat or the bot as a whole
+        # that sent too much is not said, so everything waits. Returns how long until the chat's next send.
+        with self.lock:
+            now = time.monotonic()
+            self.global_bucket.hold(now, retry_after)
+            self.chat_bucket(chat_id).hold(now, retry_after)
+            return max(self.global_bucket.reserve(now), self.chat_bucket(chat_id).reserve(now))
+
+    def try_acquire(self, chat_id) -> bool:
+        # Takes a send slot only if one is free right now, for replies that cannot be delayed
+        with self.lock:
+            now = time.monotonic()
+            buckets = (self.global_bucket, self.chat_bucket(chat_id))
+            if any(bucket.available(now) < 1 for bucket in buckets):
+                return False
+            for bucket in buckets:
+                bucket.reserve(now)
+            return True
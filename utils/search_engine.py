@@ -0,0 +1,197 @@
+from bisect import bisect_left
+from collections import defaultdict, namedtuple
+from typing import Dict, List, Optional, Tuple
+import math
+import re
+import numpy as np
+
+try:
+    from rapidfuzz import fuzz, process
+except ImportError:
+    # Same scorer, without the batched C++ extractor
+    from fuzzywuzzy import fuzz
+    process = None
+
+# Candidates kept from the trigram shortlist before fuzzy scoring
+SHORTLIST_SIZE = 40
+
+# A query word found in a hawker's name counts for more than one found in its description
+FIELD_WEIGHTS = {
+    'name': 3.0,
+    'station': 2.0,
+    'address': 1.5,
+    'description': 0.5,
+}
+# How much a query word counts when it only matches a vocabulary word by prefix or by typo
+PREFIX_MATCH = 0.9
+MIN_PREFIX_LENGTH = 3
+FUZZY_MATCH = 0.8
+FUZZY_CUTOFF = 80
+FUZZY_MATCHES_PER_WORD = 5
+# Weight of the whole-name partial_ratio score (0-1) next to the field scores
+NAME_SIMILARITY_WEIGHT = 2.0
+
+
+# What a search leaves for the next one to start from: the score of each word, and the trigram counts of the query
+SearchState = namedtuple("SearchState", ["query", "word_scores", "trigram_counts"])
+
+
+def normalise(text: str) -> str:
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", str(text).lower()).split())
+
+
+def trigrams(text: str) -> set:
+    padded = f" {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class HawkerSearchEngine:
+    def __init__(self, names, addresses, descriptions, nearby_stations=None):
+        self.names = list(names)
+        self.normalised_names = [normalise(n) for n in self.names]
+        self.normalised_addresses = [normalise(a) for a in addresses]
+        self.normalised_descriptions = [normalise(d) for d in descriptions]
+        if nearby_stations is None:
+            nearby_stations = [[] for _ in self.names]
+        self.normalised_stations = [normalise(" ".join(s)) for s in nearby_stations]
+
+        postings = defaultdict(list)
+        for doc_id, name in enumerate(self.normalised_names):
+            for trigram in trigrams(name):
+                postings[trigram].append(doc_id)
+        self.trigram_index = {t: np.array(ids, dtype=np.int32) for t, ids in postings.items()}
+        self.build_token_index()
+
+    def build_token_index(self):
+        fields = {
+            'name': self.normalised_names,
+            'station': self.normalised_stations,
+            'address': self.normalised_addresses,
+            'description': self.normalised_descriptions,
+        }
+
+        # Sum of the weights of the fields a word appears in, per hawker
+        token_weights = defaultdict(lambda: defaultdict(float))
+        for field, texts in fields.items():
+            for doc_id, text in enumerate(texts):
+                for token in set(text.split()):
+                    token_weights[token][doc_id] += FIELD_WEIGHTS[field]
+
+        # Words found in most hawkers ("food", "centre") carry little information
+        num_docs = len(self.names)
+        self.token_index = {}
+        for token, doc_weights in token_weights.items():
+            idf = math.log(1 + num_docs / len(doc_weights))
+            doc_ids = np.fromiter(doc_weights.keys(), dtype=np.int32, count=len(doc_weights))
+            weights = np.fromiter(doc_weights.values(), dtype=np.float32, count=len(doc_weights)) * idf
+            self.token_index[token] = (doc_ids, weights)
+        self.vocabulary = sorted(self.token_index)
+
+    def __len__(self):
+        return len(self.names)
+
+    def matching_tokens(self, word: str) -> List[Tuple[str, float]]:
+        matches = {}
+        if word in self.token_index:
+            matches[word] = 1.0
+
+        if len(word) >= MIN_PREFIX_LENGTH:
+            i = bisect_left(self.vocabulary, word)
+            while i < len(self.vocabulary) and self.vocabulary[i].startswith(word):
+                matches.setdefault(self.vocabulary[i], PREFIX_MATCH)
+                i += 1
+
+            if process is not None:
+                typos = process.extract(word, self.vocabulary, scorer=fuzz.ratio, processor=None,
+                                        score_cutoff=FUZZY_CUTOFF, limit=FUZZY_MATCHES_PER_WORD)
+                for token, score, _ in typos:
+                    matches.setdefault(token, FUZZY_MATCH * score / 100)
+
+        return list(matches.items())
+
+    def word_scores(self, word: str) -> np.ndarray:
+        # Each query word counts once per hawker, through its best matching vocabulary word
+        scores = np.zeros(len(self), dtype=np.float32)
+        for token, match in self.matching_tokens(word):
+            doc_ids, weights = self.token_index[token]
+            scores[doc_ids] = np.maximum(scores[doc_ids], match * weights)
+        return scores
+
+    def field_scores(self, query: str, word_scores: Optional[Dict[str, np.ndarray]] = None) -> np.ndarray:
+        # word_scores holds the scores of words already scored, and gets those of the others
+        if word_scores is None:
+            word_scores = {}
+        scores = np.zeros(len(self), dtype=np.float32)
+        for word in query.split():
+            if word not in word_scores:
+                word_scores[word] = self.word_scores(word)
+            scores += word_scores[word]
+        return scores
+
+    def trigram_counts(self, query: str, previous: Optional[SearchState] = None) -> np.ndarray:
+        # Number of the query's trigrams in each hawker's name; from the previous query's counts, only the trigrams
+        # that differ are looked up
+        if previous is None:
+            counts = np.zeros(len(self), dtype=np.int32)
+            removed, added = set(), trigrams(query)
+        else:
+            counts = previous.trigram_counts.copy()
+            previous_trigrams, query_trigrams = trigrams(previous.query), trigrams(query)
+            removed, added = previous_trigrams - query_trigrams, query_trigrams - previous_trigrams
+        # A hawker appears at most once in the postings of a trigram
+        for trigram in removed:
+            if trigram in self.trigram_index:
+                counts[self.trigram_index[trigram]] -= 1
+        for trigram in added:
+            if trigram in self.trigram_index:
+                counts[self.trigram_index[trigram]] += 1
+        return counts
+
+    def shortlist(self, query: str, size=SHORTLIST_SIZE, counts: Optional[np.ndarray] = None) -> np.ndarray:
+        if counts is None:
+            counts = self.trigram_counts(query)
+        num_hits = np.count_nonzero(counts)
+        if num_hits == 0:
+            return np.arange(len(self))
+        if num_hits <= size:
+            return np.flatnonzero(counts)
+        return np.argpartition(-counts, size - 1)[:size]
+
+    def name_scores(self, query: str, candidates) -> dict:
+        choices = {int(doc_id): self.normalised_names[doc_id] for doc_id in candidates}
+        if process is not None:
+            matches = process.extract(query, choices, scorer=fuzz.partial_ratio, processor=None, limit=None)
+            return {doc_id: score / 100 for _, score, doc_id in matches}
+        return {doc_id: fuzz.partial_ratio(name, query) / 100 for doc_id, name in choices.items()}
+
+    def search(self, query: str, limit=10) -> List[Tuple[str, float]]:
+        return self.search_incremental(query, limit)[0]
+
+    def search_incremental(self, query: str, limit=10,
+                           previous: Optional[SearchState] = None) -> Tuple[List[Tuple[str, float]],
+                                                                            Optional[SearchState]]:
+        # Given the state of an earlier search, such as the same user's previous keystroke, the words it has in
+        # common with this one are not scored again and its trigram counts are updated rather than recounted
+        query = normalise(query)
+        if not query:
+            return [], None
+
+        known_word_scores = previous.word_scores if previous is not None else {}
+        word_scores = {word: known_word_scores[word] for word in query.split() if word in known_word_scores}
+        field_scores = self.field_scores(query, word_scores)
+        trigram_counts = self.trigram_counts(query, previous)
+        size = max(SHORTLIST_SIZE, limit)
+        by_fields = np.flatnonzero(field_scores)
+        if len(by_fields) > size:
+            by_fields = by_fields[np.argpartition(-field_scores[by_fields], size - 1)[:size]]
+        candidates = np.union1d(by_fields, self.shortlist(query, size, trigram_counts))
+
+        name_scores = self.name_scores(query, candidates)
+        scored = sorted(
+            ((float(field_scores[doc_id]) + NAME_SIMILARITY_WEIGHT * name_scores[int(doc_id)], int(doc_id))
+             for doc_id in candidates),
+            key=lambda s: (-s[0], s[1]),
+        )[:limit]
+
+        results = [(self.names[doc_id], score) for score, doc_id in scored]
+        return results, SearchState(query, word_scores, trigram_counts)
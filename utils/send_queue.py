@@ -0,0 +1,147 @@
+from collections import deque
+from typing import Callable, Dict, Hashable, Optional
+import heapq
+import itertools
+import logging
+import threading
+import time
+from telegram.error import BadRequest, NetworkError, RetryAfter, TelegramError
+from utils.metrics import send_queue_seconds, sends_coalesced, sends_dropped, sends_retried
+from utils.rate_limiter import SendLimiter
+
+# A send that fails with a network error is tried this many times, waiting RETRY_BACKOFF * 2^n seconds in between
+MAX_SEND_ATTEMPTS = 4
+RETRY_BACKOFF = 0.5
+# Methods where a later call for the same message replaces one still waiting to be sent. editMessageText sets the
+# whole message, keyboard included.
+COALESCED_METHODS = {'editMessageText'}
+
+
+class PendingSend:
+    __slots__ = ('endpoint', 'data', 'timeout', 'api_kwargs', 'key', 'enqueued', 'attempts')
+
+    def __init__(self, endpoint, data, timeout, api_kwargs, key):
+        self.endpoint = endpoint
+        self.data = data
+        self.timeout = timeout
+        self.api_kwargs = api_kwargs
+        self.key = key
+        self.enqueued = time.monotonic()
+        self.attempts = 0
+
+
+class SendQueue:
+    def __init__(self, send: Callable, send_limiter: SendLimiter, workers: int):
+        self.send = send
+        self.send_limiter = send_limiter
+        # Sends waiting per chat, in order. A chat is only sent to by one worker at a time, so its messages arrive in
+        # the order they were queued.
+        self.chats: Dict[Hashable, deque] = {}
+        # (time, sequence number, chat id) for each chat whose next send is waiting for its turn
+        self.due = []
+        self.sequence = itertools.count()
+        self.unfinished = 0
+        self.closed = False
+        # Workers wait on condition for a send to be due; anything waiting for sends to finish waits on progress
+        lock = threading.Lock()
+        self.condition = threading.Condition(lock)
+        self.progress = threading.Condition(lock)
+        for i in range(workers):
+            threading.Thread(target=self.work, name=f"send_queue_{i}", daemon=True).start()
+
+    def enqueue(self, endpoint: str, data: Dict, timeout=None, api_kwargs=None):
+        chat_id = data['chat_id']
+        key = (endpoint, data.get('message_id')) if endpoint in COALESCED_METHODS else None
+        with self.condition:
+            pending = self.chats.get(chat_id)
+            if pending is not None and key is not None:
+                for send in pending:
+                    if send.key == key:
+                        # Superseded before it went out, e.g. "Searching..." followed by the results
+                        send.data, send.timeout, send.api_kwargs = data, timeout, api_kwargs
+                        sends_coalesced.inc(endpoint)
+                        return
+
+            self.unfinished += 1
+            send = PendingSend(endpoint, data, timeout, api_kwargs, key)
+            if pending is None:
+                self.chats[chat_id] = deque([send])
+                self.schedule(chat_id, self.send_limiter.reserve(chat_id))
+            else:
+                pending.append(send)
+
+    def schedule(self, chat_id, delay: float):
+        heapq.heappush(self.due, (time.monotonic() + delay, next(self.sequence), chat_id))
+        self.condition.notify()
+
+    def next_send(self):
+        with self.condition:
+            while not self.closed:
+                now = time.monotonic()
+                if self.due and self.due[0][0] <= now:
+                    _, _, chat_id = heapq.heappop(self.due)
+                    return chat_id, self.chats[chat_id].popleft()
+                self.condition.wait(self.due[0][0] - now if self.due else None)
+            return None, None
+
+    def work(self):
+        while True:
+            chat_id, send = self.next_send()
+            if send is None:
+                return
+            retry_delay = self.attempt(chat_id, send)
+
+            with self.condition:
+                pending = self.chats[chat_id]
+                if retry_delay is not None:
+                    pending.appendleft(send)
+                    self.schedule(chat_id, retry_delay)
+                    continue
+                self.unfinished -= 1
+                self.progress.notify_all()
+                if pending:
+                    self.schedule(chat_id, self.send_limiter.reserve(chat_id))
+                else:
+                    del self.chats[chat_id]
+
+    def attempt(self, chat_id, send: PendingSend) -> Optional[float]:
+        # Returns how long to wait before trying the send again, or None when it is done with
+        try:
+            self.send(send.endpoint, send.data, send.timeout, send.api_kwargs)
+            send_queue_seconds.observe(time.monotonic() - send.enqueued, send.endpoint)
+            return None
+        except RetryAfter as e:
+            # No thread is held up while waiting
+            logging.warning(f"{send.endpoint} to {chat_id} hit flood control, retrying in {e.retry_after} s")
+            sends_retried.inc('retry_after')
+            return self.send_limiter.back_off(chat_id, e.retry_after)
+        except NetworkError as e:
+            # Includes time-outs, but also BadRequest, which would fail again
+            send.attempts += 1
+            if not isinstance(e, BadRequest) and send.attempts < MAX_SEND_ATTEMPTS:
+                sends_retried.inc('network_error')
+                return RETRY_BACKOFF * 2 ** (send.attempts - 1)
+            logging.warning(f"{send.endpoint} to {chat_id} failed: {e}")
+        except TelegramError as e:
+            logging.warning(f"{send.endpoint} to {chat_id} failed: {e}")
+        except Exception:
+            logging.exception(f"{send.endpoint} to {chat_id} failed")
+        sends_dropped.inc(send.endpoint)
+        return None
+
+    def wait_below(self, limit: int, timeout: Optional[float] = None) -> bool:
+        # Lets a producer of many sends, such as a broadcast, keep only so many of them queued
+        with self.progress:
+            return self.progress.wait_for(lambda: self.unfinished < limit, timeout)
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        with self.progress:
+            return self.progress.wait_for(lambda: self.unfinished == 0, timeout)
+
+    def close(self, timeout: Optional[float] = None):
+        # Sends what is queued, for up to timeout seconds, then stops the workers
+        if not self.join(timeout):
+            logging.warning(f"Stopped with {self.unfinished} sends still queued")
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
@@ -0,0 +1,126 @@
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+import hashlib
+import json
+import logging
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+# Bump whenever the layout of the cached arrays changes, so that old caches are ignored
+CACHE_FORMAT_VERSION = 2
+MANIFEST_FILE = "manifest.json"
+
+
+def checksum_bytes(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+def checksum_file(path) -> str:
+    with open(path, 'rb') as f:
+        return checksum_bytes(f.read())
+
+
+def hawker_df_to_arrays(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    arrays = {'hawker_name': df.index.to_numpy(dtype=str)}
+    for column in df.columns:
+        series = df[column]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            # Stored as codes, with the categories alongside
+            arrays[column] = series.cat.codes.to_numpy()
+            arrays[column + '.categories'] = series.cat.categories.to_numpy(dtype=str)
+        elif pd.api.types.is_datetime64_any_dtype(series):
+            arrays[column] = series.to_numpy(dtype='datetime64[D]')
+        elif pd.api.types.is_bool_dtype(series) or pd.api.types.is_numeric_dtype(series):
+            arrays[column] = series.to_numpy()
+        else:
+            arrays[column] = series.to_numpy(dtype=str)
+    return arrays
+
+
+def arrays_to_hawker_df(arrays: Dict[str, np.ndarray], columns) -> pd.DataFrame:
+    data = {}
+    for column in columns:
+        if column + '.categories' in arrays:
+            data[column] = pd.Categorical.from_codes(arrays[column], categories=arrays[column + '.categories'])
+        else:
+            data[column] = arrays[column]
+    return pd.DataFrame(data, index=pd.Index(arrays['hawker_name'], name='hawker_name'))
+
+
+def save_snapshot(cache_dir, hawker_data_df: pd.DataFrame, mrt_index: Dict[str, np.ndarray],
+                  source_checksums: Dict[str, str], bundled_checksums: Optional[Dict[str, str]] = None):
+    snapshot_name = "snapshot-" + checksum_bytes(json.dumps(source_checksums, sort_keys=True).encode())[:12]
+    os.makedirs(os.path.join(cache_dir, snapshot_name), exist_ok=True)
+
+    hawker_arrays = hawker_df_to_arrays(hawker_data_df)
+    files = {}
+    for group, arrays in (('hawker', hawker_arrays), ('mrt', mrt_index)):
+        for name, array in arrays.items():
+            relative_path = f"{snapshot_name}/{group}.{name}.npy"
+            path = os.path.join(cache_dir, relative_path)
+            # Written aside and renamed, as the bot may still have the previous file memory-mapped
+            with open(path + ".tmp", 'wb') as f:
+                np.save(f, np.asarray(array), allow_pickle=False)
+            os.replace(path + ".tmp", path)
+            files[relative_path] = checksum_file(path)
+
+    manifest = {
+        'version': CACHE_FORMAT_VERSION,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'snapshot': snapshot_name,
+        'sources': source_checksums,
+        # The bundled files at the time, which differ from the sources when the data came from the network
+        'bundled': bundled_checksums if bundled_checksums is not None else source_checksums,
+        'hawker_columns': list(hawker_data_df.columns),
+        'hawker_arrays': list(hawker_arrays),
+        'mrt_keys': list(mrt_index),
+        'files': files,
+    }
+
+    # Readers only ever see a complete snapshot: the manifest is replaced last, in one rename
+    manifest_path = os.path.join(cache_dir, MANIFEST_FILE)
+    with open(manifest_path + ".tmp", 'w') as f:
+        json.dump(manifest, f)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+    for entry in os.listdir(cache_dir):
+        if entry.startswith("snapshot-") and entry != snapshot_name:
+            shutil.rmtree(os.path.join(cache_dir, entry), ignore_errors=True)
+
+
+def load_snapshot(cache_dir, verify=True, bundled_checksums: Optional[Dict[str, str]] = None) \
+        -> Optional[Tuple[pd.DataFrame, Dict[str, np.ndarray], Dict[str, str]]]:
+    manifest_path = os.path.join(cache_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest.get('version') != CACHE_FORMAT_VERSION:
+            logging.info(f"Ignoring cache with format version {manifest.get('version')}")
+            return None
+        # Bundled files that changed since, e.g. with a deploy, are newer than the cache
+        if bundled_checksums is not None and manifest.get('bundled', manifest['sources']) != bundled_checksums:
+            logging.info("Ignoring cache from before the bundled data changed")
+            return None
+
+        snapshot_name = manifest['snapshot']
+        for relative_path, checksum in manifest['files'].items():
+            if verify and checksum_file(os.path.join(cache_dir, relative_path)) != checksum:
+                logging.warning(f"Checksum mismatch for cached {relative_path}")
+                return None
+
+        def load_array(group, name):
+            path = os.path.join(cache_dir, snapshot_name, f"{group}.{name}.npy")
+            return np.load(path, mmap_mode='r', allow_pickle=False)
+
+        hawker_arrays = {name: load_array('hawker', name) for name in manifest['hawker_arrays']}
+        mrt_index = {key: load_array('mrt', key) for key in manifest['mrt_keys']}
+    except (OSError, ValueError, KeyError) as e:
+        logging.warning(f"Failed to read cache in {cache_dir}: {e}")
+        return None
+
+    return arrays_to_hawker_df(hawker_arrays, manifest['hawker_columns']), mrt_index, manifest['sources']
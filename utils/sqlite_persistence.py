@@ -0,0 +1,158 @@
+from collections import defaultdict
+from typing import Callable, Dict, Optional, Tuple
+import json
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+from telegram.ext import BasePersistence
+
+KEYED_TABLES = ('user_data', 'chat_data')
+SINGLE_ROW_TABLES = ('bot_data', 'callback_data')
+
+
+class LazyDataDict(defaultdict):
+    # Reads an entry from the database the first time it is used, so start-up does not read every row
+    def __init__(self, load: Callable[[int], dict]):
+        super().__init__(dict)
+        self.load = load
+
+    def __missing__(self, key):
+        value = self.load(key)
+        self[key] = value
+        return value
+
+    def copy(self):
+        new_dict = LazyDataDict(self.load)
+        new_dict.update(self)
+        return new_dict
+
+    __copy__ = copy
+
+
+class SQLitePersistence(BasePersistence):
+    def __init__(self, filename: str, store_user_data=True, store_chat_data=True, store_bot_data=True,
+                 store_callback_data=False):
+        super().__init__(store_user_data=store_user_data, store_chat_data=store_chat_data,
+                         store_bot_data=store_bot_data, store_callback_data=store_callback_data)
+        self.filename = filename
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        # Readers are never blocked by the flush, and a commit does not wait for a full fsync
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            for table in KEYED_TABLES + SINGLE_ROW_TABLES:
+                self.connection.execute(
+                    f"CREATE TABLE IF NOT EXISTS {table} (id INTEGER PRIMARY KEY, data BLOB NOT NULL)"
+                )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS conversations "
+                "(name TEXT NOT NULL, key TEXT NOT NULL, state BLOB NOT NULL, PRIMARY KEY (name, key))"
+            )
+
+        # Pickled values as last read or written, to tell which ones have changed
+        self.persisted = {table: {} for table in KEYED_TABLES + SINGLE_ROW_TABLES}
+        self.dirty = {table: {} for table in KEYED_TABLES + SINGLE_ROW_TABLES}
+        self.dirty_conversations = {}
+
+    def read_blob(self, table: str, key: int) -> Optional[bytes]:
+        with self.lock:
+            row = self.connection.execute(f"SELECT data FROM {table} WHERE id = ?", (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def load(self, table: str, key: int, default):
+        blob = self.read_blob(table, key)
+        value = default() if blob is None else pickle.loads(blob)
+        with self.lock:
+            self.persisted[table][key] = pickle.dumps(value) if blob is None else blob
+        return value
+
+    def mark_changed(self, table: str, key: int, value):
+        # The dispatcher reports every user and chat it has seen after each update, changed or not
+        blob = pickle.dumps(value)
+        with self.lock:
+            if self.persisted[table].get(key) == blob:
+                return
+            self.persisted[table][key] = blob
+            self.dirty[table][key] = blob
+
+    def get_user_data(self) -> LazyDataDict:
+        return LazyDataDict(lambda user_id: self.load('user_data', user_id, dict))
+
+    def get_chat_data(self) -> LazyDataDict:
+        return LazyDataDict(lambda chat_id: self.load('chat_data', chat_id, dict))
+
+    def get_bot_data(self) -> dict:
+        return self.load('bot_data', 0, dict)
+
+    def get_callback_data(self) -> Optional[Tuple]:
+        if self.read_blob('callback_data', 0) is None:
+            return None
+        return self.load('callback_data', 0, tuple)
+
+    def get_conversations(self, name: str) -> Dict[Tuple, object]:
+        with self.lock:
+            rows = self.connection.execute("SELECT key, state FROM conversations WHERE name = ?", (name,)).fetchall()
+        return {tuple(json.loads(key)): pickle.loads(state) for key, state in rows}
+
+    def update_user_data(self, user_id: int, data: dict):
+        self.mark_changed('user_data', user_id, data)
+
+    def update_chat_data(self, chat_id: int, data: dict):
+        self.mark_changed('chat_data', chat_id, data)
+
+    def update_bot_data(self, data: dict):
+        self.mark_changed('bot_data', 0, data)
+
+    def update_callback_data(self, data: Tuple):
+        self.mark_changed('callback_data', 0, data)
+
+    def update_conversation(self, name: str, key: Tuple, new_state: Optional[object]):
+        with self.lock:
+            self.dirty_conversations[(name, json.dumps(key))] = new_state
+
+    def flush(self):
+        # Only what changed since the last flush is written, in one transaction
+        with self.lock:
+            dirty, self.dirty = self.dirty, {table: {} for table in self.dirty}
+            conversations, self.dirty_conversations = self.dirty_conversations, {}
+            if not conversations and not any(dirty.values()):
+                return
+
+            with self.connection:
+                for table, rows in dirty.items():
+                    self.connection.executemany(f"INSERT OR REPLACE INTO {table} (id, data) VALUES (?, ?)",
+                                                rows.items())
+                for (name, key), state in conversations.items():
+                    if state is None:
+                        self.connection.execute("DELETE FROM conversations WHERE name = ? AND key = ?", (name, key))
+                    else:
+                        self.connection.execute("INSERT OR REPLACE INTO conversations (name, key, state) "
+                                                "VALUES (?, ?, ?)", (name, key, pickle.dumps(state)))
+
+    def migrate_from_pickle(self, pickle_filename: str):
+        # Imports a single-file PicklePersistence store, which is then renamed so that it is only imported once
+        with open(pickle_filename, 'rb') as f:
+            data = pickle.load(f)
+
+        with self.lock, self.connection:
+            for table in KEYED_TABLES:
+                self.connection.executemany(f"INSERT OR REPLACE INTO {table} (id, data) VALUES (?, ?)",
+                                            ((key, pickle.dumps(value)) for key, value in data[table].items()))
+            for table in SINGLE_ROW_TABLES:
+                if data.get(table):
+                    self.connection.execute(f"INSERT OR REPLACE INTO {table} (id, data) VALUES (0, ?)",
+                                            (pickle.dumps(data[table]),))
+            for name, states in data['conversations'].items():
+                self.connection.executemany("INSERT OR REPLACE INTO conversations (name, key, state) VALUES (?, ?, ?)",
+                                            ((name, json.dumps(key), pickle.dumps(state))
+                                             for key, state in states.items()))
+
+        # Moves the import out of the write-ahead log, which would otherwise be replayed on every start
+        with self.lock:
+            self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        os.replace(pickle_filename, pickle_filename + ".migrated")
+        logging.info(f"Migrated {len(data['user_data'])} users and {len(data['chat_data'])} chats "
+                     f"from {pickle_filename} to {self.filename}")
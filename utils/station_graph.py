@@ -0,0 +1,141 @@
+from bisect import bisect_right
+from collections import namedtuple
+from typing import Collection, Dict, List, Optional
+import heapq
+import re
+import numpy as np
+from utils.geo_utils import ellipsoidal_distance_km
+
+# A line prefix and an ordinal, e.g. EW13; interchanges list one code per line, e.g. "EW13 / NS25"
+STATION_CODE_PATTERN = re.compile(r"([A-Z]+)(\d*)")
+# The Punggol and Sengkang town centre stations have no ordinal; each LRT loop starts and ends at one
+LOOP_HUBS = {'PTC': ('PE', 'PW'), 'STC': ('SE', 'SW')}
+
+RouteHawker = namedtuple("RouteHawker", ["hawker_idx", "distance", "station"])
+
+
+def station_name(station_name_cleaned: str) -> str:
+    # Merges an LRT station with the MRT station of the same name, e.g. Punggol NE17 and PTC
+    return station_name_cleaned.replace(" lrt station", "")
+
+
+class StationGraph:
+    def __init__(self, mrt_index: Dict[str, np.ndarray], hawker_names: Optional[Collection[str]] = None):
+        names = [station_name(name) for name in mrt_index["station_names_cleaned"]]
+        # One node per station name, so an interchange is one node on each of its lines
+        self.names = sorted(set(names))
+        nodes = {name: node for node, name in enumerate(self.names)}
+        self.station_codes = [[] for _ in self.names]
+        self.nodes_by_code = {}
+        node_rows = [[] for _ in self.names]
+        lines = {}
+        for row, (name, station_num) in enumerate(zip(names, mrt_index["station_nums"])):
+            node = nodes[name]
+            node_rows[node].append(row)
+            for code in station_num.split("/"):
+                code = code.strip()
+                self.station_codes[node].append(code)
+                self.nodes_by_code[code.lower()] = node
+                line, ordinal = STATION_CODE_PATTERN.fullmatch(code).groups()
+                if ordinal:
+                    lines.setdefault(line, []).append((int(ordinal), node))
+
+        self.lats = np.array([mrt_index["station_lats"][rows].mean() for rows in node_rows])
+        self.longs = np.array([mrt_index["station_longs"][rows].mean() for rows in node_rows])
+
+        # Consecutive stations on a line are neighbours, skipping the ordinals that are not in the data
+        self.neighbours = [{} for _ in self.names]
+        for line, stations in lines.items():
+            stations = [node for _, node in sorted(stations)]
+            for hub_code, hub_lines in LOOP_HUBS.items():
+                if line in hub_lines and hub_code.lower() in self.nodes_by_code:
+                    hub = self.nodes_by_code[hub_code.lower()]
+                    stations = [hub] + stations + [hub]
+            for a, b in zip(stations, stations[1:]):
+                if a != b:
+                    self.connect(a, b)
+
+        # Each station's precomputed top-K hawker centres, nearest first; an interchange takes the nearest of its
+        # platforms for each hawker centre. Hawker centres not in hawker_names, when given, are left out, so that
+        # an index built from older hawker data does not point at centres that are gone.
+        if hawker_names is not None:
+            hawker_names = set(hawker_names)
+        self.station_hawkers = []
+        for node, rows in enumerate(node_rows):
+            nearest = {}
+            for row in rows:
+                for hawker_idx, dist in zip(mrt_index["hawker_idx"][row].tolist(),
+                                            mrt_index["distances"][row].tolist()):
+                    if hawker_names is not None and mrt_index["hawker_names"][hawker_idx] not in hawker_names:
+                        continue
+                    nearest[hawker_idx] = min(dist, nearest.get(hawker_idx, dist))
+            top_k = sorted((dist, hawker_idx, node) for hawker_idx, dist in nearest.items())
+            self.station_hawkers.append(top_k[:mrt_index["hawker_idx"].shape[1]])
+        self.station_hawker_distances = [[dist for dist, _, _ in top_k] for top_k in self.station_hawkers]
+
+    def __len__(self):
+        return len(self.names)
+
+    def connect(self, a: int, b: int):
+        km = float(ellipsoidal_distance_km(self.lats[a], self.longs[a], self.lats[b], self.longs[b]))
+        self.neighbours[a][b] = km
+        self.neighbours[b][a] = km
+
+    def find_station(self, text: str) -> Optional[int]:
+        # By code, then by name, then by the start of a name
+        text = " ".join(text.lower().split())
+        if text in self.nodes_by_code:
+            return self.nodes_by_code[text]
+        text = station_name(text.replace(" mrt station", ""))
+        for matches in (lambda name: name == text, lambda name: name.startswith(text), lambda name: text in name):
+            for node, name in enumerate(self.names):
+                if matches(name):
+                    return node
+        return None
+
+    def display_name(self, node: int) -> str:
+        return f"{self.names[node].title()} ({' / '.join(self.station_codes[node])})"
+
+    def route(self, start: int, end: int) -> Optional[List[int]]:
+        # Shortest along the lines, by the straight-line distance between consecutive stations
+        previous = {start: None}
+        dists = {start: 0.0}
+        heap = [(0.0, start)]
+        while heap:
+            dist, node = heapq.heappop(heap)
+            if node == end:
+                path = []
+                while node is not None:
+                    path.append(node)
+                    node = previous[node]
+                return path[::-1]
+            if dist > dists[node]:
+                continue
+            for neighbour, km in self.neighbours[node].items():
+                if dist + km < dists.get(neighbour, float("inf")):
+                    dists[neighbour] = dist + km
+                    previous[neighbour] = node
+                    heapq.heappush(heap, (dist + km, neighbour))
+        return None
+
+    def hawkers_near(self, stations: List[int], k: int, max_km: Optional[float] = None) -> List[RouteHawker]:
+        # Merges the stations' top-K lists, so the hawker centres come out nearest first, each at its nearest
+        # station, in O(stations * K) without going back to the distances of every pair. Hawker centres beyond a
+        # station's top K are not considered for it.
+        streams = []
+        for node in stations:
+            top_k = self.station_hawkers[node]
+            if max_km is not None:
+                top_k = top_k[:bisect_right(self.station_hawker_distances[node], max_km)]
+            streams.append(top_k)
+
+        results = []
+        seen = set()
+        for dist, hawker_idx, node in heapq.merge(*streams):
+            if hawker_idx in seen:
+                continue
+            seen.add(hawker_idx)
+            results.append(RouteHawker(hawker_idx, dist, node))
+            if len(results) >= k:
+                break
+        return results
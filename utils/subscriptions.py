@@ -0,0 +1,85 @@
+from heapq import merge
+from itertools import groupby
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import json
+import sqlite3
+import threading
+
+# Rows read at a time per hawker centre while going through its subscribers
+SUBSCRIBER_BATCH_SIZE = 1000
+
+
+class SubscriptionStore:
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            # Keyed by hawker centre, so the subscribers of one are a range of the primary key, in chat order
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS subscriptions "
+                "(hawker_name TEXT NOT NULL, chat_id INTEGER NOT NULL, PRIMARY KEY (hawker_name, chat_id)) "
+                "WITHOUT ROWID"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS subscriptions_by_chat ON subscriptions (chat_id)")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS alert_state (id INTEGER PRIMARY KEY, data TEXT NOT NULL)"
+            )
+
+    def subscribe(self, chat_id: int, hawker_names: Iterable[str]):
+        with self.lock, self.connection:
+            self.connection.executemany("INSERT OR IGNORE INTO subscriptions (hawker_name, chat_id) VALUES (?, ?)",
+                                        ((name, chat_id) for name in hawker_names))
+
+    def unsubscribe(self, chat_id: int, hawker_names: Optional[Iterable[str]] = None) -> int:
+        # From all hawker centres when none are given
+        with self.lock, self.connection:
+            if hawker_names is None:
+                return self.connection.execute("DELETE FROM subscriptions WHERE chat_id = ?", (chat_id,)).rowcount
+            return self.connection.executemany("DELETE FROM subscriptions WHERE hawker_name = ? AND chat_id = ?",
+                                               ((name, chat_id) for name in hawker_names)).rowcount
+
+    def subscriptions(self, chat_id: int) -> List[str]:
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT hawker_name FROM subscriptions WHERE chat_id = ? ORDER BY hawker_name", (chat_id,)
+            ).fetchall()
+        return [name for name, in rows]
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM subscriptions").fetchone()[0]
+
+    def hawker_subscribers(self, hawker_name: str, after_chat_id: Optional[int]) -> Iterator[Tuple[int, str]]:
+        # In batches, taking the lock for one batch at a time, so commands are not held up by a long fan-out
+        while True:
+            with self.lock:
+                rows = self.connection.execute(
+                    "SELECT chat_id, hawker_name FROM subscriptions WHERE hawker_name = ? AND chat_id > ? "
+                    "ORDER BY chat_id LIMIT ?",
+                    (hawker_name, after_chat_id if after_chat_id is not None else -2 ** 63, SUBSCRIBER_BATCH_SIZE)
+                ).fetchall()
+            yield from rows
+            if len(rows) < SUBSCRIBER_BATCH_SIZE:
+                return
+            after_chat_id = rows[-1][0]
+
+    def subscribers(self, hawker_names: Iterable[str],
+                    after_chat_id: Optional[int] = None) -> Iterator[Tuple[int, List[str]]]:
+        # Each chat subscribed to any of the hawker centres, with the ones it is subscribed to, in chat order. Only a
+        # batch of rows per hawker centre is in memory at a time.
+        rows = merge(*(self.hawker_subscribers(name, after_chat_id) for name in hawker_names))
+        for chat_id, chat_rows in groupby(rows, key=lambda row: row[0]):
+            yield chat_id, [name for _, name in chat_rows]
+
+    def alert_state(self) -> Optional[Dict]:
+        with self.lock:
+            row = self.connection.execute("SELECT data FROM alert_state WHERE id = 0").fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def save_alert_state(self, alert_state: Dict):
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO alert_state (id, data) VALUES (0, ?)",
+                                    (json.dumps(alert_state),))
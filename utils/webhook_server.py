@@ -0,0 +1,90 @@
+from typing import Callable, List, Optional
+import asyncio
+import hmac
+import json
+import logging
+import threading
+from tornado.httpserver import HTTPServer
+from tornado.ioloop import IOLoop
+import tornado.web
+
+SECRET_TOKEN_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+START_TIMEOUT = 10  # seconds
+
+
+class WebhookHandler(tornado.web.RequestHandler):
+    SUPPORTED_METHODS = ('POST',)
+
+    def initialize(self, secret_token: str, handle_updates: Callable[[List[dict]], Optional[dict]]):
+        self.secret_token = secret_token
+        self.handle_updates = handle_updates
+
+    async def post(self):
+        received_token = self.request.headers.get(SECRET_TOKEN_HEADER, '')
+        if not hmac.compare_digest(received_token.encode(), self.secret_token.encode()):
+            logging.warning(f"Rejected webhook request from {self.request.remote_ip} with a wrong secret token")
+            raise tornado.web.HTTPError(403)
+
+        try:
+            payload = json.loads(self.request.body)
+        except ValueError:
+            raise tornado.web.HTTPError(400)
+        # Telegram posts one update per request; relays may post a list of them at once
+        updates = payload if isinstance(payload, list) else [payload]
+
+        # Decoding and dispatching touch the bot's data, which must not hold up the event loop
+        reply = await IOLoop.current().run_in_executor(None, self.handle_updates, updates)
+        if reply is not None:
+            # Telegram carries out a method given in the response to the webhook request itself
+            self.set_header('Content-Type', 'application/json')
+            self.write(json.dumps(reply))
+
+    def log_exception(self, typ, value, tb):
+        logging.error(f"Failed to handle webhook request: {value}", exc_info=(typ, value, tb))
+
+
+class WebhookServer:
+    def __init__(self, listen: str, port: int, url_path: str, secret_token: str,
+                 handle_updates: Callable[[List[dict]], Optional[dict]]):
+        self.listen = listen
+        self.port = port
+        self.app = tornado.web.Application([
+            (url_path or '/', WebhookHandler, dict(secret_token=secret_token, handle_updates=handle_updates)),
+        ])
+        self.loop = None
+        self.error = None
+        self.started = threading.Event()
+        self.thread = threading.Thread(target=self.serve, name="webhook_server", daemon=True)
+
+    def serve(self):
+        try:
+            asyncio.set_event_loop(asyncio.new_event_loop())
+            self.loop = IOLoop.current()
+            server = HTTPServer(self.app)
+            server.listen(self.port, self.listen)
+        except Exception as e:
+            # E.g. the port is taken; start() raises it in the thread that is waiting
+            self.error = e
+            if self.loop is not None:
+                self.loop.close(all_fds=True)
+                self.loop = None
+            return
+        finally:
+            self.started.set()
+
+        logging.info(f"Webhook server listening on {self.listen}:{self.port}")
+        self.loop.start()
+        server.stop()
+        self.loop.close(all_fds=True)
+
+    def start(self, timeout=START_TIMEOUT):
+        self.thread.start()
+        if not self.started.wait(timeout):
+            raise TimeoutError(f"Webhook server did not start listening on {self.listen}:{self.port} in {timeout} s")
+        if self.error is not None:
+            raise self.error
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.add_callback(self.loop.stop)
+        self.thread.join()